@@ -0,0 +1,118 @@
+# Standard library imports
+import io
+import os
+import time
+import asyncio
+from urllib.parse import urlparse, parse_qs
+
+# Third-party imports
+import discord
+
+# Personal files
+from metrics import record_cache
+
+PICTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pictures")
+
+# Re-upload an asset when its signed CDN link expires within this many seconds
+URL_EXPIRY_MARGIN = 3600
+
+
+class Asset:
+    """An image kept in memory, plus the CDN URL of its copy in the storage channel once uploaded."""
+    __slots__ = ('name', 'data', 'url', 'expires_at')
+
+    def __init__(self, name, data):
+        self.name = name
+        self.data = data
+        self.url = None
+        self.expires_at = None
+
+    def set_url(self, url):
+        self.url = url
+        # Discord attachment links are signed; the `ex` query parameter is the expiry as a hex timestamp
+        expiry = parse_qs(urlparse(url).query).get('ex')
+        self.expires_at = int(expiry[0], 16) if expiry else None
+
+    @property
+    def url_valid(self):
+        if self.url is None:
+            return False
+        return self.expires_at is None or self.expires_at - URL_EXPIRY_MARGIN > time.time()
+
+    def to_file(self):
+        return discord.File(io.BytesIO(self.data), filename=self.name)
+
+
+class AssetRegistry:
+    """Embed thumbnails loaded from disk once, uploaded once to a storage channel and reused by URL.
+
+    Without a storage channel (or while its upload is unavailable) the in-memory bytes are attached instead.
+    """
+
+    def __init__(self, directory=PICTURES_DIR):
+        self.directory = directory
+        self.channel = None
+        self._assets = {}
+        self._loaded = False
+        self._upload_lock = asyncio.Lock()
+
+    def load(self):
+        """Read every image in the directory into memory."""
+        self._assets.clear()
+        if os.path.isdir(self.directory):
+            for filename in sorted(os.listdir(self.directory)):
+                if filename.lower().endswith('.png'):
+                    with open(os.path.join(self.directory, filename), 'rb') as f:
+                        self._assets[filename] = Asset(filename, f.read())
+        self._loaded = True
+        print(f"Loaded {len(self._assets)} assets from {self.directory}")
+
+    def get(self, name):
+        if not self._loaded:
+            self.load()
+        return self._assets.get(name)
+
+    async def upload(self, channel, names=None):
+        """Upload assets without a valid CDN URL to `channel` in as few messages as possible."""
+        if not self._loaded:
+            self.load()
+        self.channel = channel
+        async with self._upload_lock:
+            pending = [asset for name, asset in self._assets.items()
+                       if (names is None or name in names) and not asset.url_valid]
+            for i in range(0, len(pending), 10):  # Discord allows 10 attachments per message
+                batch = pending[i:i + 10]
+                try:
+                    message = await channel.send(files=[asset.to_file() for asset in batch])
+                except discord.HTTPException as e:
+                    # Stop trying on every response; thumbnails fall back to attachments
+                    print(f"Failed to upload assets to the storage channel, attaching them instead: {e}")
+                    self.channel = None
+                    return
+                urls = {attachment.filename: attachment.url for attachment in message.attachments}
+                for asset in batch:
+                    if asset.name in urls:
+                        asset.set_url(urls[asset.name])
+            if pending:
+                print(f"Uploaded {len(pending)} assets to #{channel}")
+
+    async def thumbnail(self, embed: discord.Embed, name):
+        """Set an asset as the embed thumbnail. Returns the files to send along with the embed."""
+        asset = self.get(name)
+        if asset is None:
+            print(f"Thumbnail file not found: {os.path.join(self.directory, name)}")
+            return []
+
+        if not asset.url_valid and self.channel is not None:
+            await self.upload(self.channel, [name])
+        record_cache('asset_url', asset.url_valid)
+
+        if asset.url_valid:
+            embed.set_thumbnail(url=asset.url)
+            return []
+
+        embed.set_thumbnail(url=f"attachment://{name}")
+        return [asset.to_file()]
+
+
+ASSETS = AssetRegistry()
@@ -0,0 +1,131 @@
+# Standard library imports
+import time
+import sqlite3
+import asyncio
+
+# Personal files
+from config import AUDIT_FLUSH_SECONDS, AUDIT_MAX_BATCH, AUDIT_MAX_BUFFER
+from repositories import get_storage, AuditRecord
+
+# Recorded moderation actions and how the audit log command shows them
+AUDIT_ACTIONS = {
+    'ban': "🔨 Ban",
+    'warning_add': "⚠️ Warning added",
+    'warning_remove': "🧹 Warning removed",
+    'watchlist_add': "🚨 Watchlist add",
+    'watchlist_remove': "✅ Watchlist remove",
+    'gw2id_verify': "🆔 GW2 ID verified",
+    'gw2id_update': "🆔 GW2 ID updated",
+    'gw2id_remove': "🆔 GW2 ID removed",
+    'application_remove': "📝 Application removed",
+}
+
+
+class AuditLog:
+    """Write-behind buffer for the `audit_log` table.
+
+    Recording an action only appends it to the server's in-memory buffer, so commands don't wait for a write.
+    A background task writes each server's buffer as one transaction (one commit for the whole batch) every
+    `flush_interval` seconds, or as soon as `max_batch` entries are waiting, in a worker thread so the commit doesn't
+    block the event loop. Entries recorded since the last flush are lost if the process is killed; `write()` runs
+    before the log is read, and the synchronous `flush()` on shutdown.
+    """
+
+    def __init__(self, flush_interval=AUDIT_FLUSH_SECONDS, max_batch=AUDIT_MAX_BATCH, max_buffer=AUDIT_MAX_BUFFER):
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.max_buffer = max_buffer
+        self.written = 0
+        self.commits = 0
+        self.dropped = 0
+        self._buffers = {}  # Guild ID -> entries not written yet, oldest first
+        self._wake = None
+        self._task = None
+        self._writing = asyncio.Lock()
+
+    def record(self, guild_id, actor_id, action, target_id=None, details=None):
+        buffer = self._buffers.setdefault(str(guild_id) if guild_id is not None else None, [])
+        buffer.append(AuditRecord(None, time.time(), actor_id, action, target_id, details))
+        if len(buffer) >= self.max_batch and self._wake is not None:
+            self._wake.set()
+
+    def pending(self):
+        return sum(len(buffer) for buffer in self._buffers.values())
+
+    def flush(self, guild_id=None):
+        """Write the buffered entries of one server (or all of them) now, blocking. Only for shutdown, once the event
+        loop is gone. Returns the number written."""
+        written = 0
+        for key, entries in self._take(guild_id):
+            try:
+                get_storage(key).audit.add_many(entries)
+            except sqlite3.Error as e:
+                self._keep(key, entries, e)
+                continue
+            written += self._written(entries)
+        return written
+
+    async def write(self, guild_id=None):
+        """Write the buffered entries of one server (or all of them) in a worker thread. Returns the number written
+        once they, and any batch already being written, are committed."""
+        written = 0
+        async with self._writing:
+            for key, entries in self._take(guild_id):
+                try:
+                    await asyncio.to_thread(get_storage(key).audit.add_many, entries)
+                except sqlite3.Error as e:
+                    self._keep(key, entries, e)
+                    continue
+                written += self._written(entries)
+        return written
+
+    def _take(self, guild_id):
+        for key in [str(guild_id)] if guild_id is not None else list(self._buffers):
+            entries = self._buffers.pop(key, None)
+            if entries:
+                yield key, entries
+
+    def _keep(self, key, entries, error):
+        # Keep them for the next flush, within the buffer limit
+        buffer = entries + self._buffers.get(key, [])
+        if len(buffer) > self.max_buffer:
+            self.dropped += len(buffer) - self.max_buffer
+            buffer = buffer[-self.max_buffer:]
+        self._buffers[key] = buffer
+        print(f"Failed to write {len(entries)} audit log entries of server {key}: {error}")
+
+    def _written(self, entries):
+        self.written += len(entries)
+        self.commits += 1
+        return len(entries)
+
+    def start(self):
+        if self._task is None:
+            self._wake = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.write()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            # Let a write in progress finish if stop() cancels the task; its final write waits for it
+            await asyncio.shield(self.write())
+
+
+# The process-wide audit log, started with the bot
+AUDIT_LOG = AuditLog()
+
+
+def audit(interaction, action, target_id=None, details=None):
+    """Record a moderation action taken through an interaction."""
+    AUDIT_LOG.record(interaction.guild_id, interaction.user.id, action, target_id, details)
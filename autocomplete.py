@@ -0,0 +1,170 @@
+# Standard library imports
+from bisect import bisect_left, insort
+
+# Third-party imports
+import discord
+from discord import app_commands
+
+# Personal files
+from guilds import has_guild_role
+from repositories import get_storage, add_user_listener, NO_GW2_ID
+
+# Discord accepts at most 25 choices with names of up to 100 characters
+MAX_CHOICES = 25
+MAX_CHOICE_NAME = 100
+
+
+class PrefixIndex:
+    """Sorted (key, item) pairs, so all keys starting with a prefix are one binary search away."""
+    __slots__ = ('_keys', '_item_keys')
+
+    def __init__(self):
+        self._keys = []
+        self._item_keys = {}
+
+    def __len__(self):
+        return len(self._item_keys)
+
+    def load(self, items):
+        """Replace the index with `items`, an iterable of (item, keys) pairs."""
+        self._item_keys = {item: {key.lower() for key in keys if key} for item, keys in items}
+        self._keys = sorted((key, item) for item, keys in self._item_keys.items() for key in keys)
+
+    def set(self, item, keys):
+        self.discard(item)
+        keys = {key.lower() for key in keys if key}
+        for key in keys:
+            insort(self._keys, (key, item))
+        self._item_keys[item] = keys
+
+    def discard(self, item):
+        for key in self._item_keys.pop(item, ()):
+            del self._keys[bisect_left(self._keys, (key, item))]
+
+    def search(self, prefix, limit):
+        """Up to `limit` distinct items with a key starting with `prefix` (case-insensitive), in key order."""
+        prefix = prefix.lower()
+        found = {}
+        for position in range(bisect_left(self._keys, (prefix,)), len(self._keys)):
+            key, item = self._keys[position]
+            if not key.startswith(prefix):
+                break
+            found[item] = None
+            if len(found) >= limit:
+                break
+        return list(found)
+
+
+def search_keys(text):
+    """The text itself plus every later word in it, so "Blue Fox" is found by "blu" and by "fox"."""
+    words = text.split()
+    return [text] + words[1:]
+
+
+class IdentifierIndex:
+    """Prefix index over the Discord IDs, GW2 IDs, alt GW2 IDs and member names of one server's users."""
+    __slots__ = ('prefixes', 'gw2_ids', 'names')
+
+    def __init__(self):
+        self.prefixes = PrefixIndex()
+        self.gw2_ids = {}  # Discord ID -> (GW2 ID, alt GW2 ID)
+        self.names = {}  # Discord ID -> (display name, username)
+
+    def load(self, users, members=()):
+        """Build the index from the `users` table records and the cached members."""
+        self.gw2_ids = {user.discord_id: (user.gw2_id, user.alt_gw2_id) for user in users}
+        self.names = {member.id: (member.display_name, member.name) for member in members}
+        discord_ids = self.gw2_ids.keys() | self.names.keys()
+        self.prefixes.load((discord_id, self._keys(discord_id)) for discord_id in discord_ids)
+
+    def _keys(self, discord_id):
+        keys = [str(discord_id)]
+        for gw2_id in self.gw2_ids.get(discord_id, ()):
+            if gw2_id not in NO_GW2_ID:
+                keys += search_keys(gw2_id)
+        for name in self.names.get(discord_id, ()):
+            keys += search_keys(name)
+        return keys
+
+    def _reindex(self, discord_id):
+        if discord_id in self.gw2_ids or discord_id in self.names:
+            self.prefixes.set(discord_id, self._keys(discord_id))
+        else:
+            self.prefixes.discard(discord_id)
+
+    def update_user(self, discord_id, user):
+        """Refresh a user's GW2 IDs after a write (`user` is None once their record is gone)."""
+        if user is None:
+            self.gw2_ids.pop(discord_id, None)
+        else:
+            self.gw2_ids[discord_id] = (user.gw2_id, user.alt_gw2_id)
+        self._reindex(discord_id)
+
+    def update_member(self, member: discord.Member):
+        self.names[member.id] = (member.display_name, member.name)
+        self._reindex(member.id)
+
+    def remove_member(self, discord_id):
+        """Drop a member who left, along with their GW2 IDs (the nightly sync deletes their record)."""
+        self.names.pop(discord_id, None)
+        self.gw2_ids.pop(discord_id, None)
+        self._reindex(discord_id)
+
+    def label(self, discord_id):
+        """Choice name: the member's display name followed by their GW2 IDs."""
+        name = self.names.get(discord_id, (str(discord_id),))[0]
+        gw2_ids = [gw2_id for gw2_id in self.gw2_ids.get(discord_id, ()) if gw2_id not in NO_GW2_ID]
+        if gw2_ids:
+            name += f" ({' / '.join(gw2_ids)})"
+        return name[:MAX_CHOICE_NAME]
+
+    def choices(self, current, limit=MAX_CHOICES):
+        """Autocomplete choices for what has been typed so far. The value is the Discord ID."""
+        return [app_commands.Choice(name=self.label(discord_id), value=str(discord_id))
+                for discord_id in self.prefixes.search(current.strip().lstrip('<@!'), limit)]
+
+
+# Index per server, loaded on the first autocomplete request and kept current after that
+_indexes = {}
+
+
+def get_identifier_index(guild: discord.Guild):
+    key = str(guild.id)
+    index = _indexes.get(key)
+    if index is None:
+        index = _indexes[key] = IdentifierIndex()
+        index.load(get_storage(guild.id).users.all(), guild.members)
+    return index
+
+
+def _user_changed(guild_id, discord_id):
+    index = _indexes.get(str(guild_id))
+    if index is not None:
+        index.update_user(discord_id, get_storage(guild_id).users.get(discord_id))
+
+
+def member_updated(member: discord.Member):
+    index = _indexes.get(str(member.guild.id))
+    if index is not None:
+        index.update_member(member)
+
+
+def member_removed(guild_id, discord_id):
+    index = _indexes.get(str(guild_id))
+    if index is not None:
+        index.remove_member(discord_id)
+
+
+add_user_listener(_user_changed)
+
+
+def identifier_autocomplete(*role_names):
+    """Autocomplete callback for a user identifier parameter, answered only for members with one of the roles.
+
+    Autocomplete requests skip the command's own checks, so the role check is repeated here.
+    """
+    @has_guild_role(*role_names)
+    async def autocomplete(interaction: discord.Interaction, current: str):
+        return get_identifier_index(interaction.guild).choices(current)
+
+    return autocomplete
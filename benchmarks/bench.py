@@ -0,0 +1,424 @@
+# Standard library imports
+import io
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+from contextlib import redirect_stdout
+from datetime import datetime
+
+# Personal files
+from benchmarks.environment import configure_environment, free_port, REPO_ROOT
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+
+
+def summarize(name, size, timings, **extra):
+    result = {
+        "benchmark": name,
+        "size": size,
+        "runs": len(timings),
+        "min_s": min(timings),
+        "median_s": statistics.median(timings),
+        "mean_s": statistics.fmean(timings),
+        "max_s": max(timings),
+    }
+    result.update(extra)
+    return result
+
+
+def populate_users(db_module, db_filename, size, linked_ratio=0.5, warnings_per_user=0.2):
+    """Give a share of the users GW2 IDs (some from the roster, some not) and a few warnings."""
+    from benchmarks.fakes import BASE_MEMBER_ID
+    from benchmarks.gw2_stub import gw2_name
+
+    rng = random.Random(size)
+    conn = db_module.connect(db_filename)
+    c = conn.cursor()
+    linked = int(size * linked_ratio)
+    c.executemany("UPDATE users SET gw2_id = ?, guild_status = 1, alt_gw2_id = ? WHERE discord_id = ?", [
+        (gw2_name(i), gw2_name(size + i) if i % 10 == 0 else '-', BASE_MEMBER_ID + i) for i in range(linked)
+    ])
+    c.executemany("UPDATE users SET birthday = ? WHERE discord_id = ?", [
+        (19900000 + rng.randint(1, 12) * 100 + rng.randint(1, 28), BASE_MEMBER_ID + i)
+        for i in range(0, size, 7)
+    ])
+    c.executemany("INSERT INTO warnings (discord_id, reason, date) VALUES (?, ?, ?)", [
+        (BASE_MEMBER_ID + rng.randrange(size), "No-show at a scheduled event", int(time.time()))
+        for _ in range(int(size * warnings_per_user))
+    ])
+    conn.commit()
+    conn.close()
+
+
+def remove_db(db_module, version):
+    filename = db_module.get_db_filename(version)
+    if os.path.exists(filename):
+        os.remove(filename)
+    return filename
+
+
+def bench_init_db(db_module, guild, size, repeat):
+    timings = []
+    for _ in range(repeat):
+        remove_db(db_module, 'init')
+        start = time.perf_counter()
+        with redirect_stdout(io.StringIO()):
+            db_module.init_db('init', guild.members)
+        timings.append(time.perf_counter() - start)
+    return summarize("init_db", size, timings)
+
+
+def bench_migrate_data(db_module, guild, size, repeat):
+    remove_db(db_module, 'old')
+    with redirect_stdout(io.StringIO()):
+        db_module.init_db('old', guild.members)
+    populate_users(db_module, db_module.get_db_filename('old'), size)
+
+    timings = []
+    for _ in range(repeat):
+        remove_db(db_module, 'new')
+        with redirect_stdout(io.StringIO()):
+            db_module.init_db('new', guild.members)
+            start = time.perf_counter()
+            db_module.migrate_data('old', 'new')
+        timings.append(time.perf_counter() - start)
+    return summarize("migrate_data", size, timings)
+
+
+def prepare_current_db(db_module, guild, size):
+    """Current database with 5% departed users and 5% members not yet in the table."""
+    from benchmarks.fakes import BASE_MEMBER_ID, FakeMember
+
+    members = guild.members
+    departed = [FakeMember(BASE_MEMBER_ID * 3 + i) for i in range(size // 20)]
+    remove_db(db_module, db_module.CURRENT_DB_VERSION)
+    with redirect_stdout(io.StringIO()):
+        db_module.init_db(db_module.CURRENT_DB_VERSION, members[:size - size // 20] + departed)
+    populate_users(db_module, db_module.get_db_filename(db_module.CURRENT_DB_VERSION), size)
+
+
+async def bench_update_database(db_module, guild, size, repeat):
+    from benchmarks.fakes import FakeBot
+
+    bot = FakeBot([guild])
+    timings = []
+    for _ in range(repeat):
+        prepare_current_db(db_module, guild, size)
+        start = time.perf_counter()
+        with redirect_stdout(io.StringIO()):
+            await db_module.update_database(bot)
+        timings.append(time.perf_counter() - start)
+    return summarize("update_database", size, timings)
+
+
+async def bench_update_database_warm(db_module, guild, size, repeat):
+    """Nightly syncs after the first one, which loads the users projection they diff against."""
+    from benchmarks.fakes import FakeBot
+
+    bot = FakeBot([guild])
+    prepare_current_db(db_module, guild, size)
+    with redirect_stdout(io.StringIO()):
+        await db_module.update_database(bot)
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with redirect_stdout(io.StringIO()):
+            await db_module.update_database(bot)
+        timings.append(time.perf_counter() - start)
+    return summarize("update_database_warm", size, timings)
+
+
+def fill_memory_storage(db_module, repositories_module, storage):
+    """Copy the users of the SQLite database into an in-memory storage."""
+    conn = db_module.connect()
+    for row in conn.execute("SELECT * FROM users"):
+        storage.users.put(repositories_module.UserRecord(*row))
+    conn.close()
+
+
+def load_storage(db_module, repositories_module, size, backend):
+    """The synthetic server's repositories on `backend`; the in-memory one is filled from the SQLite database."""
+    prepare_current_db(db_module, SYNTHETIC_GUILDS[size], size)
+    if backend == "memory":
+        storage = repositories_module.InMemoryStorage()
+        fill_memory_storage(db_module, repositories_module, storage)
+        return storage
+    return repositories_module.SqliteStorage()
+
+
+def bench_crosscheck(db_module, repositories_module, roster, size, repeat, backend="sqlite"):
+    storage = load_storage(db_module, repositories_module, size, backend)
+    storage.roster.replace(roster)
+    timings = []
+    unlinked = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        unlinked = storage.roster.count_unlinked()
+        storage.roster.find_unlinked(10, 0)
+        timings.append(time.perf_counter() - start)
+    name = "crosscheck_diff" if backend == "sqlite" else f"crosscheck_diff_{backend}"
+    return summarize(name, size, timings, unlinked=unlinked)
+
+
+def bench_ban_list(classes_module, size, repeat):
+    from benchmarks.fakes import make_ban_entries
+
+    ban_count = max(1, size // 10)
+    guild_bans = make_ban_entries(ban_count)
+    db_bans = {
+        entry.user.id: (entry.user.id, entry.reason, int(datetime(2024, 1, 1 + i % 28).timestamp()))
+        for i, entry in enumerate(guild_bans[:ban_count * 9 // 10])
+    }
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        classes_module.build_ban_list(guild_bans, db_bans)
+        timings.append(time.perf_counter() - start)
+    return summarize("ban_list_build", size, timings, bans=ban_count)
+
+
+def bench_identifier_resolution(db_module, repositories_module, size, repeat, lookups=1000, backend="sqlite"):
+    from benchmarks.fakes import BASE_MEMBER_ID
+    from benchmarks.gw2_stub import gw2_name
+
+    storage = load_storage(db_module, repositories_module, size, backend)
+    rng = random.Random(size)
+    identifiers = []
+    for i in range(lookups):
+        index = rng.randrange(size // 2)
+        identifiers.append([
+            f"<@{BASE_MEMBER_ID + index}>",
+            str(BASE_MEMBER_ID + index),
+            gw2_name(index),
+            gw2_name(size + index - index % 10),
+            "Nobody.0000",
+        ][i % 5])
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for identifier in identifiers:
+            storage.users.find(identifier)
+        timings.append(time.perf_counter() - start)
+    name = "identifier_resolution" if backend == "sqlite" else f"identifier_resolution_{backend}"
+    return summarize(name, size, timings, lookups=lookups,
+                     mean_lookup_ms=statistics.fmean(timings) / lookups * 1000)
+
+
+SEARCH_REASONS = ["No-show at a scheduled raid", "Left the strike mission early", "Toxic behaviour in map chat",
+                  "Spamming in #general", "No-show at WvW guild night", "Ignored the commander in fractals",
+                  "Late to the meta event again"]
+SEARCH_QUERIES = ["no-show", "wvw", "fract*", "toxic chat", "nothing-matches"]
+
+
+def bench_search(db_module, repositories_module, size, repeat, history_per_user=5):
+    """Count plus first result page of /search over a long moderation history."""
+    from benchmarks.fakes import BASE_MEMBER_ID
+
+    prepare_current_db(db_module, SYNTHETIC_GUILDS[size], size)
+    rng = random.Random(size)
+    conn = db_module.connect()
+    conn.executemany("INSERT INTO warnings (discord_id, reason, date) VALUES (?, ?, ?)", [
+        (BASE_MEMBER_ID + rng.randrange(size), f"{rng.choice(SEARCH_REASONS)} ({i})", int(time.time()))
+        for i in range(size * history_per_user)
+    ])
+    conn.commit()
+    conn.close()
+
+    search = repositories_module.SqliteStorage().search
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for query in SEARCH_QUERIES:
+            search.count(query)
+            search.search(query, limit=10)
+        timings.append(time.perf_counter() - start)
+    return summarize("search", size, timings, queries=len(SEARCH_QUERIES), history=size * history_per_user,
+                     mean_query_ms=statistics.fmean(timings) / len(SEARCH_QUERIES) * 1000)
+
+
+def bench_fuzzy_suggest(fuzzy_module, roster, size, repeat, lookups=200):
+    """"Did you mean" suggestions for mistyped GW2 IDs (the synthetic names are near-duplicates: a worst case)."""
+    rng = random.Random(size)
+    queries = []
+    for i in range(lookups):
+        name = rng.choice(roster)['name']
+        queries.append([name[:-1] + '0', name.split('.')[0], name[:2] + name[3:], name.lower()][i % 4])
+
+    fuzzy_module.get_roster_index("bench", roster)
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for query in queries:
+            fuzzy_module.suggest_gw2_ids("bench", roster, query)
+        timings.append(time.perf_counter() - start)
+    return summarize("fuzzy_suggest", size, timings, lookups=lookups,
+                     mean_lookup_ms=statistics.fmean(timings) / lookups * 1000)
+
+
+def bench_autocomplete(db_module, repositories_module, autocomplete_module, guild, size, repeat, keystrokes=1000):
+    """Identifier autocomplete: one lookup per keystroke while typing GW2 IDs and Discord IDs."""
+    from benchmarks.fakes import BASE_MEMBER_ID
+    from benchmarks.gw2_stub import gw2_name
+
+    storage = load_storage(db_module, repositories_module, size, "sqlite")
+    start = time.perf_counter()
+    index = autocomplete_module.IdentifierIndex()
+    index.load(storage.users.all(), guild.members)
+    load_s = time.perf_counter() - start
+
+    rng = random.Random(size)
+    prefixes = []
+    while len(prefixes) < keystrokes:
+        typed = rng.choice([gw2_name(rng.randrange(size)), str(BASE_MEMBER_ID + rng.randrange(size))])
+        prefixes += [typed[:length] for length in range(1, 7)]
+    prefixes = prefixes[:keystrokes]
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for prefix in prefixes:
+            index.choices(prefix)
+        timings.append(time.perf_counter() - start)
+    return summarize("autocomplete", size, timings, keystrokes=keystrokes, load_ms=load_s * 1000,
+                     mean_keystroke_ms=statistics.fmean(timings) / keystrokes * 1000)
+
+
+async def bench_roster_fetch(gw2_module, stub, size, repeat):
+    import aiohttp
+
+    stub.set_roster(ROSTERS[size])
+    timings = []
+    async with aiohttp.ClientSession() as session:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            await gw2_module.fetch_guild_roster(session)
+            timings.append(time.perf_counter() - start)
+    return summarize("gw2_roster_fetch", size, timings, latency_s=stub.latency)
+
+
+SYNTHETIC_GUILDS = {}
+ROSTERS = {}
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args):
+    from benchmarks.gw2_stub import GW2APIStub, make_roster
+    from benchmarks.fakes import FakeGuild
+
+    stub = GW2APIStub(latency=args.latency)
+    stub.start_in_thread(args.port)
+
+    # Bot modules read their configuration at import time, after configure_environment()
+    import db
+    import gw2
+    import classes
+    import repositories
+    import fuzzy
+    import autocomplete
+    from config import ROLE_ID_BIRTHDAY, CHANNEL_ID_GENERAL
+
+    results = []
+    for size in args.sizes:
+        print(f"Benchmarking {size} members...", file=sys.stderr)
+        guild = SYNTHETIC_GUILDS[size] = FakeGuild(size, role_ids=[ROLE_ID_BIRTHDAY],
+                                                   channel_ids=[CHANNEL_ID_GENERAL])
+        ROSTERS[size] = make_roster(size)
+        stub.set_roster(ROSTERS[size])
+
+        selected = set(args.only or BENCHMARKS)
+        if "init_db" in selected:
+            results.append(bench_init_db(db, guild, size, args.repeat))
+        if "migrate_data" in selected:
+            results.append(bench_migrate_data(db, guild, size, args.repeat))
+        if "update_database" in selected:
+            results.append(await bench_update_database(db, guild, size, args.repeat))
+        if "update_database_warm" in selected:
+            results.append(await bench_update_database_warm(db, guild, size, args.repeat))
+        if "crosscheck_diff" in selected:
+            results.append(bench_crosscheck(db, repositories, ROSTERS[size], size, args.repeat))
+        if "crosscheck_diff_memory" in selected:
+            results.append(bench_crosscheck(db, repositories, ROSTERS[size], size, args.repeat, backend="memory"))
+        if "ban_list_build" in selected:
+            results.append(bench_ban_list(classes, size, args.repeat))
+        if "identifier_resolution" in selected:
+            results.append(bench_identifier_resolution(db, repositories, size, args.repeat))
+        if "identifier_resolution_memory" in selected:
+            results.append(bench_identifier_resolution(db, repositories, size, args.repeat, backend="memory"))
+        if "search" in selected:
+            results.append(bench_search(db, repositories, size, args.repeat))
+        if "fuzzy_suggest" in selected:
+            results.append(bench_fuzzy_suggest(fuzzy, ROSTERS[size], size, args.repeat))
+        if "autocomplete" in selected:
+            results.append(bench_autocomplete(db, repositories, autocomplete, guild, size, args.repeat))
+        if "gw2_roster_fetch" in selected:
+            results.append(await bench_roster_fetch(gw2, stub, size, args.repeat))
+
+        for result in results:
+            if result["size"] == size:
+                print(f"  {result['benchmark']:<24} median {result['median_s'] * 1000:10.2f} ms", file=sys.stderr)
+
+    return results
+
+
+BENCHMARKS = ["init_db", "migrate_data", "update_database", "update_database_warm", "crosscheck_diff",
+              "crosscheck_diff_memory", "ban_list_build", "identifier_resolution", "identifier_resolution_memory",
+              "search", "fuzzy_suggest", "autocomplete", "gw2_roster_fetch"]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Offline benchmarks for scrubbot against a synthetic guild and a local GW2 API stand-in. "
+                    "Run from the repository root: python -m benchmarks.bench --output results.json")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help="Guild/roster sizes")
+    parser.add_argument('--repeat', type=int, default=3, help="Runs per benchmark")
+    parser.add_argument('--latency', type=float, default=0.0, help="GW2 API stand-in latency in seconds")
+    parser.add_argument('--only', nargs='+', choices=BENCHMARKS, help="Run only these benchmarks")
+    parser.add_argument('--output', help="Write the JSON results to this file instead of stdout")
+    args = parser.parse_args()
+    args.port = free_port()
+
+    configure_environment(args.port)
+    output = os.path.abspath(args.output) if args.output else None
+
+    with tempfile.TemporaryDirectory(prefix='scrubbot-bench-') as workdir:
+        os.chdir(workdir)  # Database files are created relative to the working directory
+        results = asyncio.run(run(args))
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "sqlite": __import__('sqlite3').sqlite_version,
+            "platform": platform.platform(),
+            "repeat": args.repeat,
+            "gw2_latency_s": args.latency,
+        },
+        "results": results,
+    }
+    if output:
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == '__main__':
+    main()
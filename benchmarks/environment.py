@@ -0,0 +1,40 @@
+# Standard library imports
+import os
+import sys
+import socket
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Placeholder configuration so config.py can be imported without a .env file
+BENCHMARK_ENV = {
+    'BOT_TOKEN': 'benchmark',
+    'USER_API_KEY': 'benchmark',
+    'GUILD_ID': 'BENCHMARK-GUILD',
+    'DISCORD_SERVER_ID': '1',
+    'ROLE_ID_CONFIRMATION': '101',
+    'ROLE_ID_GUEST': '102',
+    'ROLE_ID_MEMBER': '103',
+    'ROLE_ID_FAMED_MEMBER': '104',
+    'ROLE_ID_STAFF': '105',
+    'ROLE_ID_ADMIN': '106',
+    'ROLE_ID_BIRTHDAY': '107',
+    'CHANNEL_ID_MENTORS': '201',
+    'CHANNEL_ID_GENERAL': '202',
+    'CHANNEL_ID_RULES': '203',
+    'CURRENT_DB_VERSION': 'bench',
+}
+
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def configure_environment(gw2_port):
+    """Point the bot at the local GW2 API stand-in. Must run before any bot module is imported."""
+    for key, value in BENCHMARK_ENV.items():
+        os.environ.setdefault(key, value)
+    os.environ['GW2_API_URL'] = f"http://127.0.0.1:{gw2_port}"
+    if REPO_ROOT not in sys.path:
+        sys.path.insert(0, REPO_ROOT)
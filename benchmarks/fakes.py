@@ -0,0 +1,201 @@
+# Standard library imports
+import asyncio
+import itertools
+from types import SimpleNamespace
+
+BASE_MEMBER_ID = 10 ** 17
+
+
+class FakeRole:
+    def __init__(self, role_id, name=None):
+        self.id = role_id
+        self.name = name or f"role-{role_id}"
+        self.mention = f"<@&{role_id}>"
+
+    def __eq__(self, other):
+        return getattr(other, 'id', None) == self.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+
+class FakeUser:
+    def __init__(self, user_id, name=None, rest_latency=0.0):
+        self.id = user_id
+        self.name = name or f"user{user_id}"
+        self.display_name = self.name
+        self.mention = f"<@{user_id}>"
+        self.display_avatar = SimpleNamespace(url=f"https://cdn.example/avatars/{user_id}.png")
+        self.rest_latency = rest_latency
+        self.sent = []
+
+    async def send(self, content=None, **kwargs):
+        await asyncio.sleep(self.rest_latency)
+        self.sent.append(content)
+
+
+class FakeMember(FakeUser):
+    def __init__(self, member_id, guild=None, roles=(), rest_latency=0.0):
+        super().__init__(member_id, rest_latency=rest_latency)
+        self.guild = guild
+        self.roles = list(roles)
+        self.color = 0
+        self.guild_permissions = SimpleNamespace(administrator=False, manage_guild=False, ban_members=False,
+                                                 kick_members=False)
+
+    async def add_roles(self, *roles, reason=None):
+        await asyncio.sleep(self.rest_latency)
+        self.roles.extend(role for role in roles if role not in self.roles)
+
+    async def remove_roles(self, *roles, reason=None):
+        await asyncio.sleep(self.rest_latency)
+        self.roles = [role for role in self.roles if role not in roles]
+
+
+class FakeChannel:
+    def __init__(self, channel_id, rest_latency=0.0):
+        self.id = channel_id
+        self.rest_latency = rest_latency
+        self.sent = []
+
+    async def send(self, content=None, **kwargs):
+        await asyncio.sleep(self.rest_latency)
+        self.sent.append(content)
+
+
+class FakeGuild:
+    """A fully chunked guild holding synthetic members, roles and channels."""
+
+    def __init__(self, member_count, role_ids=(), channel_ids=(), rest_latency=0.0, guild_id=1):
+        self.id = guild_id
+        self.name = f"guild-{guild_id}"
+        self.rest_latency = rest_latency
+        self.chunked = True
+        self.owner_id = BASE_MEMBER_ID
+        self.icon = None
+        self._roles = {role_id: FakeRole(role_id) for role_id in role_ids}
+        self.default_role = FakeRole(guild_id, "@everyone")
+        self._channels = {channel_id: FakeChannel(channel_id, rest_latency) for channel_id in channel_ids}
+        self._members = {}
+        for i in range(member_count):
+            self.add_member(BASE_MEMBER_ID + i)
+        self.bans_list = []
+
+    def add_member(self, member_id, roles=()):
+        member = FakeMember(member_id, self, roles, self.rest_latency)
+        self._members[member_id] = member
+        return member
+
+    @property
+    def members(self):
+        return list(self._members.values())
+
+    @property
+    def roles(self):
+        return list(self._roles.values())
+
+    def get_member(self, member_id):
+        return self._members.get(member_id)
+
+    async def fetch_member(self, member_id):
+        await asyncio.sleep(self.rest_latency)
+        return self._members.get(member_id)
+
+    async def chunk(self, cache=True):
+        return self.members
+
+    def get_role(self, role_id):
+        return self._roles.get(role_id)
+
+    def get_channel(self, channel_id):
+        return self._channels.get(channel_id)
+
+    async def bans(self):
+        for entry in self.bans_list:
+            yield entry
+
+
+class FakeBot:
+    def __init__(self, guilds, rest_latency=0.0):
+        self.guilds = guilds
+        self.rest_latency = rest_latency
+
+    def get_channel(self, channel_id):
+        for guild in self.guilds:
+            channel = guild.get_channel(channel_id)
+            if channel:
+                return channel
+        return None
+
+    def get_guild(self, guild_id):
+        return next((guild for guild in self.guilds if guild.id == guild_id), None)
+
+    def get_cog(self, name):
+        return None
+
+    def get_user(self, user_id):
+        # No user cache, every lookup goes through fetch_user
+        return None
+
+    async def fetch_user(self, user_id):
+        await asyncio.sleep(self.rest_latency)
+        return FakeUser(user_id)
+
+
+def make_ban_entries(count, start_id=BASE_MEMBER_ID * 2):
+    return [SimpleNamespace(user=FakeUser(start_id + i), reason=f"Ban reason {i}") for i in range(count)]
+
+
+class FakeInteractionResponse:
+    def __init__(self, interaction):
+        self._interaction = interaction
+        self._done = False
+
+    def is_done(self):
+        return self._done
+
+    async def _respond(self, content=None, **kwargs):
+        if self._done:
+            raise RuntimeError("This interaction has already been responded to")
+        await asyncio.sleep(self._interaction.rest_latency)
+        self._done = True
+        self._interaction.messages.append(content)
+
+    async def defer(self, **kwargs):
+        await self._respond()
+
+    async def send_message(self, content=None, **kwargs):
+        await self._respond(content)
+
+    async def send_modal(self, modal):
+        await self._respond()
+
+    async def edit_message(self, **kwargs):
+        await self._respond()
+
+
+class FakeFollowup:
+    def __init__(self, interaction):
+        self._interaction = interaction
+
+    async def send(self, content=None, **kwargs):
+        await asyncio.sleep(self._interaction.rest_latency)
+        self._interaction.messages.append(content)
+
+
+class FakeInteraction:
+    """Just enough of discord.Interaction to drive the cog callbacks. Every reply is kept in `messages`."""
+    _ids = itertools.count(BASE_MEMBER_ID * 8)
+
+    def __init__(self, client, guild, user, rest_latency=0.0):
+        self.id = next(self._ids)
+        self.client = client
+        self.guild = guild
+        self.guild_id = guild.id
+        self.user = user
+        self.channel = guild.get_channel(next(iter(guild._channels), None))
+        self.rest_latency = rest_latency
+        self.extras = {}
+        self.messages = []
+        self.response = FakeInteractionResponse(self)
+        self.followup = FakeFollowup(self)
@@ -0,0 +1,77 @@
+# Standard library imports
+import json
+import asyncio
+import threading
+from datetime import datetime, timedelta
+
+# Third-party imports
+from aiohttp import web
+
+RANKS = ["Leader", "Officer", "Member", "Member", "Member", "Legacy Member"]
+
+
+def gw2_name(i):
+    return f"Player{i}.{1000 + i % 9000}"
+
+
+def make_roster(size):
+    """Synthetic /v2/guild/{id}/members response with `size` entries."""
+    start = datetime(2020, 1, 1)
+    return [
+        {
+            "name": gw2_name(i),
+            "rank": RANKS[i % len(RANKS)],
+            "joined": (start + timedelta(minutes=i)).strftime("%Y-%m-%dT%H:%M:%S.000Z"),
+        }
+        for i in range(size)
+    ]
+
+
+class GW2APIStub:
+    """Local stand-in for the GW2 guild members endpoint with a configurable roster, latency and status."""
+
+    def __init__(self, roster_size=1000, latency=0.0, status=200):
+        self.latency = latency
+        self.status = status
+        self.requests = 0
+        self.set_roster(make_roster(roster_size))
+        self._runner = None
+
+    def set_roster(self, roster):
+        self.roster = roster
+        self._body = json.dumps(roster).encode()
+
+    async def handle_members(self, request):
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.status != 200:
+            return web.json_response({"text": "stub error"}, status=self.status)
+        return web.Response(body=self._body, content_type='application/json')
+
+    async def start(self, port, host='127.0.0.1'):
+        app = web.Application()
+        app.router.add_get('/v2/guild/{guild_id}/members', self.handle_members)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+    def start_in_thread(self, port, host='127.0.0.1'):
+        """Serve from a background thread, so blocking requests.get calls on the bot's loop can reach it."""
+        loop = asyncio.new_event_loop()
+        started = threading.Event()
+
+        def run():
+            asyncio.set_event_loop(loop)
+            loop.run_until_complete(self.start(port, host))
+            started.set()
+            loop.run_forever()
+
+        thread = threading.Thread(target=run, name='gw2-api-stub', daemon=True)
+        thread.start()
+        started.wait()
+        return thread
@@ -0,0 +1,324 @@
+# Standard library imports
+import io
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import sqlite3
+import tempfile
+from contextlib import redirect_stdout
+from datetime import datetime
+
+# Personal files
+from benchmarks.environment import configure_environment, free_port
+
+DEFAULT_MIX = "verify=3,whois=5,warning=1,watchlist=1,crosscheck=1"
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(pct / 100 * len(values)) - 1))
+    return values[index]
+
+
+def latency_summary(latencies):
+    return {
+        "count": len(latencies),
+        "p50_ms": percentile(latencies, 50) * 1000 if latencies else None,
+        "p99_ms": percentile(latencies, 99) * 1000 if latencies else None,
+        "max_ms": max(latencies) * 1000 if latencies else None,
+    }
+
+
+def parse_mix(mix):
+    weights = {}
+    for part in mix.split(','):
+        name, _, weight = part.partition('=')
+        weights[name.strip()] = float(weight or 1)
+    unknown = set(weights) - set(WORKLOADS)
+    if unknown:
+        raise SystemExit(f"Unknown workloads: {', '.join(sorted(unknown))}. Choose from {', '.join(WORKLOADS)}")
+    return weights
+
+
+class LoadTest:
+    """Drives the real cog callbacks with fake interactions and records what happens."""
+
+    def __init__(self, args, guild, bot, cogs, roster):
+        self.args = args
+        self.guild = guild
+        self.bot = bot
+        self.cogs = cogs
+        self.roster = roster
+        self.rng = random.Random(args.seed)
+        self.latencies = {name: [] for name in WORKLOADS}
+        self.errors = {name: 0 for name in WORKLOADS}
+        self.lock_errors = 0
+        self.loop_lag = []
+        self.next_new_member = 0
+
+    def interaction(self, user):
+        from benchmarks.fakes import FakeInteraction
+        return FakeInteraction(self.bot, self.guild, user, self.args.rest_latency)
+
+    def staff_member(self):
+        from config import ROLE_ID_STAFF
+        return self.guild.get_member(self.guild.owner_id) or self.guild.add_member(
+            self.guild.owner_id, [self.guild.get_role(ROLE_ID_STAFF)])
+
+    def random_member(self):
+        from benchmarks.fakes import BASE_MEMBER_ID
+        return self.guild.get_member(BASE_MEMBER_ID + self.rng.randrange(self.args.members // 2))
+
+    # -------------- Workloads ----------------
+    async def run_verify(self):
+        from config import ROLE_ID_CONFIRMATION
+        from benchmarks.fakes import BASE_MEMBER_ID
+
+        # A newcomer verifies with a roster name nobody has linked yet (GW2IDModal.on_submit)
+        index = self.args.members + self.next_new_member
+        self.next_new_member += 1
+        member = self.guild.add_member(BASE_MEMBER_ID * 4 + index, [self.guild.get_role(ROLE_ID_CONFIRMATION)])
+        interaction = self.interaction(member)
+        await interaction.response.defer(ephemeral=True)
+        gw2_id = self.roster[(self.args.members // 2 + index) % len(self.roster)]['name']
+        await self.cogs['ConfirmationCog'].process_verification(interaction, gw2_id)
+        return interaction
+
+    async def run_whois(self):
+        from benchmarks.fakes import BASE_MEMBER_ID
+        from benchmarks.gw2_stub import gw2_name
+
+        index = self.rng.randrange(self.args.members // 2)
+        identifier = self.rng.choice([f"<@{BASE_MEMBER_ID + index}>", gw2_name(index)])
+        interaction = self.interaction(self.staff_member())
+        cog = self.cogs['MemberCog']
+        await cog.whois.callback(cog, interaction, identifier)
+        return interaction
+
+    async def run_warning(self):
+        interaction = self.interaction(self.staff_member())
+        cog = self.cogs['StaffCog']
+        await cog.warning.callback(cog, interaction, "add", str(self.random_member().id),
+                                   "No-show at a scheduled event")
+        return interaction
+
+    async def run_warning_bulk(self):
+        # Staff warn the no-shows of a big raid in one go
+        interaction = self.interaction(self.staff_member())
+        cog = self.cogs['StaffCog']
+        identifiers = " ".join(f"<@{self.random_member().id}>" for _ in range(30))
+        await cog.warning_bulk.callback(cog, interaction, identifiers, "No-show at a scheduled raid")
+        return interaction
+
+    async def run_watchlist(self):
+        interaction = self.interaction(self.staff_member())
+        cog = self.cogs['StaffCog']
+        await cog.watchlist.callback(cog, interaction, "remove", str(self.random_member().id))
+        return interaction
+
+    async def run_crosscheck(self):
+        interaction = self.interaction(self.staff_member())
+        cog = self.cogs['StaffCog']
+        await cog.crosscheck.callback(cog, interaction)
+        return interaction
+
+    # -------------- Driver ----------------
+    async def execute(self, name):
+        start = time.perf_counter()
+        try:
+            interaction = await getattr(self, f"run_{name}")()
+        except sqlite3.OperationalError as e:
+            self.errors[name] += 1
+            if 'locked' in str(e):
+                self.lock_errors += 1
+            return
+        except Exception as e:
+            self.errors[name] += 1
+            print(f"{name} failed: {e!r}", file=sys.stderr)
+            return
+        self.latencies[name].append(time.perf_counter() - start)
+
+        # The cogs report database errors to the user instead of raising
+        for message in interaction.messages:
+            if message and 'database is locked' in str(message):
+                self.lock_errors += 1
+            if message and ('error occurred' in str(message) or 'Failed to' in str(message)):
+                self.errors[name] += 1
+
+    async def sample_loop_lag(self, interval=0.01):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(interval)
+            self.loop_lag.append(max(0.0, loop.time() - start - interval))
+
+    async def nightly_update(self):
+        import db
+        await asyncio.sleep(self.args.nightly_delay)
+        start = time.perf_counter()
+        with redirect_stdout(io.StringIO()):
+            await db.update_database(self.bot)
+        return time.perf_counter() - start
+
+    async def run(self, weights):
+        names, cumulative = list(weights), list(weights.values())
+        sampler = asyncio.create_task(self.sample_loop_lag())
+        nightly = asyncio.create_task(self.nightly_update()) if self.args.nightly else None
+
+        tasks = []
+        start = time.perf_counter()
+        interval = 1 / self.args.rate
+        # Open-loop arrivals: requests keep coming at the configured rate even if the bot falls behind
+        for i in range(int(self.args.rate * self.args.duration)):
+            delay = start + i * interval - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            name = self.rng.choices(names, weights=cumulative)[0]
+            tasks.append(asyncio.create_task(self.execute(name)))
+
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - start
+        nightly_duration = await nightly if nightly else None
+        sampler.cancel()
+
+        completed = sum(len(values) for values in self.latencies.values())
+        return {
+            "elapsed_s": elapsed,
+            "requests": len(tasks),
+            "completed": completed,
+            "throughput_rps": completed / elapsed if elapsed else 0.0,
+            "overall": latency_summary([value for values in self.latencies.values() for value in values]),
+            "workloads": {
+                name: dict(latency_summary(self.latencies[name]), errors=self.errors[name])
+                for name in weights
+            },
+            "database_locked_errors": self.lock_errors,
+            "event_loop_lag": {
+                "p50_ms": percentile(self.loop_lag, 50) * 1000 if self.loop_lag else None,
+                "p99_ms": percentile(self.loop_lag, 99) * 1000 if self.loop_lag else None,
+                "max_ms": max(self.loop_lag) * 1000 if self.loop_lag else None,
+            },
+            "nightly_update_s": nightly_duration,
+        }
+
+
+async def main_async(args, weights):
+    from benchmarks.gw2_stub import GW2APIStub
+    from benchmarks.fakes import FakeGuild, FakeBot
+    from benchmarks.bench import prepare_current_db, fill_memory_storage
+
+    stub = GW2APIStub(roster_size=args.members * 2, latency=args.gw2_latency)
+    stub.start_in_thread(args.port)
+
+    # Bot modules read their configuration at import time, after configure_environment()
+    import db
+    import classes
+    import repositories
+    from outbox import OutboxWorker
+    from audit import AUDIT_LOG
+    from config import (ROLE_ID_BIRTHDAY, ROLE_ID_CONFIRMATION, ROLE_ID_MEMBER, ROLE_ID_STAFF, ROLE_ID_GUEST,
+                        ROLE_ID_FAMED_MEMBER, CHANNEL_ID_MENTORS, CHANNEL_ID_GENERAL)
+
+    guild = FakeGuild(args.members, rest_latency=args.rest_latency,
+                      role_ids=[ROLE_ID_BIRTHDAY, ROLE_ID_CONFIRMATION, ROLE_ID_MEMBER, ROLE_ID_STAFF, ROLE_ID_GUEST,
+                                ROLE_ID_FAMED_MEMBER],
+                      channel_ids=[CHANNEL_ID_MENTORS, CHANNEL_ID_GENERAL])
+    bot = FakeBot([guild], rest_latency=args.rest_latency)
+    prepare_current_db(db, guild, args.members)
+    if args.storage == 'memory':
+        # Commands run without disk I/O; the nightly update still works on the SQLite database
+        repositories.set_storage_backend('memory')
+        fill_memory_storage(db, repositories, repositories.get_storage(guild.id))
+
+    cogs = {cls.__name__: cls(bot) for cls in (classes.ConfirmationCog, classes.MemberCog, classes.StaffCog)}
+    outbox = OutboxWorker(bot)
+    outbox.start()
+    AUDIT_LOG.start()
+    watchdog = None
+    if args.watchdog:
+        from loop_watchdog import LoopWatchdog
+        watchdog = LoopWatchdog(args.watchdog)
+        watchdog.start()
+
+    with redirect_stdout(sys.stderr):
+        results = await LoadTest(args, guild, bot, cogs, stub.roster).run(weights)
+        # DMs, role edits and mentors posts queued by the commands
+        start = time.perf_counter()
+        await outbox.drain(timeout=60)
+        await outbox.stop()
+        results["outbox"] = {"delivered": outbox.delivered, "failed": outbox.failed,
+                             "pending": repositories.get_storage(guild.id).outbox.pending_count(),
+                             "drain_s": time.perf_counter() - start}
+        # Moderation actions recorded by the commands, and the commits they took
+        await AUDIT_LOG.stop()
+        results["audit"] = {"written": AUDIT_LOG.written, "commits": AUDIT_LOG.commits,
+                            "dropped": AUDIT_LOG.dropped}
+
+    if watchdog:
+        watchdog.stop()
+        results["blocking_sites"] = [entry.as_dict() for entry in watchdog.report()]
+    return results
+
+
+WORKLOADS = ["verify", "whois", "warning", "warning_bulk", "watchlist", "crosscheck"]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Concurrent interaction load test for the scrubbot cogs with local GW2 API and Discord "
+                    "stand-ins. Run from the repository root: python -m benchmarks.loadtest --rate 20 --nightly")
+    parser.add_argument('--members', type=int, default=5000, help="Synthetic guild size")
+    parser.add_argument('--rate', type=float, default=10.0, help="Interactions started per second")
+    parser.add_argument('--duration', type=float, default=10.0, help="Seconds of traffic to generate")
+    parser.add_argument('--mix', default=DEFAULT_MIX, help=f"Workload weights (default: {DEFAULT_MIX})")
+    parser.add_argument('--gw2-latency', type=float, default=0.05, help="GW2 API stand-in latency in seconds")
+    parser.add_argument('--rest-latency', type=float, default=0.02, help="Discord REST stand-in latency in seconds")
+    parser.add_argument('--nightly', action='store_true', help="Run update_database during the traffic")
+    parser.add_argument('--nightly-delay', type=float, default=1.0, help="Seconds before the nightly update starts")
+    parser.add_argument('--watchdog', type=float, metavar='SECONDS',
+                        help="Report call sites that block the event loop for longer than this")
+    parser.add_argument('--storage', choices=['sqlite', 'memory'], default='sqlite',
+                        help="Storage backend of the commands")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help="Write the JSON results to this file instead of stdout")
+    args = parser.parse_args()
+    args.port = free_port()
+    weights = parse_mix(args.mix)
+
+    configure_environment(args.port)
+    output = os.path.abspath(args.output) if args.output else None
+
+    with tempfile.TemporaryDirectory(prefix='scrubbot-load-') as workdir:
+        os.chdir(workdir)  # Database files are created relative to the working directory
+        results = asyncio.run(main_async(args, weights))
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(),
+            "members": args.members,
+            "rate": args.rate,
+            "duration_s": args.duration,
+            "mix": weights,
+            "gw2_latency_s": args.gw2_latency,
+            "rest_latency_s": args.rest_latency,
+            "nightly": args.nightly,
+            "storage": args.storage,
+        },
+        "results": results,
+    }
+    if output:
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == '__main__':
+    main()
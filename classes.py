@@ -1,20 +1,33 @@
 # Standard library imports
-import os
-import asyncio
+import re
+import time
 import sqlite3
-from datetime import datetime, timedelta, timezone
+from datetime import datetime, timezone
 
 # Third-party imports
 import discord
-from discord import Interaction, app_commands, ui
+from discord import app_commands, ui
 from discord.ext import commands
-from discord.ui import Button, View
+from discord.ui import View
 import requests
 
 # Personal files
-from config import (ROLE_ID_CONFIRMATION, ROLE_ID_GUEST, ROLE_ID_MEMBER, ROLE_ID_STAFF, ROLE_ID_BIRTHDAY,
-                    ROLE_ID_FAMED_MEMBER, GUILD_ID, API_KEY, CHANNEL_ID_MENTORS, CHANNEL_ID_RULES,
-                    CURRENT_DB_FILENAME)
+from config import TRACE_THRESHOLD_SECONDS, APPLICATION_DRAFT_TTL_HOURS
+from guilds import get_guild_config, has_guild_role
+from repositories import get_storage, refresh_guild_roster, ensure_guild_roster, snowflake, SEARCH_SCOPES
+from columns import GuildStatus, NO_BIRTHDAY, birthday_value, format_birthday, now_epoch, format_epoch
+from members import get_or_fetch_member
+from assets import ASSETS
+from notifications import notify_mentors, MESSAGE_LIMIT
+from fuzzy import suggest_gw2_ids, did_you_mean
+from autocomplete import identifier_autocomplete, member_updated, member_removed
+from outbox import dm, mentors_post, role_update, register_button
+from components import RoutedButton, component_handler, routed_view, mark_clicked
+from sessions import SessionStore
+from audit import AUDIT_LOG, AUDIT_ACTIONS, audit
+from profiler import get_profiler
+from loop_watchdog import get_loop_watchdog
+from tracing import traced_interaction
 
 
 # -------------- Classes for modals and buttons --------------
@@ -26,6 +39,7 @@ class GW2IDModal(ui.Modal, title='Verify your GW2 ID'):
         super().__init__()
         self.cog = cog
 
+    @traced_interaction("verify modal", TRACE_THRESHOLD_SECONDS)
     async def on_submit(self, interaction: discord.Interaction):
         await interaction.response.defer(ephemeral=True)
         await self.cog.process_verification(interaction, self.gw2_id.value)
@@ -35,9 +49,11 @@ class GW2IDUpdateModal(discord.ui.Modal, title='Update your GW2 ID'):
     def __init__(self, bot):
         super().__init__()
         self.bot = bot
-        self.gw2_id = discord.ui.TextInput(label='Enter your GW2 ID (e.g., Example.1234)', style=discord.TextStyle.short)
+        self.gw2_id = discord.ui.TextInput(label='Enter your GW2 ID (e.g., Example.1234)', style=discord.TextStyle.short,
+                                           max_length=50)
         self.add_item(self.gw2_id)
 
+    @traced_interaction("gw2id update modal", TRACE_THRESHOLD_SECONDS)
     async def on_submit(self, interaction: discord.Interaction):
         await interaction.response.defer(ephemeral=True)
         await process_update(self.bot, interaction, self.gw2_id.value)
@@ -53,17 +69,17 @@ class AdminGW2IDUpdateModal(discord.ui.Modal, title="Update GW2 ID"):
         self.add_item(self.gw2_id)
         self.add_item(self.alt_gw2_id)
 
+    @traced_interaction("admin-gw2id update modal", TRACE_THRESHOLD_SECONDS)
     async def on_submit(self, interaction: discord.Interaction):
         await interaction.response.defer(ephemeral=True)
         await self.process_admin_update(interaction, self.user, self.gw2_id.value, self.alt_gw2_id.value)
 
     async def process_admin_update(self, interaction: discord.Interaction, target_user: discord.Member, new_gw2_id: str, new_alt_gw2_id: str):
-        # Fetch the guild roster from the GW2 API
-        response = requests.get(f"https://api.guildwars2.com/v2/guild/{GUILD_ID}/members", headers={"Authorization": f"Bearer {API_KEY}"})
-        if response.status_code != 200:
+        # Fetch the guild roster from the GW2 API (and store it for other commands)
+        status, guild_roster = refresh_guild_roster(interaction.guild_id)
+        if guild_roster is None:
             await interaction.followup.send("Failed to fetch guild roster. Please try again later.")
             return
-        guild_roster = response.json()
 
         # Check if the provided GW2 IDs match any member in the guild roster
         main_member = next((m for m in guild_roster if m['name'].lower() == new_gw2_id.lower()), None) if new_gw2_id else None
@@ -71,10 +87,11 @@ class AdminGW2IDUpdateModal(discord.ui.Modal, title="Update GW2 ID"):
 
         # Handle verification failures
         verification_failures = []
-        if new_gw2_id and not main_member:
-            verification_failures.append(f"{new_gw2_id} (main)")
-        if new_alt_gw2_id and not alt_member:
-            verification_failures.append(f"{new_alt_gw2_id} (alt)")
+        for gw2_id, member, label in [(new_gw2_id, main_member, "main"), (new_alt_gw2_id, alt_member, "alt")]:
+            if gw2_id and not member:
+                suggestions = suggest_gw2_ids(interaction.guild_id, guild_roster, gw2_id)
+                hint = f" - did you mean {', '.join(suggestions)}?" if suggestions else ""
+                verification_failures.append(f"{gw2_id} ({label}){hint}")
 
         if verification_failures:
             failure_msg = "Update failed. The following GW2 ID(s) were not found in the guild roster:\n\n"
@@ -83,85 +100,65 @@ class AdminGW2IDUpdateModal(discord.ui.Modal, title="Update GW2 ID"):
             await interaction.followup.send(failure_msg, ephemeral=True)
             return
 
-        conn = sqlite3.connect(CURRENT_DB_FILENAME)
-        cursor = conn.cursor()
-
-        try:
-            # Fetch current user data
-            cursor.execute("SELECT gw2_id, alt_gw2_id FROM users WHERE discord_id = ?", (str(target_user.id),))
-            current_data = cursor.fetchone()
-            current_main_id, current_alt_id = current_data if current_data else (None, None)
-
-            swapped = False
-            # Check if we're swapping main and alt
-            if new_gw2_id and new_gw2_id == current_alt_id:
-                new_gw2_id, new_alt_gw2_id = current_alt_id, current_main_id
-                swapped = True
-            elif new_alt_gw2_id and new_alt_gw2_id == current_main_id:
-                new_gw2_id, new_alt_gw2_id = current_main_id, current_alt_id
-                swapped = True
-            elif new_gw2_id and new_gw2_id == current_main_id and new_alt_gw2_id and new_alt_gw2_id == current_alt_id:
-                await interaction.followup.send("No changes were made as the provided IDs are the same as the current ones.", ephemeral=True)
-                return
-            elif new_gw2_id and not new_alt_gw2_id:
-                new_alt_gw2_id = current_alt_id
-            elif new_alt_gw2_id and not new_gw2_id:
-                new_gw2_id = current_main_id
-
-            if swapped:
-                await interaction.followup.send(f"Swapped main and alt GW2 IDs for {target_user.mention}.", ephemeral=True)
-            else:
-                # Check for conflicts with existing accounts
-                if new_gw2_id and new_gw2_id != current_main_id and new_gw2_id != current_alt_id:
-                    cursor.execute("SELECT discord_id FROM users WHERE gw2_id = ? OR alt_gw2_id = ?", (new_gw2_id, new_gw2_id))
-                    existing_main = cursor.fetchone()
-                    if existing_main and str(existing_main[0]) != str(target_user.id):
-                        await interaction.followup.send(f"The main GW2 ID ({new_gw2_id}) is already associated with another Discord account.", ephemeral=True)
-                        return
-
-                if new_alt_gw2_id and new_alt_gw2_id != current_main_id and new_alt_gw2_id != current_alt_id:
-                    cursor.execute("SELECT discord_id FROM users WHERE gw2_id = ? OR alt_gw2_id = ?", (new_alt_gw2_id, new_alt_gw2_id))
-                    existing_alt = cursor.fetchone()
-                    if existing_alt and str(existing_alt[0]) != str(target_user.id):
-                        await interaction.followup.send(f"The alternate GW2 ID ({new_alt_gw2_id}) is already associated with another Discord account.", ephemeral=True)
-                        return
+        users = get_storage(interaction.guild_id).users
+
+        # Fetch current user data
+        current_data = users.get(target_user.id)
+        current_main_id, current_alt_id = (current_data.gw2_id, current_data.alt_gw2_id) if current_data else (None, None)
+
+        swapped = False
+        # Check if we're swapping main and alt
+        if new_gw2_id and new_gw2_id == current_alt_id:
+            new_gw2_id, new_alt_gw2_id = current_alt_id, current_main_id
+            swapped = True
+        elif new_alt_gw2_id and new_alt_gw2_id == current_main_id:
+            new_gw2_id, new_alt_gw2_id = current_main_id, current_alt_id
+            swapped = True
+        elif new_gw2_id and new_gw2_id == current_main_id and new_alt_gw2_id and new_alt_gw2_id == current_alt_id:
+            await interaction.followup.send("No changes were made as the provided IDs are the same as the current ones.", ephemeral=True)
+            return
+        elif new_gw2_id and not new_alt_gw2_id:
+            new_alt_gw2_id = current_alt_id
+        elif new_alt_gw2_id and not new_gw2_id:
+            new_gw2_id = current_main_id
 
-            # Prepare update data
-            update_data = []
-            update_fields = []
-            if new_gw2_id:
-                update_data.extend([new_gw2_id, "Member"])
-                update_fields.extend(["gw2_id = ?", "guild_status = ?"])
-            if new_alt_gw2_id:
-                update_data.extend([new_alt_gw2_id, "Member"])
-                update_fields.extend(["alt_gw2_id = ?", "alt_guild_status = ?"])
-
-            if not update_data:
-                await interaction.followup.send("No changes were made as no new valid IDs were provided.", ephemeral=True)
-                return
+        if swapped:
+            await interaction.followup.send(f"Swapped main and alt GW2 IDs for {target_user.mention}.", ephemeral=True)
+        else:
+            # Check for conflicts with existing accounts
+            if new_gw2_id and new_gw2_id != current_main_id and new_gw2_id != current_alt_id:
+                existing_main = users.owner_of(new_gw2_id)
+                if existing_main and str(existing_main) != str(target_user.id):
+                    await interaction.followup.send(f"The main GW2 ID ({new_gw2_id}) is already associated with another Discord account.", ephemeral=True)
+                    return
 
-            # Update the user's GW2 IDs in the database
-            update_query = f"UPDATE users SET {', '.join(update_fields)} WHERE discord_id = ?"
-            update_data.append(str(target_user.id))
-            cursor.execute(update_query, tuple(update_data))
-            conn.commit()
+            if new_alt_gw2_id and new_alt_gw2_id != current_main_id and new_alt_gw2_id != current_alt_id:
+                existing_alt = users.owner_of(new_alt_gw2_id)
+                if existing_alt and str(existing_alt) != str(target_user.id):
+                    await interaction.followup.send(f"The alternate GW2 ID ({new_alt_gw2_id}) is already associated with another Discord account.", ephemeral=True)
+                    return
 
-            # Prepare response message
-            response_msg = f"Updated GW2 IDs for {target_user.mention}:\n"
-            if new_gw2_id:
-                response_msg += f"- {new_gw2_id} (main)\n"
-            if new_alt_gw2_id:
-                response_msg += f"- {new_alt_gw2_id} (alt)\n"
+        if not new_gw2_id and not new_alt_gw2_id:
+            await interaction.followup.send("No changes were made as no new valid IDs were provided.", ephemeral=True)
+            return
 
-            # Notify mentors
-            mentors_channel = interaction.client.get_channel(CHANNEL_ID_MENTORS)
-            if mentors_channel:
-                await mentors_channel.send(f"{interaction.user.mention} has updated GW2 IDs for {target_user.mention}.\n\n" + response_msg)
+        # Prepare response message
+        response_msg = f"Updated GW2 IDs for {target_user.mention}:\n"
+        if new_gw2_id:
+            response_msg += f"- {new_gw2_id} (main)\n"
+        if new_alt_gw2_id:
+            response_msg += f"- {new_alt_gw2_id} (alt)\n"
 
-            await interaction.followup.send(response_msg, ephemeral=True)
+        # Update the user's GW2 IDs in the database, notifying mentors through the outbox
+        users.set_gw2_ids(target_user.id, new_gw2_id, new_alt_gw2_id, effects=[mentors_post(
+            'id_update',
+            f"{interaction.user.mention} has updated GW2 IDs for {target_user.mention}.\n\n" + response_msg,
+            f"{interaction.id}:mentors",
+            summary=f"{interaction.user.mention} updated GW2 IDs for {target_user.mention}: "
+                    + ", ".join(filter(None, [new_gw2_id, new_alt_gw2_id])))])
+        audit(interaction, 'gw2id_update', target_user.id, ", ".join(filter(None, [new_gw2_id, new_alt_gw2_id])))
 
-        finally:
-            conn.close()
+        await interaction.followup.send(response_msg, ephemeral=True)
 
 
 class GuildInviteRequestModal(discord.ui.Modal):
@@ -182,24 +179,22 @@ class GuildInviteRequestModal(discord.ui.Modal):
     async def on_submit(self, interaction: discord.Interaction):
         gw2_id = self.gw2_id.value
 
-        # Get the channel where mentors should be notified
-        channel = interaction.guild.get_channel(CHANNEL_ID_MENTORS)
-
         # Prepare the message based on the selection
         if self.invite_for == "me":
             message = (
                 f"🚨 __**Attention Needed**__ 🚨\n\n"
                 f"{interaction.user.mention} is requesting an invite to the guild.\n\n"
                 f"**GW2 ID**: ```{gw2_id}```")
+            summary = f"{interaction.user.mention} requests an invite for `{gw2_id}`"
         else:
             message = (
                 f"🚨 __**Attention Needed**__ 🚨\n\n"
                 f"{interaction.user.mention} is requesting an invite to the guild for a **friend**.\n\n"
                 f"**GW2 ID**: ```{gw2_id}```")
+            summary = f"{interaction.user.mention} requests an invite for a friend: `{gw2_id}`"
 
         # Send the notification to the mentor channel
-        if channel:
-            await channel.send(message)
+        if await notify_mentors(interaction.client, interaction.guild_id, 'invite', message, summary=summary):
             await interaction.response.send_message(
                 "Your request has been sent to the mentors. You or your friend will be invited to the guild soon!", ephemeral=True)
         else:
@@ -207,13 +202,13 @@ class GuildInviteRequestModal(discord.ui.Modal):
                 "Failed to send your request. Please contact a mentor directly.", ephemeral=True)
 
 
-class ApplicationModalButton(discord.ui.Button):
-    def __init__(self, bot: commands.Bot):
-        super().__init__(style=discord.ButtonStyle.primary, label="Apply")
-        self.bot = bot
+# Answers to part 1 of a mentor application, kept until part 2 is submitted
+APPLICATION_DRAFTS = SessionStore('application', ttl=APPLICATION_DRAFT_TTL_HOURS * 3600)
 
-    async def callback(self, interaction: discord.Interaction):
-        await interaction.response.send_modal(ApplicationModalPart1(bot=self.bot))
+
+@component_handler('apply-mentor')
+async def open_application(interaction: discord.Interaction):
+    await interaction.response.send_modal(ApplicationModalPart1(bot=interaction.client))
 
 
 class ApplicationModalPart1(discord.ui.Modal):
@@ -227,51 +222,38 @@ class ApplicationModalPart1(discord.ui.Modal):
 
     async def on_submit(self, interaction: discord.Interaction):
         # Retrieve GW2 ID from the database
-        conn = sqlite3.connect(CURRENT_DB_FILENAME)
-        c = conn.cursor()
-        c.execute("SELECT gw2_id FROM users WHERE discord_id = ?", (str(interaction.user.id),))
-        result = c.fetchone()
-        conn.close()
+        user = get_storage(interaction.guild_id).users.get(interaction.user.id)
 
-        if result is None or result[0] == 'Unknown':
+        if user is None or user.gw2_id == 'Unknown':
             await interaction.response.send_message(
                 "Error: Your GW2 ID is not found in our database. Please update your GW2 ID first.",
                 ephemeral=True
             )
             return
 
-        gw2_id = result[0]
+        gw2_id = user.gw2_id
 
         application_data = {
-            "discord_id": str(interaction.user.id),
+            "discord_id": interaction.user.id,
             "gw2_id": gw2_id,
             "joined_how": self.joined_how.value,
             "timezone": self.timezone.value,
             "has_commander_tag": self.has_commander_tag.value,
         }
 
-        # Store this data temporarily
-        if not hasattr(interaction.client, 'temp_application_data'):
-            interaction.client.temp_application_data = {}
-
-        interaction.client.temp_application_data[interaction.user.id] = application_data
+        # Keep the draft until part 2 is submitted
+        APPLICATION_DRAFTS.put(interaction.guild_id, interaction.user.id, application_data)
 
         # Send a message with a button to continue
         await interaction.response.send_message(
             "Thank you for the initial information. Click the button below to continue your application.",
-            view=ContinueApplicationView(bot=self.bot), ephemeral=True)
+            view=routed_view(RoutedButton('apply-mentor-continue', label="Continue Application")), ephemeral=True)
 
 
-class ContinueApplicationView(discord.ui.View):
-    def __init__(self, bot: commands.Bot):
-        super().__init__()
-        self.bot = bot
-
-    @discord.ui.button(label="Continue Application", style=discord.ButtonStyle.primary)
-    async def continue_application(self, interaction: discord.Interaction, button: discord.ui.Button):
-        # Pass the bot instance to the modal
-        modal = ApplicationModalPart2(bot=self.bot)
-        await interaction.response.send_modal(modal)
+# Routed, so a draft saved before a restart can still be continued
+@component_handler('apply-mentor-continue')
+async def continue_application(interaction: discord.Interaction):
+    await interaction.response.send_modal(ApplicationModalPart2(bot=interaction.client))
 
 
 class ApplicationModalPart2(discord.ui.Modal):
@@ -286,7 +268,11 @@ class ApplicationModalPart2(discord.ui.Modal):
 
     async def on_submit(self, interaction: discord.Interaction):
         # Retrieve the data from part 1
-        application_data = getattr(interaction.client, 'temp_application_data', {}).get(interaction.user.id, {})
+        application_data = APPLICATION_DRAFTS.get(interaction.guild_id, interaction.user.id)
+        if application_data is None:
+            await interaction.response.send_message(
+                "Your application draft has expired. Please start again with /apply-mentor.", ephemeral=True)
+            return
 
         # Add the data from part 2
         application_data.update({
@@ -297,78 +283,51 @@ class ApplicationModalPart2(discord.ui.Modal):
         })
 
         # Save the complete application
-        await self.save_application(interaction, application_data)
+        if not await self.save_application(interaction, application_data):
+            return  # The draft is kept, so the user can try again
+        APPLICATION_DRAFTS.pop(interaction.guild_id, interaction.user.id)
 
         # Inform Staff about the new application
-        mentors_channel = self.bot.get_channel(CHANNEL_ID_MENTORS)
-        if mentors_channel:
-            try:
-                await mentors_channel.send(
-                    f"🚨 __**Attention needed**__ 🚨\n\n"
-                    f"{interaction.user.mention} has submitted an application to become a Mentor"
-                )
-            except discord.DiscordException as e:
-                print(f"Failed to send message to mentors channel: {e}")
-        else:
-            print(f"Mentors channel with ID {CHANNEL_ID_MENTORS} not found")
+        await notify_mentors(
+            self.bot, interaction.guild_id, 'application',
+            f"🚨 __**Attention needed**__ 🚨\n\n"
+            f"{interaction.user.mention} has submitted an application to become a Mentor",
+            summary=f"{interaction.user.mention} has submitted an application to become a Mentor")
 
     @staticmethod
     async def save_application(interaction: discord.Interaction, application_data):
         try:
-            conn = sqlite3.connect(CURRENT_DB_FILENAME)
-            c = conn.cursor()
-            c.execute('''
-                INSERT INTO mentor_applications 
-                (discord_id, gw2_id, joined_how, timezone, has_commander_tag, 
-                content_preference, has_led_event, event_interest, changes_suggested)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                application_data["discord_id"],
-                application_data["gw2_id"],
-                application_data["joined_how"],
-                application_data["timezone"],
-                application_data["has_commander_tag"],
-                application_data["content_preference"],
-                application_data["has_led_event"],
-                application_data["event_interest"],
-                application_data["changes_suggested"]
-            ))
-            conn.commit()
-            conn.close()
+            get_storage(interaction.guild_id).applications.add(application_data)
             await interaction.response.send_message("Your application has been submitted successfully!", ephemeral=True)
+            return True
         except Exception as e:
             await interaction.response.send_message(f"An error occurred while submitting your application: {str(e)}",
                                                     ephemeral=True)
+            return False
 
 
-class WelcomeButton(ui.Button):
+def welcome_button(user_id):
     """Button for sending welcome messages."""
+    return RoutedButton('welcome', user_id, label="Send welcome message")
 
-    def __init__(self, user: discord.Member):
-        super().__init__(style=discord.ButtonStyle.primary, label="Send welcome message")
-        self.user = user
 
-    async def callback(self, interaction: Interaction):
-        await interaction.response.send_message(
-            f"To welcome the new member copy and run the following command: ```!welcome {self.user.mention}```",
-            ephemeral=True)
-        self.disabled = True
-        self.label = "Welcome message sent"
-        await interaction.message.edit(view=self.view)
+@component_handler('welcome')
+async def send_welcome(interaction: discord.Interaction, user_id):
+    await interaction.response.send_message(
+        f"To welcome the new member copy and run the following command: ```!welcome <@{user_id}>```",
+        ephemeral=True)
+    await mark_clicked(interaction, "Welcome message sent")
 
 
-class InvitationButton(ui.Button):
+def invitation_button(gw2_id):
     """Button for confirming that the in-game guild invitation has been sent."""
+    return RoutedButton('guild-invitation', gw2_id, label="Send guild invitation")
 
-    def __init__(self, new_gw2_id: str):
-        super().__init__(style=discord.ButtonStyle.primary, label="Send guild invitation")
-        self.gw2_id = new_gw2_id
 
-    async def callback(self, interaction: Interaction):
-        await interaction.response.send_message(f"Please send a guild invite to: ```{self.gw2_id}```", ephemeral=True)
-        self.disabled = True
-        self.label = "Guild invitation sent"
-        await interaction.message.edit(view=self.view)
+@component_handler('guild-invitation')
+async def send_invitation(interaction: discord.Interaction, gw2_id):
+    await interaction.response.send_message(f"Please send a guild invite to: ```{gw2_id}```", ephemeral=True)
+    await mark_clicked(interaction, "Guild invitation sent")
 
 
 class AddToWatchlistModal(ui.Modal, title='Add Player to Watchlist'):
@@ -381,18 +340,9 @@ class AddToWatchlistModal(ui.Modal, title='Add Player to Watchlist'):
         self.identifier = identifier
 
     async def on_submit(self, interaction: discord.Interaction):
-        conn = None
         try:
-            conn = sqlite3.connect(CURRENT_DB_FILENAME)
-            c = conn.cursor()
-
-            c.execute('''
-                UPDATE users 
-                SET watchlist_reason = ? 
-                WHERE discord_id = ?
-            ''', (self.reason.value, self.discord_id))
-
-            conn.commit()
+            get_storage(interaction.guild_id).watchlist.add(self.discord_id, self.reason.value)
+            audit(interaction, 'watchlist_add', self.discord_id, self.reason.value)
 
             await interaction.response.send_message(
                 f"User with identifier '{self.identifier}' has been added to the watchlist. Reason: {self.reason.value}",
@@ -401,126 +351,128 @@ class AddToWatchlistModal(ui.Modal, title='Add Player to Watchlist'):
         except sqlite3.Error as e:
             await interaction.response.send_message(f"An error occurred while updating the database: {e}",
                                                     ephemeral=True)
-        finally:
-            if conn:
-                conn.close()
 
 
-class WarningsButton(ui.Button):
-    """Button for viewing user warnings."""
+def warnings_button(discord_id):
+    """Button for viewing user warnings. They are loaded when it is clicked."""
+    return RoutedButton('warnings', discord_id, label="View Warnings")
 
-    def __init__(self, cog, user_id, warnings):
-        super().__init__(style=discord.ButtonStyle.primary, label="View Warnings")
-        self.cog = cog
-        self.user_id = user_id
-        self.warnings = warnings
 
-    async def callback(self, interaction: discord.Interaction):
-        try:
-            await display_warnings(interaction, self.user_id, self.warnings)
-        except Exception as e:
-            print(f"Error in WarningsButton callback: {e}")
-            await interaction.response.send_message(
-                "An error occurred while displaying warnings. Please try again later.", ephemeral=True)
+@component_handler('warnings')
+async def show_warnings(interaction: discord.Interaction, discord_id):
+    warnings = get_storage(interaction.guild_id).warnings.for_user(discord_id)
+    await display_warnings(interaction, discord_id, warnings)
 
 
-class ApplicationView(View):
-    def __init__(self, bot):
-        super().__init__(timeout=None)
-        self.bot = bot
+class ApplicationIdModal(ui.Modal):
+    """Asks for an application ID and passes it to `on_submit_id(interaction, app_id)`."""
+    app_id = ui.TextInput(label='Application ID', placeholder='e.g. 12', max_length=10)
 
-    @discord.ui.button(label="See details", style=discord.ButtonStyle.primary)
-    async def see_details(self, interaction: discord.Interaction, button: discord.ui.Button):
-        await interaction.response.send_message("Enter the ID of the application you want to view:", ephemeral=True)
+    def __init__(self, title, on_submit_id):
+        super().__init__(title=title)
+        self.on_submit_id = on_submit_id
 
-        def check(m):
-            return m.author == interaction.user and m.channel == interaction.channel and m.content.isdigit()
-
-        try:
-            msg = await self.bot.wait_for('message', check=check, timeout=60.0)
-        except asyncio.TimeoutError:
-            await interaction.followup.send("You didn't respond in time. Command cancelled.", ephemeral=True)
+    async def on_submit(self, interaction: discord.Interaction):
+        if not self.app_id.value.strip().isdigit():
+            await interaction.response.send_message("Invalid application ID.", ephemeral=True)
             return
+        await self.on_submit_id(interaction, int(self.app_id.value))
 
-        app_id = int(msg.content)
-        await msg.delete()  # Delete the user's input message
 
-        # Fetch the full application details
-        conn = sqlite3.connect(CURRENT_DB_FILENAME)
-        c = conn.cursor()
-        c.execute("SELECT * FROM mentor_applications WHERE id = ?", (app_id,))
-        app_details = c.fetchone()
-        conn.close()
+@component_handler('application-details')
+async def see_application_details(interaction: discord.Interaction):
+    await interaction.response.send_modal(ApplicationIdModal("View application", show_application_details))
 
-        if not app_details:
-            await interaction.followup.send("Invalid application ID.", ephemeral=True)
-            return
 
-        # Create a detailed embed for the selected application
-        detail_embed = discord.Embed(title=f"Application ID {app_details[0]} - Details",
-                                     color=discord.Color.green())
-
-        # Set the author of the embed
-        author_id = app_details[2]
-        author = await self.bot.fetch_user(author_id)
-        detail_embed.set_author(name=f"{author.display_name}", icon_url=author.display_avatar.url)
-
-        detail_embed.add_field(name="\u200b", value="", inline=False)
-        detail_embed.add_field(name="Timestamp", value=app_details[1], inline=False)
-        detail_embed.add_field(name="\u200b", value="", inline=False)
-        detail_embed.add_field(name="Discord", value=f"<@{author_id}>", inline=True)
-        detail_embed.add_field(name="GW2 ID", value=app_details[3], inline=True)
-        detail_embed.add_field(name="\u200b", value="", inline=False)
-        detail_embed.add_field(name="How did you join [DPS]?", value=app_details[4], inline=False)
-        detail_embed.add_field(name="What's your UTC Timezone?", value=app_details[5], inline=False)
-        detail_embed.add_field(name="Do you own a Commander Tag?", value=app_details[6], inline=False)
-        detail_embed.add_field(name="What type of content do you enjoy?", value=app_details[7], inline=False)
-        detail_embed.add_field(name="Have you ever led any event before?", value=app_details[8], inline=False)
-        detail_embed.add_field(name="Which events are you interested in leading?", value=app_details[9] or "N/A",
-                               inline=False)
-        detail_embed.add_field(name="Any changes you'd suggest for [DPS]?", value=app_details[10] or "N/A",
-                               inline=False)
-
-        # Set thumbnail
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        thumbnail_path = os.path.join(script_dir, "pictures", "Application_details.png")
-
-        if os.path.exists(thumbnail_path):
-            file = discord.File(thumbnail_path, filename="Application_details.png")
-            detail_embed.set_thumbnail(url="attachment://Application_details.png")
-        else:
-            file = None
-            print(f"Thumbnail file not found at: {thumbnail_path}")
+@component_handler('application-remove')
+async def remove_application(interaction: discord.Interaction):
+    await interaction.response.send_modal(ApplicationIdModal("Remove application", delete_application))
 
-        await interaction.followup.send(file=file, embed=detail_embed, ephemeral=True)
 
-    @discord.ui.button(label="Remove application", style=discord.ButtonStyle.danger)
-    async def remove_application(self, interaction: discord.Interaction, button: discord.ui.Button):
-        await interaction.response.send_message("Enter the ID of the application you want to remove:", ephemeral=True)
+async def show_application_details(interaction: discord.Interaction, app_id):
+    await interaction.response.defer(ephemeral=True)
 
-        def check(m):
-            return m.author == interaction.user and m.channel == interaction.channel and m.content.isdigit()
+    # Fetch the full application details
+    app_details = get_storage(interaction.guild_id).applications.get(app_id)
 
-        try:
-            msg = await self.bot.wait_for('message', check=check, timeout=30.0)
-        except asyncio.TimeoutError:
-            await interaction.followup.send("You didn't respond in time. Command cancelled.", ephemeral=True)
-            return
+    if not app_details:
+        await interaction.followup.send("Invalid application ID.", ephemeral=True)
+        return
 
-        app_id = int(msg.content)
-        await msg.delete()  # Delete the user's input message
+    # Create a detailed embed for the selected application
+    detail_embed = discord.Embed(title=f"Application ID {app_details.id} - Details",
+                                 color=discord.Color.green())
+
+    # Set the author of the embed
+    author_id = app_details.discord_id
+    author = await interaction.client.fetch_user(author_id)
+    detail_embed.set_author(name=f"{author.display_name}", icon_url=author.display_avatar.url)
+
+    detail_embed.add_field(name="\u200b", value="", inline=False)
+    detail_embed.add_field(name="Timestamp", value=format_epoch(app_details.timestamp, "%Y-%m-%d %H:%M:%S"),
+                           inline=False)
+    detail_embed.add_field(name="\u200b", value="", inline=False)
+    detail_embed.add_field(name="Discord", value=f"<@{author_id}>", inline=True)
+    detail_embed.add_field(name="GW2 ID", value=app_details.gw2_id, inline=True)
+    detail_embed.add_field(name="\u200b", value="", inline=False)
+    detail_embed.add_field(name="How did you join [DPS]?", value=app_details.joined_how, inline=False)
+    detail_embed.add_field(name="What's your UTC Timezone?", value=app_details.timezone, inline=False)
+    detail_embed.add_field(name="Do you own a Commander Tag?", value=app_details.has_commander_tag, inline=False)
+    detail_embed.add_field(name="What type of content do you enjoy?", value=app_details.content_preference, inline=False)
+    detail_embed.add_field(name="Have you ever led any event before?", value=app_details.has_led_event, inline=False)
+    detail_embed.add_field(name="Which events are you interested in leading?", value=app_details.event_interest or "N/A",
+                           inline=False)
+    detail_embed.add_field(name="Any changes you'd suggest for [DPS]?", value=app_details.changes_suggested or "N/A",
+                           inline=False)
+
+    # Set thumbnail
+    files = await ASSETS.thumbnail(detail_embed, "Application_details.png")
+
+    await interaction.followup.send(files=files, embed=detail_embed, ephemeral=True)
+
+async def delete_application(interaction: discord.Interaction, app_id):
+    # Remove the application from the database
+    applications = get_storage(interaction.guild_id).applications
+    application = applications.get(app_id)
+
+    if not application or not applications.delete(app_id):
+        await interaction.response.send_message("Invalid application ID.", ephemeral=True)
+    else:
+        audit(interaction, 'application_remove', application.discord_id, f"Application ID {app_id}")
+        await interaction.response.send_message(f"Application ID {app_id} has been removed.", ephemeral=True)
 
-        # Remove the application from the database
-        conn = sqlite3.connect(CURRENT_DB_FILENAME)
-        c = conn.cursor()
-        c.execute("DELETE FROM mentor_applications WHERE id = ?", (app_id,))
-        conn.commit()
-        conn.close()
 
-        if c.rowcount == 0:
-            await interaction.followup.send("Invalid application ID.", ephemeral=True)
-        else:
-            await interaction.followup.send(f"Application ID {app_id} has been removed.", ephemeral=True)
+class RemoveWarningView(View):
+    """Select menu listing a user's warnings (oldest first). Picking one removes it."""
+
+    def __init__(self, author_id, discord_id, warnings):
+        super().__init__(timeout=60)
+        self.author_id = author_id
+        self.discord_id = discord_id
+        # A select menu holds at most 25 options
+        self.warnings = sorted(warnings, key=lambda x: x.date)[:25]
+
+        select = ui.Select(placeholder="Choose the warning to remove", options=[
+            discord.SelectOption(label=f"{i}{get_ordinal_suffix(i)} Warning - {format_epoch(warning.date)}",
+                                 description=(warning.reason or "")[:100] or None, value=str(i - 1))
+            for i, warning in enumerate(self.warnings, 1)])
+        select.callback = self.remove
+        self.add_item(select)
+
+    async def interaction_check(self, interaction: discord.Interaction):
+        return interaction.user.id == self.author_id
+
+    async def remove(self, interaction: discord.Interaction):
+        warning_number = int(interaction.data['values'][0]) + 1
+        storage = get_storage(interaction.guild_id)
+        warning = self.warnings[warning_number - 1]
+        storage.warnings.remove(self.discord_id, warning.id)
+        audit(interaction, 'warning_remove', self.discord_id, warning.reason)
+        self.stop()
+        await interaction.response.edit_message(content=f"Warning {warning_number} has been removed.", view=None)
+
+        # Display updated warnings
+        await display_warnings(interaction, self.discord_id, storage.warnings.for_user(self.discord_id))
 
 
 class Paginator(discord.ui.View):
@@ -542,6 +494,26 @@ class Paginator(discord.ui.View):
         await interaction.response.edit_message(embed=self.embeds[self.current_page], view=self)
 
 
+class LazyPaginator(discord.ui.View):
+    """A paginator that builds each embed only when its page is shown. `load_page(index)` returns the embed."""
+
+    def __init__(self, page_count, load_page):
+        super().__init__(timeout=180)
+        self.page_count = page_count
+        self.load_page = load_page
+        self.current_page = 0
+
+    @discord.ui.button(label="◀️", style=discord.ButtonStyle.grey)
+    async def previous_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.current_page = (self.current_page - 1) % self.page_count
+        await interaction.response.edit_message(embed=self.load_page(self.current_page), view=self)
+
+    @discord.ui.button(label="▶️", style=discord.ButtonStyle.grey)
+    async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.current_page = (self.current_page + 1) % self.page_count
+        await interaction.response.edit_message(embed=self.load_page(self.current_page), view=self)
+
+
 class BirthdayModal(ui.Modal, title="Set Your Birthday"):
     def __init__(self, cog):
         super().__init__()
@@ -610,18 +582,52 @@ class BirthdayModal(ui.Modal, title="Set Your Birthday"):
             return
 
         # Save to database
-        conn = sqlite3.connect(CURRENT_DB_FILENAME)
-        c = conn.cursor()
-        c.execute("UPDATE users SET birthday = ? WHERE discord_id = ?",
-                  (f"{day:02d}.{month:02d}.{year}", str(interaction.user.id)))
-        conn.commit()
-        conn.close()
+        get_storage(interaction.guild_id).users.set_birthday(interaction.user.id, birthday_value(day, month, year))
 
         await interaction.response.send_message(f"Your birthday has been set to {day:02d}.{month:02d}.{year}!",
                                                 ephemeral=True)
 
 
 # -------------- Functions ----------------
+def build_ban_list(guild_bans, db_bans):
+    """Merge the server bans with the bans table.
+
+    Returns the embed fields sorted by date (newest first), the bans missing from the database and the
+    database records that no longer match a server ban. `db_bans` maps discord_id to (discord_id, reason, date).
+    """
+    db_bans = dict(db_bans)
+    ban_info = []
+    missing_bans = []
+    for ban_entry in guild_bans:
+        user = ban_entry.user
+        reason = ban_entry.reason or "No reason provided"
+        db_record = db_bans.pop(user.id, None)
+
+        if db_record:
+            date = db_record[2]
+        else:
+            date = now_epoch()
+            missing_bans.append((user.id, reason, date))
+
+        ban_info.append((date, {
+            "name": f"{user.name} (ID: {user.id})",
+            "value": f"- Reason: {reason}\n- Date: {format_epoch(date)}",
+            "inline": False
+        }))
+
+    # Sort ban_info by date in descending order
+    ban_info.sort(key=lambda x: x[0], reverse=True)
+
+    return [field for date, field in ban_info], missing_bans, list(db_bans.keys())
+
+
+def get_ordinal_suffix(n):
+    if 11 <= n % 100 <= 13:
+        return 'th'
+    else:
+        return {1: 'st', 2: 'nd', 3: 'rd'}.get(n % 10, 'th')
+
+
 async def display_warnings(interaction: discord.Interaction, user_id: str, warnings):
     """Display warnings for a user."""
     user = await interaction.client.fetch_user(int(user_id))
@@ -631,166 +637,204 @@ async def display_warnings(interaction: discord.Interaction, user_id: str, warni
     embed.set_author(name=f"{user.display_name}", icon_url=user.display_avatar.url)
     embed.description = f"{user.mention}"
 
-    def format_date(date_string):
-        try:
-            date_obj = datetime.fromisoformat(date_string)
-            return date_obj.strftime("%B %d %Y at %I:%M %p")  # e.g., "July 14 2024 at 11:47 PM"
-        except ValueError:
-            return "Unknown Date"
-
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    thumbnail_path = os.path.join(script_dir, "pictures", "Warnings.png")
+    files = await ASSETS.thumbnail(embed, "Warnings.png")
 
-    if os.path.exists(thumbnail_path):
-        file = discord.File(thumbnail_path, filename="Warnings.png")
-        embed.set_thumbnail(url="attachment://Warnings.png")
-    else:
-        file = None
-        print(f"Thumbnail file not found at: {thumbnail_path}")
-
-    def get_ordinal_suffix(n):
-        if 11 <= n % 100 <= 13:
-            return 'th'
-        else:
-            return {1: 'st', 2: 'nd', 3: 'rd'}.get(n % 10, 'th')
-
-    for i, warning in enumerate(sorted(warnings, key=lambda x: x[3]), 1):
+    for i, warning in enumerate(sorted(warnings, key=lambda x: x.date), 1):
         embed.add_field(
             name=f"{i}{get_ordinal_suffix(i)} Warning",
-            value=f"__Reason:__ {warning[2]}\n__Date:__ {format_date(warning[3])}",
+            value=f"__Reason:__ {warning.reason}\n__Date:__ {format_epoch(warning.date)}",
             inline=False
         )
 
     try:
         if interaction.response.is_done():
-            await interaction.followup.send(file=file, embed=embed, ephemeral=True)
+            await interaction.followup.send(files=files, embed=embed, ephemeral=True)
         else:
-            await interaction.response.send_message(file=file, embed=embed, ephemeral=True)
+            await interaction.response.send_message(files=files, embed=embed, ephemeral=True)
     except discord.errors.NotFound:
         # If the interaction has expired, send a new message in the channel
-        await interaction.channel.send(f"{interaction.user.mention}, here are the warnings:", file=file,
-                                       embed=embed)
+        await interaction.channel.send(f"{interaction.user.mention}, here are the warnings:",
+                                       files=await ASSETS.thumbnail(embed, "Warnings.png"), embed=embed)
     except Exception as e:
         print(f"Error displaying warnings: {e}")
 
 
+def warning_dm(mention, warning_count, reason, rules_channel_id):
+    """The DM sent to a warned user, escalating with their number of warnings."""
+    if warning_count == 1:
+        return (
+            f"Dear {mention},\n\n"
+            f"This is a notification regarding a warning issued by the [DPS] staff:\n\n"
+            f"Reason: *{reason}*\n\n"
+            f"We'd like to remind you of the importance of following our server rules and honoring your commitments to scheduled events. This helps maintain a positive environment for all members.\n\n"
+            f"Please review the server rules in <#{rules_channel_id}> and ensure you can attend events you've signed up for. If you're unable to participate, kindly inform us in advance.\n\n"
+            f"Thank you for your cooperation and understanding.\n\n"
+            f"Best regards,\n"
+            f"[DPS] Team"
+        )
+    if warning_count == 2:
+        return (
+            f"Dear {mention},\n\n"
+            f"This is to inform you of a second warning issued by the [DPS] staff:\n\n"
+            f"Reason: *{reason}*\n\n"
+            f"We want to emphasize the importance of adhering to our server rules and respecting the time and effort put into organizing events. Your cooperation is crucial for a smooth and enjoyable experience for everyone involved.\n\n"
+            f"Please take immediate action to address this issue. Review the server rules in <#{rules_channel_id}> and ensure you honour your commitments to events or provide timely notifications if you cannot attend.\n\n"
+            f"We appreciate your prompt attention to this matter.\n\n"
+            f"Best regards,\n"
+            f"[DPS] Team"
+        )
+    return (
+        f"Dear {mention},\n\n"
+        f"This is a final warning notification from the [DPS] staff:\n\n"
+        f"Reason: *{reason}*\n\n"
+        f"We must stress the extreme severity of this situation. Repeated violations of server rules or failure to honor event commitments have significantly impacted our community and the efforts of our event organizers.\n\n"
+        f"This is your final opportunity to address these issues. Any further infractions will result in your immediate removal from both the guild and the Discord server. There will be no further warnings.\n\n"
+        f"We strongly advise you to review and strictly adhere to the server rules in <#{rules_channel_id}>, and to fully commit to events you sign up for or provide ample notice if you cannot attend.\n\n"
+        f"Your immediate and continued compliance is required to remain a member of our community.\n\n"
+        f"Regards,\n"
+        f"[DPS] Team"
+    )
+
+
+_MENTION = re.compile(r'<@!?(\d+)>')
+
+
+def parse_identifiers(text):
+    """Split a list of users: @mentions anywhere, other identifiers separated by commas, semicolons or new lines.
+
+    A part made only of Discord IDs may also be separated by spaces (GW2 IDs can contain spaces, so they can't).
+    """
+    identifiers = _MENTION.findall(text)
+    for part in re.split(r'[,;\n]', _MENTION.sub(',', text)):
+        words = part.split()
+        if words and all(word.isdigit() for word in words):
+            identifiers += words
+        elif part.strip():
+            identifiers.append(part.strip())
+    return list(dict.fromkeys(identifiers))
+
+
+def truncate_lines(lines, limit=1024):
+    """Join lines, replacing the ones that don't fit in `limit` characters (embed field values) with a count."""
+    text = "\n".join(lines)
+    if len(text) <= limit:
+        return text
+    shown = []
+    for i, line in enumerate(lines):
+        if len("\n".join(shown + [line, f"... and {len(lines) - i - 1} more"])) > limit:
+            return "\n".join(shown + [f"... and {len(lines) - i} more"])
+        shown.append(line)
+
+
 async def process_update(bot, interaction: discord.Interaction, new_gw2_id: str):
-    # Fetch the guild roster from the GW2 API
-    response = requests.get(f"https://api.guildwars2.com/v2/guild/{GUILD_ID}/members",
-                            headers={"Authorization": f"Bearer {API_KEY}"})
-    if response.status_code != 200:
+    # Fetch the guild roster from the GW2 API (and store it for other commands)
+    status, guild_roster = refresh_guild_roster(interaction.guild_id)
+    if guild_roster is None:
         await interaction.followup.send("Failed to fetch guild roster. Please try again later.")
         return
-    guild_roster = response.json()
 
     # Check if the provided GW2 ID matches any member in the guild roster
     matching_member = next((m for m in guild_roster if m['name'].lower() == new_gw2_id.lower()), None)
 
     if matching_member:
-        # Connect to the database
-        conn = sqlite3.connect(CURRENT_DB_FILENAME)
-        cursor = conn.cursor()
+        users = get_storage(interaction.guild_id).users
 
-        try:
-            # Fetch current user data
-            cursor.execute("SELECT gw2_id, alt_gw2_id FROM users WHERE discord_id = ?", (str(interaction.user.id),))
-            current_data = cursor.fetchone()
-            current_main_id, current_alt_id = current_data if current_data else (None, None)
-
-            swapped = False
-            # Check if we're swapping main and alt
-            if new_gw2_id == current_alt_id:
-                new_main_id, new_alt_id = current_alt_id, current_main_id
-                swapped = True
-            else:
-                new_main_id, new_alt_id = new_gw2_id, current_alt_id
+        # Fetch current user data
+        current_data = users.get(interaction.user.id)
+        current_main_id, current_alt_id = (current_data.gw2_id, current_data.alt_gw2_id) if current_data else (None, None)
 
-            # Check for conflicts with existing accounts
-            cursor.execute("SELECT discord_id FROM users WHERE gw2_id = ? OR alt_gw2_id = ?",
-                           (new_main_id, new_main_id))
-            existing_user = cursor.fetchone()
-            if existing_user and str(existing_user[0]) != str(interaction.user.id):
-                await interaction.followup.send(
-                    f"This Guild Wars 2 ID ({new_main_id}) is already associated with another Discord account. Contact staff if you believe this is an error.",
-                    ephemeral=True)
-                mentors_channel = self.bot.get_channel(CHANNEL_ID_MENTORS)
-                if mentors_channel:
-                    await mentors_channel.send(
-                        f"🚨 __**Suspicious Activity**__ 🚨\n\n"
-                        f"User {interaction.user.mention} attempted to verify with GW2 ID:\n\n"
-                        f"*{new_main_id}*\n\n"
-                        f"This ID is already associated with <@{existing_user[0]}>.")
-                return
-
-            # Update the user's GW2 ID in the database
-            cursor.execute("UPDATE users SET gw2_id = ?, alt_gw2_id = ?, guild_status = ? WHERE discord_id = ?",
-                           (new_main_id, new_alt_id, "Member", str(interaction.user.id)))
-            conn.commit()
+        swapped = False
+        # Check if we're swapping main and alt
+        if new_gw2_id == current_alt_id:
+            new_main_id, new_alt_id = current_alt_id, current_main_id
+            swapped = True
+        else:
+            new_main_id, new_alt_id = new_gw2_id, current_alt_id
 
-            if swapped:
-                await interaction.followup.send(
-                    f"Your main and alt Guild Wars 2 IDs have been swapped. Main ID is now {new_main_id}.",
-                    ephemeral=True)
-            else:
-                await interaction.followup.send(f"Your Guild Wars 2 ID has been updated to {new_main_id}.",
-                                                ephemeral=True)
+        # Check for conflicts with existing accounts
+        existing_user = users.owner_of(new_main_id)
+        if existing_user and str(existing_user) != str(interaction.user.id):
+            await interaction.followup.send(
+                f"This Guild Wars 2 ID ({new_main_id}) is already associated with another Discord account. Contact staff if you believe this is an error.",
+                ephemeral=True)
+            await notify_mentors(
+                bot, interaction.guild_id, 'suspicious',
+                f"🚨 __**Suspicious Activity**__ 🚨\n\n"
+                f"User {interaction.user.mention} attempted to verify with GW2 ID:\n\n"
+                f"*{new_main_id}*\n\n"
+                f"This ID is already associated with <@{existing_user}>.", urgent=True)
+            return
 
-            # Notify mentors
-            mentors_channel = bot.get_channel(CHANNEL_ID_MENTORS)
-            if mentors_channel:
-                if swapped:
-                    await mentors_channel.send(
-                        f"{interaction.user.mention} has swapped their main and alt GW2 IDs. Main ID is now {new_main_id}.")
-                else:
-                    await mentors_channel.send(
-                        f"{interaction.user.mention} has updated their GW2 ID to {new_main_id}.")
+        # Update the user's GW2 ID in the database, notifying mentors through the outbox
+        if swapped:
+            notification = f"{interaction.user.mention} has swapped their main and alt GW2 IDs. Main ID is now {new_main_id}."
+        else:
+            notification = f"{interaction.user.mention} has updated their GW2 ID to {new_main_id}."
+        users.set_gw2_ids(interaction.user.id, new_main_id, new_alt_id if swapped else None,
+                          effects=[mentors_post('id_update', notification, f"{interaction.id}:mentors")])
 
-        finally:
-            conn.close()
+        if swapped:
+            await interaction.followup.send(
+                f"Your main and alt Guild Wars 2 IDs have been swapped. Main ID is now {new_main_id}.",
+                ephemeral=True)
+        else:
+            await interaction.followup.send(f"Your Guild Wars 2 ID has been updated to {new_main_id}.",
+                                            ephemeral=True)
     else:
         # Explain possible reasons for not finding a match
         await interaction.followup.send(
             f"The GW2 ID {new_gw2_id} was not found in the guild roster. This might be because:\n"
             f"- There is a typo in the ID provided\n"
             f"- You are not currently a member of the guild\n"
-            f"- The API key has not updated yet. Please wait about 10 minutes and try verifying again.",
+            f"- The API key has not updated yet. Please wait about 10 minutes and try verifying again."
+            + did_you_mean(suggest_gw2_ids(interaction.guild_id, guild_roster, new_gw2_id)),
             ephemeral=True)
 
         # Ask if the user needs an invitation
-        view = discord.ui.View()
-        view.add_item(discord.ui.Button(label="Yes", style=discord.ButtonStyle.green, custom_id="yes"))
-        view.add_item(discord.ui.Button(label="No", style=discord.ButtonStyle.red, custom_id="no"))
+        view = routed_view(
+            RoutedButton('invite-needed', new_gw2_id, label="Yes", style=discord.ButtonStyle.green),
+            RoutedButton('invite-not-needed', label="No", style=discord.ButtonStyle.red))
 
         await interaction.followup.send("Do you need an invitation to the guild?", view=view, ephemeral=True)
 
-        try:
-            interaction_response = await self.bot.wait_for(
-                "interaction",
-                check=lambda i: i.user.id == interaction.user.id and i.data["custom_id"] in ["yes", "no"],
-                timeout=180.0
-            )
 
-            if interaction_response.data["custom_id"] == "yes":
-                await interaction_response.response.send_message(
-                    "[DPS] staff has been notified to invite you back to the guild.\n\n"
-                    "Please run this command again once you've joined the guild.", ephemeral=True)
-
-                # Notify mentors
-                mentors_channel = self.bot.get_channel(CHANNEL_ID_MENTORS)
-                if mentors_channel:
-                    view = discord.ui.View().add_item(InvitationButton(new_gw2_id))
-                    await mentors_channel.send(
-                        f"🚨 __**Attention Needed**__ 🚨\n\n"
-                        f"{interaction.user.mention} needs to be invited to the guild with GW2 ID: {new_gw2_id}\n"
-                        f"Please invite them back to the guild.", view=view)
-            else:
-                await interaction_response.response.send_message(
-                    "Alright, the process has been interrupted. No changes have been made to your GW2 ID.",
-                    ephemeral=True)
+@component_handler('invite-needed')
+async def invite_needed(interaction: discord.Interaction, new_gw2_id):
+    # Replacing the question removes the buttons, so the mentors are notified once
+    await interaction.response.edit_message(
+        content="[DPS] staff has been notified to invite you back to the guild.\n\n"
+                "Please run this command again once you've joined the guild.", view=None)
 
-        except asyncio.TimeoutError:
-            await interaction.followup.send("You didn't respond in time. No changes have been made to your GW2 ID.",
-                                            ephemeral=True)
+    # Notify mentors
+    await notify_mentors(
+        interaction.client, interaction.guild_id, 'invite',
+        f"🚨 __**Attention Needed**__ 🚨\n\n"
+        f"{interaction.user.mention} needs to be invited to the guild with GW2 ID: {new_gw2_id}\n"
+        f"Please invite them back to the guild.",
+        summary=f"{interaction.user.mention} needs to be invited back with GW2 ID: `{new_gw2_id}`",
+        buttons=[invitation_button(new_gw2_id)], label=new_gw2_id)
+
+
+@component_handler('invite-not-needed')
+async def invite_not_needed(interaction: discord.Interaction):
+    await interaction.response.edit_message(
+        content="Alright, the process has been interrupted. No changes have been made to your GW2 ID.", view=None)
+
+
+# -------------- Outbox buttons ----------------
+# Buttons of mentors channel posts sent through the outbox, rebuilt when the post is delivered
+async def build_welcome_button(client, guild_id, user_id):
+    guild = client.get_guild(guild_id)
+    member = await get_or_fetch_member(guild, user_id) if guild else None
+    return welcome_button(user_id) if member else None
+
+
+async def build_warnings_button(client, guild_id, discord_id):
+    return warnings_button(discord_id)
+
+
+register_button('welcome', build_welcome_button)
+register_button('warnings', build_warnings_button)
 
 
 # -------------- Cogs ----------------
@@ -799,7 +843,7 @@ class ConfirmationCog(commands.Cog):
         self.bot = bot
 
     @app_commands.command(name="verify", description="Verify your GW2 ID with the guild roster")
-    @app_commands.checks.has_role(ROLE_ID_CONFIRMATION)
+    @has_guild_role('confirmation')
     async def verify(self, interaction: discord.Interaction):
 
         # Display the modal to collect the GW2 ID
@@ -807,13 +851,11 @@ class ConfirmationCog(commands.Cog):
 
     async def process_verification(self, interaction: discord.Interaction, gw2_id: str,
                                    target_user: discord.Member = None):
-        # Fetch the guild roster from the GW2 API
-        response = requests.get(f"https://api.guildwars2.com/v2/guild/{GUILD_ID}/members",
-                                headers={"Authorization": f"Bearer {API_KEY}"})
-        if response.status_code != 200:
+        # Fetch the guild roster from the GW2 API (and store it for other commands)
+        status, guild_roster = refresh_guild_roster(interaction.guild_id)
+        if guild_roster is None:
             await interaction.followup.send("Failed to fetch guild roster. Please try again later.", ephemeral=True)
             return
-        guild_roster = response.json()
 
         # Check if the provided GW2 ID matches any member in the guild roster
         matching_member = next((m for m in guild_roster if m['name'].lower() == gw2_id.lower()), None)
@@ -822,52 +864,40 @@ class ConfirmationCog(commands.Cog):
         user_to_verify = target_user or interaction.user
 
         if matching_member:
-            # Connect to the database (using sqlite3, which is synchronous)
-            conn = sqlite3.connect(CURRENT_DB_FILENAME)
-            cursor = conn.cursor()
+            users = get_storage(interaction.guild_id).users
 
             # Check if the GW2 ID is already associated with another Discord account
-            cursor.execute("SELECT discord_id FROM users WHERE gw2_id = ?", (gw2_id,))
-            existing_user = cursor.fetchone()
+            existing_user = users.owner_of(gw2_id, include_alt=False)
             if existing_user:
                 await interaction.followup.send(
                     f"This Guild Wars 2 ID ({gw2_id}) is already associated with another Discord account. Contact staff if you believe this is an error.",
                     ephemeral=True)
-                mentors_channel = self.bot.get_channel(CHANNEL_ID_MENTORS)
-                if mentors_channel:
-                    await mentors_channel.send(
-                        f"🚨 __**Suspicious Activity**__ 🚨\n\n"
-                        f"User {user_to_verify.mention} attempted to verify with GW2 ID:\n\n"
-                        f"*{gw2_id}*\n\n"
-                        f"This ID is already associated with <@{existing_user[0]}>.")
-                conn.close()
+                await notify_mentors(
+                    self.bot, interaction.guild_id, 'suspicious',
+                    f"🚨 __**Suspicious Activity**__ 🚨\n\n"
+                    f"User {user_to_verify.mention} attempted to verify with GW2 ID:\n\n"
+                    f"*{gw2_id}*\n\n"
+                    f"This ID is already associated with <@{existing_user}>.", urgent=True)
                 return
 
-            # If a match is found, add the GW2 ID to the database and assign the member role
-            cursor.execute("INSERT OR REPLACE INTO users (discord_id, gw2_id, guild_status) VALUES (?, ?, ?)",
-                           (str(user_to_verify.id), matching_member['name'], 'Member'))
-            conn.commit()
-            conn.close()
+            # If a match is found, add the GW2 ID to the database. The member role (replacing all other roles
+            # except the default one) and the mentors notification are delivered by the outbox.
+            users.link(user_to_verify.id, matching_member['name'], effects=[
+                role_update(user_to_verify.id, f"{interaction.id}:roles",
+                            add=[get_guild_config(interaction.guild_id).role_member], remove_all=True),
+                mentors_post('verification',
+                             f"{user_to_verify.mention} has been verified with GW2 ID: {matching_member['name']}",
+                             f"{interaction.id}:mentors", buttons=[('welcome', user_to_verify.id)],
+                             label=user_to_verify.display_name),
+            ])
 
-            # Remove all roles from the user except the default role
-            roles_to_remove = [role for role in user_to_verify.roles if role != interaction.guild.default_role]
-            await user_to_verify.remove_roles(*roles_to_remove)
-
-            # Add the member role
-            member_role = discord.utils.get(interaction.guild.roles, id=ROLE_ID_MEMBER)
-            if member_role:
-                await user_to_verify.add_roles(member_role)
+            if target_user is not None:
+                audit(interaction, 'gw2id_verify', user_to_verify.id, matching_member['name'])
 
             await interaction.followup.send(
                 f"__**Verification successful!**__\n\n"
                 f"The GW2 ID ({matching_member['name']}) has been added to our database and {user_to_verify.mention} has been assigned the member role.",
                 ephemeral=True)
-
-            mentors_channel = self.bot.get_channel(CHANNEL_ID_MENTORS)
-            if mentors_channel:
-                view = discord.ui.View().add_item(WelcomeButton(user_to_verify))
-                await mentors_channel.send(
-                    f"{user_to_verify.mention} has been verified with GW2 ID: {matching_member['name']}", view=view)
         else:
             # If no match is found, notify the user
             await interaction.followup.send(
@@ -877,7 +907,8 @@ class ConfirmationCog(commands.Cog):
                 f"was not found in the guild roster. This might be because:\n"
                 f"- there is a typo in the ID provided\n"
                 f"- the user is not currently a member of the guild\n"
-                f"- the API key has not updated yet. Please wait about 10 minutes and try verifying again.",
+                f"- the API key has not updated yet. Please wait about 10 minutes and try verifying again."
+                + did_you_mean(suggest_gw2_ids(interaction.guild_id, guild_roster, gw2_id)),
                 ephemeral=True)
 
     @verify.error
@@ -890,12 +921,12 @@ class ConfirmationCog(commands.Cog):
             await interaction.response.send_message(f"An error occurred: {str(error)}", ephemeral=True)
 
     @app_commands.command(name="guest", description="Assign the guest role to a user")
-    @app_commands.checks.has_role(ROLE_ID_CONFIRMATION)
+    @has_guild_role('confirmation')
     async def guest(self, interaction: discord.Interaction):
         """Command to assign the guest role to a user."""
         await interaction.response.defer(ephemeral=True)
 
-        guest_role = discord.utils.get(interaction.guild.roles, id=ROLE_ID_GUEST)
+        guest_role = discord.utils.get(interaction.guild.roles, id=get_guild_config(interaction.guild_id).role_guest)
         if not guest_role:
             await interaction.followup.send("Error: Guest role not found.", ephemeral=True)
             return
@@ -924,32 +955,20 @@ class ConfirmationCog(commands.Cog):
             await interaction.response.send_message(f"An error occurred: {str(error)}", ephemeral=True)
 
     @app_commands.command(name="guild-invite", description="Request an invitation to the guild")
-    @app_commands.checks.has_any_role(ROLE_ID_MEMBER, ROLE_ID_CONFIRMATION)
+    @has_guild_role('member', 'confirmation')
     async def guild_invite(self, interaction: discord.Interaction):
         # Check if the user has the member role
-        for_member = discord.utils.get(interaction.user.roles, id=ROLE_ID_MEMBER) is not None
+        for_member = discord.utils.get(interaction.user.roles, id=get_guild_config(interaction.guild_id).role_member) is not None
 
         # If user is a member, ask if the invite is for them or a friend
         if for_member:
             # Create the view with two buttons for "Me" and "Friend"
-            view = View()
-            view.add_item(Button(label="Me", style=discord.ButtonStyle.primary, custom_id="invite_me"))
-            view.add_item(Button(label="Friend", style=discord.ButtonStyle.primary, custom_id="invite_friend"))
+            view = routed_view(RoutedButton('guild-invite-request', 'me', label="Me"),
+                               RoutedButton('guild-invite-request', 'friend', label="Friend"))
 
             # Send the response with the buttons
             await interaction.response.send_message("Is this invite for you or a friend?", view=view, ephemeral=True)
 
-            # Handle button interaction
-            def check(button_interaction: discord.Interaction):
-                return button_interaction.data["custom_id"] in ["invite_me", "invite_friend"]
-
-            button_interaction = await interaction.client.wait_for("interaction", check=check)
-
-            if button_interaction.data["custom_id"] == "invite_me":
-                await button_interaction.response.send_modal(GuildInviteRequestModal("me"))
-            else:
-                await button_interaction.response.send_modal(GuildInviteRequestModal("friend"))
-
         else:
             # If the user is in the confirmation role, directly ask for the GW2 ID
             await interaction.response.send_modal(GuildInviteRequestModal("me"))
@@ -965,12 +984,17 @@ class ConfirmationCog(commands.Cog):
             await interaction.response.send_message(f"An error occurred: {str(error)}", ephemeral=True)
 
 
+@component_handler('guild-invite-request')
+async def request_guild_invite(interaction: discord.Interaction, invite_for):
+    await interaction.response.send_modal(GuildInviteRequestModal(invite_for))
+
+
 class MemberCog(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
 
     @app_commands.command(name="birthday", description="Set or remove your birthday")
-    @app_commands.checks.has_role(ROLE_ID_MEMBER)
+    @has_guild_role('member')
     @app_commands.choices(action=[app_commands.Choice(name="Set your birthday", value="set"),
                                   app_commands.Choice(name="Remove your birthday", value="remove")])
     async def birthday(self, interaction: discord.Interaction, action: str):
@@ -978,15 +1002,11 @@ class MemberCog(commands.Cog):
         if action == "set":
             await interaction.response.send_modal(BirthdayModal(self))
         elif action == "remove":
-            conn = sqlite3.connect(CURRENT_DB_FILENAME)
-            c = conn.cursor()
-
             try:
-                c.execute("UPDATE users SET birthday = '-' WHERE discord_id = ?", (str(interaction.user.id),))
-                conn.commit()
+                get_storage(interaction.guild_id).users.set_birthday(interaction.user.id, NO_BIRTHDAY)
 
                 # Remove birthday role if present
-                birthday_role = interaction.guild.get_role(ROLE_ID_BIRTHDAY)
+                birthday_role = interaction.guild.get_role(get_guild_config(interaction.guild_id).role_birthday)
                 if birthday_role and birthday_role in interaction.user.roles:
                     await interaction.user.remove_roles(birthday_role)
 
@@ -994,8 +1014,6 @@ class MemberCog(commands.Cog):
             except sqlite3.Error as e:
                 await interaction.response.send_message(f"An error occurred while removing your birthday: {e}",
                                                         ephemeral=True)
-            finally:
-                conn.close()
 
     @birthday.error
     async def birthday_error(self, interaction: discord.Interaction, error):
@@ -1005,7 +1023,7 @@ class MemberCog(commands.Cog):
             await interaction.response.send_message(f"An error occurred: {str(error)}", ephemeral=True)
 
     @app_commands.command(name="apply-mentor", description="Apply for a staff position in [DPS]")
-    @app_commands.checks.has_role(ROLE_ID_MEMBER)
+    @has_guild_role('member')
     async def apply_mentor(self, interaction: discord.Interaction):
         embed = discord.Embed(
             title="<:DPS:858334399950487562> [DPS] Staff Member Application <:DPS:858334399950487562>",
@@ -1034,8 +1052,7 @@ class MemberCog(commands.Cog):
             color=discord.Color.blue()
         )
 
-        view = discord.ui.View()
-        view.add_item(ApplicationModalButton(bot=self.bot))
+        view = routed_view(RoutedButton('apply-mentor', label="Apply"))
 
         await interaction.response.send_message(embed=embed, view=view, ephemeral=True)
 
@@ -1049,36 +1066,23 @@ class MemberCog(commands.Cog):
 
     @app_commands.command(name="whois", description="Get user information")
     @app_commands.describe(identifier="The user's @mention, Discord ID, or GW2 ID")
-    @app_commands.checks.has_role(ROLE_ID_MEMBER)
+    @app_commands.autocomplete(identifier=identifier_autocomplete('member'))
+    @has_guild_role('member')
     async def whois(self, interaction: discord.Interaction, identifier: str):
         await interaction.response.defer(ephemeral=True)
 
-        conn = None
         try:
-            conn = sqlite3.connect(CURRENT_DB_FILENAME)
-            c = conn.cursor()
+            storage = get_storage(interaction.guild_id)
 
             # Find user in database
-            discord_id = identifier[2:-1] if identifier.startswith('<@') and identifier.endswith('>') else identifier
-            discord_id = discord_id[1:] if discord_id.startswith('!') else discord_id
-
-            for query in [
-                "SELECT * FROM users WHERE discord_id = ?",
-                "SELECT * FROM users WHERE gw2_id = ?",
-                "SELECT * FROM users WHERE alt_gw2_id = ?"
-            ]:
-                c.execute(query, (discord_id,))
-                user_data = c.fetchone()
-                if user_data:
-                    break
+            user_data = storage.users.find(identifier)
 
             if not user_data:
                 await interaction.followup.send("User not found in the database.", ephemeral=True)
                 return
 
-            column_names = [description[0] for description in c.description]
-            discord_user = await self.bot.fetch_user(int(user_data[column_names.index('discord_id')]))
-            discord_member = interaction.guild.get_member(discord_user.id)
+            discord_user = await self.bot.fetch_user(user_data.discord_id)
+            discord_member = await get_or_fetch_member(interaction.guild, discord_user.id)
 
             embed = discord.Embed(color=discord_member.color if discord_member else discord.Color.blue())
             embed.set_author(name=f"{discord_member.display_name if discord_member else discord_user.name}",
@@ -1086,13 +1090,16 @@ class MemberCog(commands.Cog):
             embed.set_thumbnail(url=discord_user.display_avatar.url)
             embed.description = f"{discord_user.mention}"
 
+            # Staff and famed members see the alt account and extra details
+            guild_config = get_guild_config(interaction.guild_id)
+            is_staff = any(role.id in [guild_config.role_staff, guild_config.role_famed_member]
+                           for role in interaction.user.roles)
+
             # Common fields
-            gw2_id, guild_status = user_data[column_names.index('gw2_id')], user_data[
-                column_names.index('guild_status')]
-            alt_gw2_id, alt_guild_status = user_data[column_names.index('alt_gw2_id')], user_data[
-                column_names.index('alt_guild_status')]
+            gw2_id, guild_status = user_data.gw2_id, GuildStatus(user_data.guild_status).label
+            alt_gw2_id, alt_guild_status = user_data.alt_gw2_id, GuildStatus(user_data.alt_guild_status).label
 
-            if any(role.id in [ROLE_ID_STAFF, ROLE_ID_FAMED_MEMBER] for role in interaction.user.roles):
+            if is_staff:
                 embed.add_field(name="🆔 Guild Wars 2", value=f"{gw2_id}\n{alt_gw2_id}", inline=True)
                 embed.add_field(name="🎖️ Guild Status", value=f"{guild_status}\n{alt_guild_status}", inline=True)
             else:
@@ -1100,22 +1107,18 @@ class MemberCog(commands.Cog):
                 embed.add_field(name="🎖️ Guild Status", value=guild_status, inline=True)
             embed.add_field(name="\u200b", value="", inline=False)
 
-            # Fetch guild roster and get join date
-            response = requests.get(f"https://api.guildwars2.com/v2/guild/{GUILD_ID}/members",
-                                    headers={"Authorization": f"Bearer {API_KEY}"})
-            if response.status_code != 200:
+            # Get the join date from the stored guild roster
+            if not ensure_guild_roster(interaction.guild_id):
                 await interaction.followup.send("Failed to fetch the guild roster. Please try again later.",
                                                 ephemeral=True)
                 return
 
-            guild_roster = response.json()
-            gw2_join_date = next(
-                (member.get('joined') for member in guild_roster if member["name"].lower() == gw2_id.lower()), None)
+            gw2_join_date = storage.roster.joined(gw2_id)
             joined_gw2_date = datetime.strptime(gw2_join_date, "%Y-%m-%dT%H:%M:%S.%fZ").strftime(
                 "%b %d, %Y") if gw2_join_date else "-"
 
             embed.add_field(name="📅 Guild joined", value=joined_gw2_date, inline=True)
-            embed.add_field(name="🎂 Birthday", value=user_data[column_names.index('birthday')], inline=True)
+            embed.add_field(name="🎂 Birthday", value=format_birthday(user_data.birthday), inline=True)
             embed.add_field(name="\u200b", value="", inline=False)
 
             if discord_member:
@@ -1124,7 +1127,7 @@ class MemberCog(commands.Cog):
                                 inline=False)
 
             # Additional information for staff and famed members
-            if any(role.id in [ROLE_ID_STAFF, ROLE_ID_FAMED_MEMBER] for role in interaction.user.roles):
+            if is_staff:
                 if discord_member:
                     permissions = []
                     if discord_member.guild_permissions.administrator:
@@ -1145,23 +1148,22 @@ class MemberCog(commands.Cog):
                 if acknowledgements:
                     embed.add_field(name="🏆 Acknowledgements", value=", ".join(acknowledgements), inline=True)
 
-                watchlist_status = "Yes" if user_data[5] != '-' else "No"
+                watchlist_status = "Yes" if user_data.on_watchlist else "No"
                 embed.add_field(name="\u200b", value="", inline=False)
                 embed.add_field(name="🚨 On watchlist", value=watchlist_status, inline=True)
 
-                c.execute("SELECT * FROM warnings WHERE discord_id = ?", (user_data[0],))
-                warnings = c.fetchall()
+                warnings = storage.warnings.for_user(user_data.discord_id)
                 embed.add_field(name="⚠️ Warnings", value=str(len(warnings)), inline=True)
 
                 embed.set_footer(text=f"ID: {discord_user.id} • {datetime.now().strftime('%m/%d/%Y %I:%M %p')}")
 
                 if watchlist_status == "Yes":
                     embed.add_field(name="\u200b", value="", inline=False)
-                    embed.add_field(name="Watchlist Reason", value=f"{user_data[5]}", inline=False)
+                    embed.add_field(name="Watchlist Reason", value=f"{user_data.watchlist_reason}", inline=False)
 
-                view = discord.ui.View()
+                view = routed_view()
                 if warnings:
-                    view.add_item(WarningsButton(self, user_data[0], warnings))
+                    view.add_item(warnings_button(user_data.discord_id))
                 await interaction.followup.send(embed=embed, view=view)
             else:
                 await interaction.followup.send(embed=embed)
@@ -1172,9 +1174,6 @@ class MemberCog(commands.Cog):
             await interaction.followup.send(f"An error occurred while sending the message: {e}", ephemeral=True)
         except Exception as e:
             await interaction.followup.send(f"An unexpected error occurred: {e}", ephemeral=True)
-        finally:
-            if conn:
-                conn.close()
 
     @whois.error
     async def whois_error(self, interaction: discord.Interaction, error):
@@ -1185,7 +1184,7 @@ class MemberCog(commands.Cog):
             await interaction.response.send_message(f"An error occurred: {str(error)}", ephemeral=True)
 
     @app_commands.command(name="gw2id", description="Update or remove your Guild Wars 2 ID")
-    @app_commands.checks.has_role(ROLE_ID_MEMBER)
+    @has_guild_role('member')
     @app_commands.choices(action=[
         app_commands.Choice(name="Update", value="update"),
         app_commands.Choice(name="Remove", value="remove")
@@ -1194,16 +1193,11 @@ class MemberCog(commands.Cog):
         if action.value == "update":
             await interaction.response.send_modal(GW2IDUpdateModal(self.bot))
         elif action.value == "remove":
-            conn = sqlite3.connect(CURRENT_DB_FILENAME)
-            c = conn.cursor()
             try:
-                c.execute("UPDATE users SET gw2_id = '-', guild_status = '-' WHERE discord_id = ?", (str(interaction.user.id),))
-                conn.commit()
+                get_storage(interaction.guild_id).users.clear_gw2_id(interaction.user.id)
                 await interaction.response.send_message("Your Guild Wars 2 ID has been removed.", ephemeral=True)
             except sqlite3.Error as e:
                 await interaction.response.send_message(f"An error occurred: {e}", ephemeral=True)
-            finally:
-                conn.close()
 
     @gw2id.error
     async def gw2id_error(self, interaction: discord.Interaction, error):
@@ -1219,6 +1213,20 @@ class StaffCog(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
 
+    # Keep the member names of the identifier autocomplete current
+    @commands.Cog.listener()
+    async def on_member_join(self, member: discord.Member):
+        member_updated(member)
+
+    @commands.Cog.listener()
+    async def on_member_update(self, before: discord.Member, after: discord.Member):
+        if before.display_name != after.display_name:
+            member_updated(after)
+
+    @commands.Cog.listener()
+    async def on_raw_member_remove(self, payload: discord.RawMemberRemoveEvent):
+        member_removed(payload.guild_id, payload.user.id)
+
     @app_commands.command(name="admin-gw2id",
                           description="Admin command to verify, update, or remove a user's Guild Wars 2 ID")
     @app_commands.describe(
@@ -1236,7 +1244,7 @@ class StaffCog(commands.Cog):
         app_commands.Choice(name="Main ID", value="main"),
         app_commands.Choice(name="Alt ID", value="alt")
     ])
-    @app_commands.checks.has_any_role(ROLE_ID_STAFF)
+    @has_guild_role('staff')
     async def admin_gw2id(self, interaction: discord.Interaction, action: str, user: discord.Member,
                           gw2_id: str = None, id_type: str = None):
 
@@ -1260,26 +1268,18 @@ class StaffCog(commands.Cog):
                                                         ephemeral=True)
                 return
 
-            conn = sqlite3.connect(CURRENT_DB_FILENAME)
-            c = conn.cursor()
-
             try:
                 # Remove based on id_type (main or alt)
+                get_storage(interaction.guild_id).users.clear_gw2_id(user.id, alt=id_type == "alt")
+                audit(interaction, 'gw2id_remove', user.id, f"{id_type} ID")
                 if id_type == "main":
-                    c.execute("UPDATE users SET gw2_id = '-', guild_status = '-' WHERE discord_id = ?", (str(user.id),))
                     message = "Main Guild Wars 2 ID has been removed."
-                elif id_type == "alt":
-                    c.execute("UPDATE users SET alt_gw2_id = '-', alt_guild_status = '-' WHERE discord_id = ?",
-                              (str(user.id),))
+                else:
                     message = "Alt Guild Wars 2 ID has been removed."
 
-                conn.commit()
-
                 await interaction.response.send_message(message, ephemeral=True)
             except sqlite3.Error as e:
                 await interaction.response.send_message(f"An error occurred while removing the ID: {e}", ephemeral=True)
-            finally:
-                conn.close()
 
     @admin_gw2id.error
     async def admin_gw2id_error(self, interaction: discord.Interaction, error):
@@ -1298,7 +1298,8 @@ class StaffCog(commands.Cog):
         app_commands.Choice(name="Ban User", value="ban"),
         app_commands.Choice(name="View Ban List", value="list")
     ])
-    @app_commands.checks.has_any_role(ROLE_ID_STAFF)
+    @app_commands.autocomplete(user=identifier_autocomplete('staff'))
+    @has_guild_role('staff')
     async def ban(self, interaction: discord.Interaction, action: str, user: str = None, reason: str = None):
         await interaction.response.defer(ephemeral=True)
 
@@ -1322,15 +1323,11 @@ class StaffCog(commands.Cog):
                 user_to_ban = await interaction.guild.fetch_member(discord_id)
 
                 # Update the database
-                conn = sqlite3.connect(CURRENT_DB_FILENAME)
-                c = conn.cursor()
-                c.execute("INSERT OR REPLACE INTO bans (discord_id, reason, date) VALUES (?, ?, ?)",
-                          (discord_id, reason, datetime.now().isoformat()))
-                conn.commit()
-                conn.close()
+                get_storage(interaction.guild_id).bans.add(discord_id, reason, now_epoch())
 
                 # Ban the user from the server
                 await interaction.guild.ban(user_to_ban, reason=reason)
+                audit(interaction, 'ban', discord_id, reason)
 
                 await interaction.followup.send(
                     f"{user_to_ban.display_name} has been banned from the server. Reason: {reason}")
@@ -1346,23 +1343,13 @@ class StaffCog(commands.Cog):
                 await interaction.followup.send("The provided identifier is not a valid user ID.")
 
         elif action == "list":
-            def format_date(date_string):
-                try:
-                    date_obj = datetime.fromisoformat(date_string)
-                    return date_obj.strftime("%B %d %Y at %I:%M %p")  # e.g., "July 14 2024 at 11:47 PM"
-                except ValueError:
-                    return "Unknown Date"
-
             try:
                 # Fetch bans from the Discord server
                 guild_bans = [ban_entry async for ban_entry in interaction.guild.bans()]
 
                 # Fetch bans from the database
-                conn = sqlite3.connect(CURRENT_DB_FILENAME)
-                c = conn.cursor()
-                c.execute("SELECT discord_id, reason, date FROM bans")
-                db_bans = {ban[0]: ban for ban in c.fetchall()}
-                conn.close()
+                bans = get_storage(interaction.guild_id).bans
+                db_bans = bans.all()
 
                 # If a user is specified, filter the bans
                 if user:
@@ -1379,39 +1366,11 @@ class StaffCog(commands.Cog):
                     guild_bans = filtered_bans
 
                 # Combine and format the ban information
-                ban_info = []
-                for ban_entry in guild_bans:
-                    user = ban_entry.user
-                    reason = ban_entry.reason or "No reason provided"
-                    db_record = db_bans.get(str(user.id))
-
-                    if db_record:
-                        date = format_date(db_record[2])
-                        del db_bans[str(user.id)]
-                    else:
-                        date = format_date(datetime.now().isoformat())
-                        with sqlite3.connect(CURRENT_DB_FILENAME) as conn:
-                            c = conn.cursor()
-                            c.execute("INSERT OR REPLACE INTO bans (discord_id, reason, date) VALUES (?, ?, ?)",
-                                      (str(user.id), reason, datetime.now().isoformat()))
-
-                    ban_info.append({
-                        "name": f"{user.name} (ID: {user.id})",
-                        "value": f"- Reason: {reason}\n- Date: {date}",
-                        "inline": False
-                    })
-
-                # Sort ban_info by date in descending order
-                ban_info.sort(
-                    key=lambda x: datetime.strptime(x["value"].split("\n- Date: ")[1], "%B %d %Y at %I:%M %p"),
-                    reverse=True)
-
-                # Remove bans from the database that aren't in the server bans (only if not filtering)
-                if not user:
-                    for db_ban_id in db_bans.keys():
-                        with sqlite3.connect(CURRENT_DB_FILENAME) as conn:
-                            c = conn.cursor()
-                            c.execute("DELETE FROM bans WHERE discord_id = ?", (db_ban_id,))
+                ban_info, missing_bans, stale_ban_ids = build_ban_list(guild_bans, db_bans)
+
+                # Record server bans that were made outside of the bot and remove bans from the database that
+                # aren't in the server bans (only if not filtering)
+                bans.sync(missing_bans, stale_ban_ids if not user else ())
 
                 # Create embeds
                 embeds = []
@@ -1423,23 +1382,14 @@ class StaffCog(commands.Cog):
                     embed.set_footer(text=f"Page {len(embeds) + 1}/{-(-len(ban_info) // chunk_size)}")
                     embeds.append(embed)
 
-                script_dir = os.path.dirname(os.path.abspath(__file__))
-                thumbnail_path = os.path.join(script_dir, "pictures", "Banlist.png")
-
-                if os.path.exists(thumbnail_path):
-                    file = discord.File(thumbnail_path, filename="Banlist.png")
-                    if file:
-                        for embed in embeds:
-                            embed.set_thumbnail(url="attachment://Banlist.png")
-                else:
-                    file = None
-                    print(f"Thumbnail file not found at: {thumbnail_path}")
-
                 if not embeds:
                     await interaction.followup.send("There are no banned users.", ephemeral=True)
                 else:
+                    files = []
+                    for embed in embeds:
+                        files = await ASSETS.thumbnail(embed, "Banlist.png")
                     paginator = Paginator(embeds)
-                    await interaction.followup.send(file=file, embed=embeds[0], view=paginator, ephemeral=True)
+                    await interaction.followup.send(files=files, embed=embeds[0], view=paginator, ephemeral=True)
 
             except discord.Forbidden:
                 await interaction.followup.send("I do not have permission to view the ban list.")
@@ -1476,27 +1426,14 @@ class StaffCog(commands.Cog):
         app_commands.Choice(name="Add", value="add"),
         app_commands.Choice(name="Remove", value="remove")
     ])
-    @app_commands.checks.has_any_role(ROLE_ID_STAFF, ROLE_ID_FAMED_MEMBER)
+    @app_commands.autocomplete(identifier=identifier_autocomplete('staff', 'famed_member'))
+    @has_guild_role('staff', 'famed_member')
     async def watchlist(self, interaction: discord.Interaction, action: str, identifier: str):
-        conn = None
         try:
-            conn = sqlite3.connect(CURRENT_DB_FILENAME)
-            c = conn.cursor()
+            storage = get_storage(interaction.guild_id)
 
-            # Try to find the user by Discord ID/mention
-            if identifier.startswith('<@') and identifier.endswith('>'):
-                discord_id = identifier.strip('<@!>')
-            else:
-                discord_id = identifier
-
-            # Check if it's a Discord ID
-            c.execute("SELECT * FROM users WHERE discord_id = ?", (discord_id,))
-            user_data = c.fetchone()
-
-            # If not found, try to find by GW2 ID
-            if not user_data:
-                c.execute("SELECT * FROM users WHERE gw2_id = ? OR alt_gw2_id = ?", (identifier, identifier))
-                user_data = c.fetchone()
+            # Find the user by Discord ID/mention or GW2 ID
+            user_data = storage.users.find(identifier)
 
             if not user_data:
                 await interaction.response.send_message("User not found. Please check the identifier and try again.",
@@ -1505,23 +1442,18 @@ class StaffCog(commands.Cog):
 
             if action == "add":
                 # Open the modal directly
-                await interaction.response.send_modal(AddToWatchlistModal(self, user_data[0], identifier))
+                await interaction.response.send_modal(AddToWatchlistModal(self, user_data.discord_id, identifier))
             elif action == "remove":
                 # Check if the user is actually on the watchlist
-                if user_data[5] == '-':
+                if not user_data.on_watchlist:
                     await interaction.response.send_message(
                         f"User with identifier '{identifier}' is not on the watchlist.",
                         ephemeral=True)
                     return
 
                 # Remove the user from the watchlist by setting watchlist_reason to '-'
-                c.execute('''
-                    UPDATE users 
-                    SET watchlist_reason = '-' 
-                    WHERE discord_id = ?
-                ''', (user_data[0],))
-
-                conn.commit()
+                storage.watchlist.remove(user_data.discord_id)
+                audit(interaction, 'watchlist_remove', user_data.discord_id)
 
                 await interaction.response.send_message(
                     f"User with identifier '{identifier}' has been removed from the watchlist.",
@@ -1529,9 +1461,6 @@ class StaffCog(commands.Cog):
 
         except sqlite3.Error as e:
             await interaction.response.send_message(f"An error occurred: {e}", ephemeral=True)
-        finally:
-            if conn:
-                conn.close()
 
     @watchlist.error
     async def watchlist_error(self, interaction: discord.Interaction, error):
@@ -1545,7 +1474,8 @@ class StaffCog(commands.Cog):
     @app_commands.command(name="warning", description="Add or remove a warning for a user")
     @app_commands.describe(action="Choose whether to add or remove a warning", identifier="The user's @mention or GW2 ID", reason="The reason for the warning (only required when adding a warning)")
     @app_commands.choices(action=[app_commands.Choice(name="Add", value="add"), app_commands.Choice(name="Remove", value="remove")])
-    @app_commands.checks.has_any_role(ROLE_ID_STAFF, ROLE_ID_FAMED_MEMBER)
+    @app_commands.autocomplete(identifier=identifier_autocomplete('staff', 'famed_member'))
+    @has_guild_role('staff', 'famed_member')
     async def warning(self, interaction: discord.Interaction, action: str, identifier: str, reason: str = None):
         await interaction.response.defer(ephemeral=True)
 
@@ -1554,194 +1484,152 @@ class StaffCog(commands.Cog):
             return
 
         try:
-            with sqlite3.connect(CURRENT_DB_FILENAME) as conn:
-                c = conn.cursor()
+            storage = get_storage(interaction.guild_id)
 
-                # Try to find the user by Discord ID/mention
-                if identifier.startswith('<@') and identifier.endswith('>'):
-                    discord_id = identifier.strip('<@!>')
-                else:
-                    discord_id = identifier
-
-                # Check if it's a Discord ID
-                c.execute("SELECT * FROM users WHERE discord_id = ?", (discord_id,))
-                user_data = c.fetchone()
-
-                # If not found, try to find by GW2 ID
-                if not user_data:
-                    c.execute("SELECT * FROM users WHERE gw2_id = ? OR alt_gw2_id = ?", (identifier, identifier))
-                    user_data = c.fetchone()
-
-                if not user_data:
-                    await interaction.response.send_message(
-                        "User not found. Please check the identifier and try again.",
-                        ephemeral=True)
-                    return
-
-                discord_id, gw2_id = user_data[0], user_data[1]
-
-                if action == "add":
-                    # Remove warnings older than 3 months
-                    three_months_ago = (datetime.now() - timedelta(days=90)).isoformat()
-                    c.execute("DELETE FROM warnings WHERE discord_id = ? AND date < ?", (discord_id, three_months_ago))
-
-                    # Add the new warning
-                    warning_date = datetime.now().isoformat()
-                    c.execute("INSERT INTO warnings (discord_id, reason, date) VALUES (?, ?, ?)",
-                              (discord_id, reason, warning_date))
-
-                    # Update the warnings count in the users table
-                    c.execute(
-                        "UPDATE users SET warnings = (SELECT COUNT(*) FROM warnings WHERE discord_id = ?), last_warning_date = ? WHERE discord_id = ?",
-                        (discord_id, warning_date, discord_id))
-
-                    # Fetch the updated warning count
-                    c.execute("SELECT warnings FROM users WHERE discord_id = ?", (discord_id,))
-                    warning_count = c.fetchone()[0]
-
-                    embed = discord.Embed(title="Warning Added", color=discord.Color.orange())
-                    embed.add_field(name="User", value=f"<@{discord_id}> (GW2 ID: {gw2_id})", inline=False)
-                    embed.add_field(name="Reason", value=reason, inline=False)
-                    embed.add_field(name="Date",
-                                    value=datetime.fromisoformat(warning_date).strftime("%Y-%m-%d %H:%M:%S"),
-                                    inline=False)
-                    embed.add_field(name="Total Warnings", value=str(warning_count), inline=False)
-
-                    await interaction.followup.send(embed=embed)
-
-                    # Fetch the updated list of warnings (after adding the new one)
-                    c.execute("SELECT * FROM warnings WHERE discord_id = ? ORDER BY date DESC", (discord_id,))
-                    warnings = c.fetchall()
-
-                    # Send a DM to the warned user based on warning count
-                    try:
-                        user = await interaction.client.fetch_user(int(discord_id))
-                        if warning_count == 1:
-                            await user.send(
-                                f"Dear {user.mention},\n\n"
-                                f"This is a notification regarding a warning issued by the [DPS] staff:\n\n"
-                                f"Reason: *{reason}*\n\n"
-                                f"We'd like to remind you of the importance of following our server rules and honoring your commitments to scheduled events. This helps maintain a positive environment for all members.\n\n"
-                                f"Please review the server rules in <#{CHANNEL_ID_RULES}> and ensure you can attend events you've signed up for. If you're unable to participate, kindly inform us in advance.\n\n"
-                                f"Thank you for your cooperation and understanding.\n\n"
-                                f"Best regards,\n"
-                                f"[DPS] Team"
-                            )
-                        elif warning_count == 2:
-                            await user.send(
-                                f"Dear {user.mention},\n\n"
-                                f"This is to inform you of a second warning issued by the [DPS] staff:\n\n"
-                                f"Reason: *{reason}*\n\n"
-                                f"We want to emphasize the importance of adhering to our server rules and respecting the time and effort put into organizing events. Your cooperation is crucial for a smooth and enjoyable experience for everyone involved.\n\n"
-                                f"Please take immediate action to address this issue. Review the server rules in <#{CHANNEL_ID_RULES}> and ensure you honour your commitments to events or provide timely notifications if you cannot attend.\n\n"
-                                f"We appreciate your prompt attention to this matter.\n\n"
-                                f"Best regards,\n"
-                                f"[DPS] Team"
-                            )
-                        else:
-                            await user.send(
-                                f"Dear {user.mention},\n\n"
-                                f"This is a final warning notification from the [DPS] staff:\n\n"
-                                f"Reason: *{reason}*\n\n"
-                                f"We must stress the extreme severity of this situation. Repeated violations of server rules or failure to honor event commitments have significantly impacted our community and the efforts of our event organizers.\n\n"
-                                f"This is your final opportunity to address these issues. Any further infractions will result in your immediate removal from both the guild and the Discord server. There will be no further warnings.\n\n"
-                                f"We strongly advise you to review and strictly adhere to the server rules in <#{CHANNEL_ID_RULES}>, and to fully commit to events you sign up for or provide ample notice if you cannot attend.\n\n"
-                                f"Your immediate and continued compliance is required to remain a member of our community.\n\n"
-                                f"Regards,\n"
-                                f"[DPS] Team"
-                            )
-                    except discord.HTTPException:
-                        await interaction.followup.send("Warning added, but unable to send a DM to the user.")
-
-                    # Send a message to the Mentor's channel
-                    mentor_channel = interaction.guild.get_channel(CHANNEL_ID_MENTORS)
-                    if mentor_channel:
-                        view = discord.ui.View()
-                        view.add_item(WarningsButton(self, discord_id, warnings))  # Now warnings is initialized
-
-                        await mentor_channel.send(
-                            f"User <@{discord_id}> has received a warning. Total warnings: {warning_count}",
-                            view=view
-                        )
-                    else:
-                        await interaction.followup.send("Couldn't send notification to Mentor's channel.")
-
-                elif action == "remove":
-                    # Fetch warnings in ascending order (oldest first)
-                    c.execute("SELECT * FROM warnings WHERE discord_id = ? ORDER BY date ASC", (discord_id,))
-                    warnings = c.fetchall()
+            # Find the user by Discord ID/mention or GW2 ID
+            user_data = storage.users.find(identifier)
 
-                    if not warnings:
-                        await interaction.followup.send("This user has no warnings to remove.", ephemeral=True)
-                        return
+            if not user_data:
+                await interaction.response.send_message(
+                    "User not found. Please check the identifier and try again.",
+                    ephemeral=True)
+                return
 
-                    # Display warnings using the new method (which should display oldest to newest)
-                    await display_warnings(interaction, discord_id, warnings)
+            discord_id, gw2_id = user_data.discord_id, user_data.gw2_id
 
-                    # Ask which warning to remove
-                    await interaction.followup.send("Enter the number of the warning you want to remove:", ephemeral=True)
+            if action == "add":
+                # Add the new warning, removing warnings older than 3 months. The DM to the warned user (based on
+                # their warning count) and the mentors notification are delivered by the outbox.
+                warning_date = now_epoch()
+                rules_channel_id = get_guild_config(interaction.guild_id).channel_rules
+                warning_count = storage.warnings.add(
+                    discord_id, reason, warning_date, expire_days=90, effects=lambda count: [
+                        dm(discord_id, warning_dm(f"<@{discord_id}>", count, reason, rules_channel_id),
+                           f"{interaction.id}:dm"),
+                        mentors_post('warning', f"User <@{discord_id}> has received a warning. Total warnings: {count}",
+                                     f"{interaction.id}:mentors", buttons=[('warnings', discord_id)], label=gw2_id),
+                    ])
+                audit(interaction, 'warning_add', discord_id, reason)
+
+                embed = discord.Embed(title="Warning Added", color=discord.Color.orange())
+                embed.add_field(name="User", value=f"<@{discord_id}> (GW2 ID: {gw2_id})", inline=False)
+                embed.add_field(name="Reason", value=reason, inline=False)
+                embed.add_field(name="Date",
+                                value=format_epoch(warning_date, "%Y-%m-%d %H:%M:%S"),
+                                inline=False)
+                embed.add_field(name="Total Warnings", value=str(warning_count), inline=False)
 
-                    def check(m):
-                        return m.author == interaction.user and m.channel == interaction.channel and m.content.isdigit()
+                await interaction.followup.send(embed=embed)
 
-                    try:
-                        msg = await interaction.client.wait_for('message', check=check, timeout=30.0)
+            elif action == "remove":
+                # Fetch warnings in ascending order (oldest first)
+                warnings = storage.warnings.for_user(discord_id)
 
-                    except asyncio.TimeoutError:
+                if not warnings:
+                    await interaction.followup.send("This user has no warnings to remove.", ephemeral=True)
+                    return
 
-                        await interaction.followup.send("You didn't respond in time. Command cancelled.", ephemeral=True)
-                        return
+                # Display warnings using the new method (which should display oldest to newest)
+                await display_warnings(interaction, discord_id, warnings)
 
-                    warning_number = int(msg.content)
-                    await msg.delete()  # Delete the user's input message
+                # Ask which warning to remove
+                await interaction.followup.send("Choose the warning you want to remove:",
+                                                view=RemoveWarningView(interaction.user.id, discord_id, warnings),
+                                                ephemeral=True)
 
-                    if warning_number < 1 or warning_number > len(warnings):
-                        await interaction.followup.send("Invalid warning number. Command cancelled.", ephemeral=True)
-                        return
+        except sqlite3.Error as e:
+            await interaction.followup.send(f"A database error occurred: {e}", ephemeral=True)
+        except Exception as e:
+            await interaction.followup.send(f"An unexpected error occurred: {e}", ephemeral=True)
 
-                    # Remove the selected warning
-                    warning_to_remove = warnings[warning_number - 1]
+    @warning.error
+    async def warning_error(self, interaction: discord.Interaction, error):
+        if isinstance(error, app_commands.errors.MissingRole):
+            await interaction.response.send_message(
+                "Sorry, you don't have the necessary permissions to use this command.",
+                ephemeral=True)
+        else:
+            await interaction.response.send_message(f"An error occurred: {str(error)}", ephemeral=True)
 
-                    c.execute("DELETE FROM warnings WHERE discord_id = ? AND date = ?", (discord_id, warning_to_remove[3]))
+    @app_commands.command(name="warning-bulk", description="Add the same warning to several users, e.g. event no-shows")
+    @app_commands.describe(identifiers="@mentions, Discord IDs or GW2 IDs (separate GW2 IDs with commas)",
+                           reason="The reason for the warnings")
+    @has_guild_role('staff', 'famed_member')
+    async def warning_bulk(self, interaction: discord.Interaction, identifiers: str, reason: str):
+        await interaction.response.defer(ephemeral=True)
 
-                    # Update the warnings count in the users table
-                    c.execute("UPDATE users SET warnings = warnings - 1 WHERE discord_id = ?", (discord_id,))
-                    conn.commit()
-                    await interaction.followup.send(f"Warning {warning_number} has been removed.", ephemeral=True)
+        try:
+            storage = get_storage(interaction.guild_id)
 
-                    # Display updated warnings
-                    c.execute("SELECT * FROM warnings WHERE discord_id = ? ORDER BY date ASC", (discord_id,))
-                    updated_warnings = c.fetchall()
+            # Resolve everyone first, so the warnings are written in a single transaction
+            targets, not_found = {}, []
+            for identifier in parse_identifiers(identifiers):
+                user_data = storage.users.find(identifier)
+                if user_data:
+                    targets.setdefault(user_data.discord_id, user_data.gw2_id)
+                else:
+                    not_found.append(identifier)
 
-                    await self.display_warnings(interaction, discord_id, updated_warnings)
+            if not targets:
+                await interaction.followup.send("None of these users were found. Please check the identifiers.",
+                                                ephemeral=True)
+                return
 
+            # The warnings, the DMs (based on each user's warning count) and one summary for the Mentor's channel
+            # are written in a single transaction; the outbox workers deliver the messages
+            warning_date = now_epoch()
+            rules_channel_id = get_guild_config(interaction.guild_id).channel_rules
+
+            def summary_lines(warning_counts):
+                return [f"<@{discord_id}> (GW2 ID: {gw2_id}) - total warnings: {warning_counts[discord_id]}"
+                        for discord_id, gw2_id in targets.items()]
+
+            def effects(warning_counts):
+                dms = [dm(discord_id, warning_dm(f"<@{discord_id}>", count, reason, rules_channel_id),
+                          f"{interaction.id}:dm:{discord_id}")
+                       for discord_id, count in warning_counts.items()]
+                summary = truncate_lines([f"{len(targets)} users have received a warning. Reason: {reason}"]
+                                         + summary_lines(warning_counts), limit=MESSAGE_LIMIT)
+                return dms + [mentors_post('warning', summary, f"{interaction.id}:mentors")]
+
+            warning_counts = storage.warnings.add_many(list(targets), reason, warning_date, expire_days=90,
+                                                       effects=effects)
+            for discord_id in targets:
+                audit(interaction, 'warning_add', discord_id, reason)
         except sqlite3.Error as e:
             await interaction.followup.send(f"A database error occurred: {e}", ephemeral=True)
-        except Exception as e:
-            await interaction.followup.send(f"An unexpected error occurred: {e}", ephemeral=True)
+            return
 
-    @warning.error
-    async def warning_error(self, interaction: discord.Interaction, error):
-        if isinstance(error, app_commands.errors.MissingRole):
+        embed = discord.Embed(title="Warnings Added", color=discord.Color.orange())
+        embed.add_field(name="Reason", value=reason, inline=False)
+        embed.add_field(name="Date", value=format_epoch(warning_date, "%Y-%m-%d %H:%M:%S"),
+                        inline=False)
+        embed.add_field(name=f"Warned ({len(targets)})", value=truncate_lines(summary_lines(warning_counts)),
+                        inline=False)
+        if not_found:
+            embed.add_field(name=f"Not found ({len(not_found)})",
+                            value=truncate_lines([f"`{identifier}`" for identifier in not_found]), inline=False)
+        await interaction.followup.send(embed=embed, ephemeral=True)
+
+    @warning_bulk.error
+    async def warning_bulk_error(self, interaction: discord.Interaction, error):
+        if isinstance(error, (app_commands.errors.MissingRole, app_commands.errors.MissingAnyRole)):
             await interaction.response.send_message(
                 "Sorry, you don't have the necessary permissions to use this command.",
                 ephemeral=True)
+        elif interaction.response.is_done():
+            await interaction.followup.send(f"An error occurred: {str(error)}", ephemeral=True)
         else:
             await interaction.response.send_message(f"An error occurred: {str(error)}", ephemeral=True)
 
     @app_commands.command(name="get-applications", description="View staff member applications")
-    @app_commands.checks.has_any_role(ROLE_ID_STAFF)
+    @has_guild_role('staff')
     async def get_applications(self, interaction: discord.Interaction):
         await interaction.response.defer(ephemeral=True)
 
-        conn = None
         try:
-            conn = sqlite3.connect(CURRENT_DB_FILENAME)
-            c = conn.cursor()
-
             # Fetch all applications, ordered by most recent first
-            c.execute("SELECT id, timestamp, discord_id, gw2_id FROM mentor_applications ORDER BY id DESC")
-            applications = c.fetchall()
+            applications = get_storage(interaction.guild_id).applications.list()
 
             if not applications:
                 await interaction.followup.send("There are no pending applications.", ephemeral=True)
@@ -1751,32 +1639,24 @@ class StaffCog(commands.Cog):
             embed = discord.Embed(title="Staff Member Applications", color=discord.Color.blue())
             for app in applications:
                 embed.add_field(
-                    name=f"Application ID: {app[0]}",
-                    value=f"Date: {app[1]}\nDiscord: <@{app[2]}>\nGW2 ID: {app[3]}",
+                    name=f"Application ID: {app.id}",
+                    value=f"Date: {format_epoch(app.timestamp, '%Y-%m-%d %H:%M:%S')}\n"
+                          f"Discord: <@{app.discord_id}>\nGW2 ID: {app.gw2_id}",
                     inline=False
                 )
 
             # Set thumbnail
-            script_dir = os.path.dirname(os.path.abspath(__file__))
-            thumbnail_path = os.path.join(script_dir, "pictures", "Application.png")
+            files = await ASSETS.thumbnail(embed, "Application.png")
 
-            if os.path.exists(thumbnail_path):
-                file = discord.File(thumbnail_path, filename="Application.png")
-                embed.set_thumbnail(url="attachment://Application.png")
-            else:
-                file = None
-                print(f"Thumbnail file not found at: {thumbnail_path}")
-
-            view = ApplicationView(bot=self.bot)
-            await interaction.followup.send(file=file, embed=embed, view=view, ephemeral=True)
+            view = routed_view(
+                RoutedButton('application-details', label="See details"),
+                RoutedButton('application-remove', label="Remove application", style=discord.ButtonStyle.danger))
+            await interaction.followup.send(files=files, embed=embed, view=view, ephemeral=True)
 
         except sqlite3.Error as e:
             await interaction.followup.send(f"A database error occurred: {e}", ephemeral=True)
         except Exception as e:
             await interaction.followup.send(f"An unexpected error occurred: {e}", ephemeral=True)
-        finally:
-            if conn:
-                conn.close()
 
     @get_applications.error
     async def get_applications_error(self, interaction: discord.Interaction, error):
@@ -1788,51 +1668,39 @@ class StaffCog(commands.Cog):
             await interaction.response.send_message(f"An error occurred: {str(error)}", ephemeral=True)
 
     @app_commands.command(name="crosscheck", description="Check the guild roster for members without linked Discord accounts.")
-    @app_commands.checks.has_any_role(ROLE_ID_STAFF, ROLE_ID_FAMED_MEMBER)
+    @has_guild_role('staff', 'famed_member')
     async def crosscheck(self, interaction: discord.Interaction):
         await interaction.response.defer(ephemeral=True)
 
         try:
-            # Fetch the guild roster from the GW2 API
-            response = requests.get(f"https://api.guildwars2.com/v2/guild/{GUILD_ID}/members",
-                                    headers={"Authorization": f"Bearer {API_KEY}"})
-            if response.status_code != 200:
+            # Refresh the stored guild roster if it is out of date
+            if not ensure_guild_roster(interaction.guild_id):
                 await interaction.followup.send("Failed to fetch the guild roster. Please try again later.",
                                                 ephemeral=True)
                 return
-            guild_roster = response.json()
-
-            # Fetch the user database (Discord users linked to GW2 accounts)
-            conn = sqlite3.connect(CURRENT_DB_FILENAME)
-            c = conn.cursor()
-            c.execute("SELECT gw2_id, alt_gw2_id, discord_id FROM users")
-            user_links = c.fetchall()
-            conn.close()
-
-            # Create a set of all linked GW2 IDs (both main and alt)
-            linked_gw2_ids = {main_id for main_id, alt_id, _ in user_links}
-            linked_gw2_ids.update(alt_id for _, alt_id, _ in user_links if alt_id)
-
-            # Find unlinked members
-            unlinked_members = [
-                member for member in guild_roster
-                if member['name'] not in linked_gw2_ids and member.get('rank') != "Legacy Member"
-            ]
-
-            if not unlinked_members:
+
+            # Count the guild members without a linked Discord account
+            roster = get_storage(interaction.guild_id).roster
+            unlinked_count = roster.count_unlinked()
+
+            if not unlinked_count:
                 await interaction.followup.send("All guild members have linked Discord accounts.", ephemeral=True)
                 return
 
-            # Create embeds
-            embeds = []
             chunk_size = 10
-            for i in range(0, len(unlinked_members), chunk_size):
+            page_count = -(-unlinked_count // chunk_size)
+            icon_url = interaction.guild.icon.url if interaction.guild and interaction.guild.icon else None
+
+            def load_page(index):
+                # Only the members shown on this page are read from the database
+                unlinked_members = roster.find_unlinked(chunk_size, index * chunk_size)
+
                 embed = discord.Embed(title="Guild Members Without Linked Discord Accounts",
                                       color=discord.Color.orange())
 
-                for member in unlinked_members[i:i + chunk_size]:
+                for member in unlinked_members:
                     embed.add_field(
-                        name=f"**{member['name']}** *({member['rank']})*",
+                        name=f"**{member.name}** *({member.rank})*",
                         value="\u200b",  # Zero-width space
                         inline=False
                     )
@@ -1855,17 +1723,16 @@ class StaffCog(commands.Cog):
                 )
                 embed.add_field(name="Message Template", value=message_block, inline=False)
 
-                embed.set_footer(text=f"Page {len(embeds) + 1}/{-(-len(unlinked_members) // chunk_size)}")
-                embeds.append(embed)
+                embed.set_footer(text=f"Page {index + 1}/{page_count}")
 
-            # Add server icon as thumbnail to all embeds
-            if interaction.guild and interaction.guild.icon:
-                for embed in embeds:
-                    embed.set_thumbnail(url=interaction.guild.icon.url)
+                # Add server icon as thumbnail
+                if icon_url:
+                    embed.set_thumbnail(url=icon_url)
+                return embed
 
-            # Send the embeds with the paginator
-            paginator = Paginator(embeds)
-            await interaction.followup.send(embed=embeds[0], view=paginator, ephemeral=True)
+            # Send the first page with the paginator
+            paginator = LazyPaginator(page_count, load_page)
+            await interaction.followup.send(embed=load_page(0), view=paginator, ephemeral=True)
 
         except requests.RequestException as e:
             await interaction.followup.send(f"Network error occurred: {str(e)}", ephemeral=True)
@@ -1884,8 +1751,250 @@ class StaffCog(commands.Cog):
             await interaction.response.send_message(f"An error occurred: {str(error)}", ephemeral=True)
 
 
+    @app_commands.command(name="search", description="Search warnings, watchlist reasons and applications")
+    @app_commands.describe(query="Words to look for (every word must match, end a word with * to match a prefix)",
+                           scope="Where to search (default: everywhere)")
+    @app_commands.choices(scope=[
+        app_commands.Choice(name="Everywhere", value="all"),
+        app_commands.Choice(name="Warnings", value="warnings"),
+        app_commands.Choice(name="Watchlist", value="watchlist"),
+        app_commands.Choice(name="Applications", value="applications")
+    ])
+    @has_guild_role('staff')
+    async def search(self, interaction: discord.Interaction, query: str, scope: str = "all"):
+        await interaction.response.defer(ephemeral=True)
+
+        try:
+            search = get_storage(interaction.guild_id).search
+            scopes = SEARCH_SCOPES if scope == "all" else (scope,)
+            result_count = search.count(query, scopes)
+
+            if not result_count:
+                await interaction.followup.send(f"No results found for '{query}'.", ephemeral=True)
+                return
+
+            chunk_size = 10
+            page_count = -(-result_count // chunk_size)
+            titles = {'warning': "⚠️ Warning", 'watchlist': "🚨 Watchlist", 'application': "📝 Application"}
+
+            def load_page(index):
+                # Only the results shown on this page are read from the database
+                embed = discord.Embed(title=f"Search results for '{query}'", color=discord.Color.blue())
+                for result in search.search(query, scopes, chunk_size, index * chunk_size):
+                    name = titles[result.kind]
+                    if result.id is not None:
+                        name += f" #{result.id}"
+                    if result.date:
+                        name += f" • {format_epoch(result.date, '%Y-%m-%d')}"
+                    embed.add_field(name=name, value=f"<@{result.discord_id}>\n{result.snippet}"[:1024], inline=False)
+                embed.set_footer(text=f"Page {index + 1}/{page_count} • {result_count} results")
+                return embed
+
+            paginator = LazyPaginator(page_count, load_page)
+            await interaction.followup.send(embed=load_page(0), view=paginator, ephemeral=True)
+
+        except sqlite3.Error as e:
+            await interaction.followup.send(f"A database error occurred: {e}", ephemeral=True)
+        except Exception as e:
+            await interaction.followup.send(f"An unexpected error occurred: {e}", ephemeral=True)
+
+    @search.error
+    async def search_error(self, interaction: discord.Interaction, error):
+        if isinstance(error, app_commands.errors.MissingRole):
+            await interaction.response.send_message(
+                "Sorry, you don't have the necessary permissions to use this command.",
+                ephemeral=True)
+        else:
+            await interaction.response.send_message(f"An error occurred: {str(error)}", ephemeral=True)
+
+    @app_commands.command(name="audit-log", description="Browse the moderation actions taken by staff")
+    @app_commands.describe(actor="Only actions taken by this staff member",
+                           target="Only actions on this user (@mention, Discord ID or GW2 ID)",
+                           days="Only actions from the last N days")
+    @app_commands.autocomplete(target=identifier_autocomplete('staff'))
+    @has_guild_role('staff')
+    async def audit_log(self, interaction: discord.Interaction, actor: discord.Member = None, target: str = None,
+                        days: app_commands.Range[int, 1, 3650] = None):
+        await interaction.response.defer(ephemeral=True)
+
+        try:
+            # Include the actions that are still waiting to be written
+            await AUDIT_LOG.write(interaction.guild_id)
+
+            storage = get_storage(interaction.guild_id)
+            target_id = None
+            if target:
+                user_data = storage.users.find(target)
+                target_id = user_data.discord_id if user_data else snowflake(target)
+                if target_id is None:
+                    await interaction.followup.send("No audit log entries found.", ephemeral=True)
+                    return
+            filters = {'actor_id': actor.id if actor else None, 'target_id': target_id,
+                       'since': time.time() - days * 86400 if days else None}
+            entry_count = storage.audit.count(**filters)
+
+            if not entry_count:
+                await interaction.followup.send("No audit log entries found.", ephemeral=True)
+                return
+
+            chunk_size = 10
+            page_count = -(-entry_count // chunk_size)
+
+            def load_page(index):
+                # Only the entries shown on this page are read from the database
+                embed = discord.Embed(title="Audit log", color=discord.Color.dark_grey())
+                for entry in storage.audit.query(**filters, limit=chunk_size, offset=index * chunk_size):
+                    value = f"<t:{int(entry.created_at)}:f> by <@{entry.actor_id}>"
+                    if entry.target_id:
+                        value += f" on <@{entry.target_id}>"
+                    if entry.details:
+                        value += f"\n{entry.details}"
+                    embed.add_field(name=AUDIT_ACTIONS.get(entry.action, entry.action), value=value[:1024],
+                                    inline=False)
+                embed.set_footer(text=f"Page {index + 1}/{page_count} • {entry_count} entries")
+                return embed
+
+            paginator = LazyPaginator(page_count, load_page)
+            await interaction.followup.send(embed=load_page(0), view=paginator, ephemeral=True)
+
+        except sqlite3.Error as e:
+            await interaction.followup.send(f"A database error occurred: {e}", ephemeral=True)
+        except Exception as e:
+            await interaction.followup.send(f"An unexpected error occurred: {e}", ephemeral=True)
+
+    @audit_log.error
+    async def audit_log_error(self, interaction: discord.Interaction, error):
+        if isinstance(error, app_commands.errors.MissingRole):
+            await interaction.response.send_message(
+                "Sorry, you don't have the necessary permissions to use this command.",
+                ephemeral=True)
+        else:
+            await interaction.response.send_message(f"An error occurred: {str(error)}", ephemeral=True)
+
+    @app_commands.command(name="query-profile", description="Admin command to view the SQL query profile")
+    @app_commands.describe(action="View the slowest statements, only flagged full scans, dump a report or reset")
+    @app_commands.choices(action=[
+        app_commands.Choice(name="View", value="view"),
+        app_commands.Choice(name="Full scans", value="scans"),
+        app_commands.Choice(name="Report", value="report"),
+        app_commands.Choice(name="Reset", value="reset")
+    ])
+    @has_guild_role('admin')
+    async def query_profile(self, interaction: discord.Interaction, action: str):
+        await interaction.response.defer(ephemeral=True)
+
+        profiler = get_profiler()
+        if not profiler:
+            await interaction.followup.send("Query profiling is disabled. Set QUERY_PROFILING=true to enable it.",
+                                            ephemeral=True)
+            return
+
+        if action == "reset":
+            profiler.reset()
+            await interaction.followup.send("The query profile has been reset.", ephemeral=True)
+            return
+
+        if action == "report":
+            report_path = profiler.write_report(f"query_profile_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+            await interaction.followup.send("Query profile report:", file=discord.File(report_path), ephemeral=True)
+            return
+
+        statements = profiler.flagged() if action == "scans" else profiler.top()
+        if not statements:
+            await interaction.followup.send("No statements have been recorded.", ephemeral=True)
+            return
+
+        # Create embeds
+        embeds = []
+        chunk_size = 5
+        for i in range(0, len(statements), chunk_size):
+            embed = discord.Embed(title="__**Query Profile**__", color=discord.Color.dark_teal())
+            for rank, stats in enumerate(statements[i:i + chunk_size], i + 1):
+                value = f"```sql\n{stats.sql[:700]}\n```"
+                if stats.plan:
+                    value += "\n".join(f"- {line}" for line in stats.plan[:4])
+                for table, rows in stats.scans:
+                    value += f"\n⚠️ Full scan of **{table}** ({rows} rows)"
+                embed.add_field(
+                    name=f"#{rank} • {stats.calls} calls • {stats.total_time * 1000:.1f} ms total • "
+                         f"{stats.max_time * 1000:.1f} ms max",
+                    value=value[:1024],
+                    inline=False
+                )
+            embed.set_footer(text=f"Since {profiler.started_at.strftime('%m/%d/%Y %I:%M %p')} • "
+                                  f"Page {len(embeds) + 1}/{-(-len(statements) // chunk_size)}")
+            embeds.append(embed)
+
+        paginator = Paginator(embeds)
+        await interaction.followup.send(embed=embeds[0], view=paginator, ephemeral=True)
+
+    @query_profile.error
+    async def query_profile_error(self, interaction: discord.Interaction, error):
+        if isinstance(error, app_commands.errors.MissingAnyRole):
+            await interaction.response.send_message("You must be an admin to use this command.", ephemeral=True)
+        else:
+            await interaction.response.send_message(f"An error occurred: {str(error)}", ephemeral=True)
+
+
+    @app_commands.command(name="loop-blocks", description="Admin command to view where the event loop was blocked")
+    @app_commands.describe(action="Rank call sites by worst block, total blocked time or count, or reset")
+    @app_commands.choices(action=[
+        app_commands.Choice(name="Worst", value="worst"),
+        app_commands.Choice(name="Total", value="total"),
+        app_commands.Choice(name="Count", value="count"),
+        app_commands.Choice(name="Reset", value="reset")
+    ])
+    @has_guild_role('admin')
+    async def loop_blocks(self, interaction: discord.Interaction, action: str):
+        await interaction.response.defer(ephemeral=True)
+
+        watchdog = get_loop_watchdog()
+        if not watchdog:
+            await interaction.followup.send(
+                "The event loop watchdog is disabled. Set LOOP_WATCHDOG_THRESHOLD_SECONDS to enable it.",
+                ephemeral=True)
+            return
+
+        if action == "reset":
+            watchdog.reset()
+            await interaction.followup.send("The event loop blocking report has been reset.", ephemeral=True)
+            return
+
+        sites = watchdog.report(action)
+        if not sites:
+            await interaction.followup.send(
+                f"The event loop has not been blocked for more than {watchdog.threshold}s.", ephemeral=True)
+            return
+
+        # Create embeds
+        embeds = []
+        chunk_size = 5
+        for i in range(0, len(sites), chunk_size):
+            embed = discord.Embed(title="__**Event Loop Blocking**__", color=discord.Color.dark_red())
+            for rank, entry in enumerate(sites[i:i + chunk_size], i + 1):
+                embed.add_field(
+                    name=f"#{rank} • {entry.count}x • worst {entry.worst:.2f}s • total {entry.total:.2f}s",
+                    value=f"`{entry.site}`\n```py\n{entry.stack[-800:]}\n```"[:1024],
+                    inline=False
+                )
+            embed.set_footer(text=f"Since {watchdog.started_at.strftime('%m/%d/%Y %I:%M %p')} • "
+                                  f"Page {len(embeds) + 1}/{-(-len(sites) // chunk_size)}")
+            embeds.append(embed)
+
+        paginator = Paginator(embeds)
+        await interaction.followup.send(embed=embeds[0], view=paginator, ephemeral=True)
+
+    @loop_blocks.error
+    async def loop_blocks_error(self, interaction: discord.Interaction, error):
+        if isinstance(error, app_commands.errors.MissingAnyRole):
+            await interaction.response.send_message("You must be an admin to use this command.", ephemeral=True)
+        else:
+            await interaction.response.send_message(f"An error occurred: {str(error)}", ephemeral=True)
+
+
 # Setup function to add cogs
 async def setup(bot: commands.Bot):
+    bot.add_dynamic_items(RoutedButton)
     await bot.add_cog(ConfirmationCog(bot))
     await bot.add_cog(MemberCog(bot))
     await bot.add_cog(StaffCog(bot))
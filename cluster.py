@@ -0,0 +1,101 @@
+# Standard library imports
+import os
+import sys
+import time
+import signal
+import argparse
+import subprocess
+
+REPO_ROOT = os.path.dirname(os.path.abspath(__file__))
+RESTART_DELAY = 5
+
+
+def shard_ranges(shard_count, workers):
+    """Spread the shard IDs over the workers as evenly as possible."""
+    return [list(range(shard_count))[i::workers] for i in range(workers)]
+
+
+class Cluster:
+    """Runs the database writer plus one bot process per group of gateway shards, restarting workers that exit."""
+
+    def __init__(self, workers, shard_count, socket_path):
+        self.socket_path = socket_path
+        self.shard_groups = [group for group in shard_ranges(shard_count, workers) if group]
+        self.shard_count = shard_count
+        self.writer = None
+        self.workers = {}
+        self.stopping = False
+
+    def _env(self, shard_ids=None):
+        env = dict(os.environ, DB_WRITER_SOCKET=self.socket_path)
+        if shard_ids is not None:
+            env['SHARD_COUNT'] = str(self.shard_count)
+            env['SHARD_IDS'] = ','.join(map(str, shard_ids))
+        return env
+
+    def start_writer(self):
+        self.writer = subprocess.Popen([sys.executable, os.path.join(REPO_ROOT, 'dbwriter.py'), self.socket_path],
+                                       env=self._env())
+        # Workers connect on their first query, so wait until the socket exists
+        deadline = time.monotonic() + 30
+        while not os.path.exists(self.socket_path):
+            if self.writer.poll() is not None or time.monotonic() > deadline:
+                raise RuntimeError("Database writer failed to start")
+            time.sleep(0.1)
+
+    def start_worker(self, index):
+        shard_ids = self.shard_groups[index]
+        print(f"Starting worker {index} with shards {shard_ids}/{self.shard_count}")
+        self.workers[index] = subprocess.Popen([sys.executable, os.path.join(REPO_ROOT, 'scrubbot.py')],
+                                               env=self._env(shard_ids))
+
+    def run(self):
+        self.start_writer()
+        for index in range(len(self.shard_groups)):
+            self.start_worker(index)
+
+        while not self.stopping:
+            time.sleep(1)
+            if self.writer.poll() is not None:
+                print(f"Database writer exited with code {self.writer.returncode}, stopping the cluster")
+                break
+            for index, worker in list(self.workers.items()):
+                if worker.poll() is not None and not self.stopping:
+                    print(f"Worker {index} exited with code {worker.returncode}, restarting in {RESTART_DELAY}s")
+                    time.sleep(RESTART_DELAY)
+                    self.start_worker(index)
+        self.stop()
+
+    def stop(self, *args):
+        self.stopping = True
+        # Workers first, so their last writes still reach the writer
+        for worker in self.workers.values():
+            if worker.poll() is None:
+                worker.terminate()
+        for worker in self.workers.values():
+            worker.wait()
+        if self.writer and self.writer.poll() is None:
+            self.writer.terminate()
+            self.writer.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the bot as several worker processes sharing one database "
+                                                 "writer process.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Number of bot processes")
+    parser.add_argument("--shards", type=int, default=None,
+                        help="Total number of gateway shards (default: one per worker)")
+    parser.add_argument("--socket", default=os.path.join(REPO_ROOT, 'dbwriter.sock'),
+                        help="Unix socket of the database writer")
+    args = parser.parse_args()
+
+    cluster = Cluster(args.workers, args.shards or args.workers, os.path.abspath(args.socket))
+    signal.signal(signal.SIGTERM, cluster.stop)
+    try:
+        cluster.run()
+    except KeyboardInterrupt:
+        cluster.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+# Standard library imports
+import time
+from datetime import datetime, timezone
+from enum import IntEnum
+
+# How the typed columns store their values: Discord IDs as INTEGER snowflakes, dates as Unix seconds,
+# guild statuses as GuildStatus and birthdays as yyyymmdd integers.
+
+
+class GuildStatus(IntEnum):
+    """users.guild_status and alt_guild_status: whether the GW2 ID is on the guild roster."""
+    NONE = 0
+    MEMBER = 1
+
+    @property
+    def label(self):
+        return "Member" if self is GuildStatus.MEMBER else "-"
+
+
+# users.birthday of users who haven't set one
+NO_BIRTHDAY = 0
+
+
+def birthday_value(day, month, year):
+    return year * 10000 + month * 100 + day
+
+
+def format_birthday(birthday):
+    if not birthday:
+        return "-"
+    return f"{birthday % 100:02d}.{birthday // 100 % 100:02d}.{birthday // 10000}"
+
+
+def now_epoch():
+    return int(time.time())
+
+
+def format_epoch(epoch, date_format="%B %d %Y at %I:%M %p"):
+    """A stored date in local time, e.g. "July 14 2024 at 11:47 PM"."""
+    if epoch is None:
+        return "Unknown Date"
+    return datetime.fromtimestamp(epoch).strftime(date_format)
+
+
+# -------------- Legacy values ----------------
+# Databases created before the typed schema kept Discord IDs as TEXT, dates as ISO strings (local time, or UTC
+# for CURRENT_TIMESTAMP defaults), statuses as 'Member'/'-' and birthdays as 'dd.mm.yyyy'. These convert their
+# values; already converted values pass through unchanged.
+def legacy_snowflake(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def legacy_epoch(value, utc=False, default=0):
+    if isinstance(value, (int, float)):
+        return int(value)
+    try:
+        date = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return default
+    if utc and date.tzinfo is None:
+        date = date.replace(tzinfo=timezone.utc)
+    return int(date.timestamp())
+
+
+def legacy_status(value):
+    if isinstance(value, int):
+        return value
+    return GuildStatus.MEMBER if value == 'Member' else GuildStatus.NONE
+
+
+def legacy_birthday(value):
+    if isinstance(value, int):
+        return value
+    try:
+        date = datetime.strptime(value, "%d.%m.%Y")
+    except (TypeError, ValueError):
+        return NO_BIRTHDAY
+    return birthday_value(date.day, date.month, date.year)
+
+
+LEGACY_CONVERTERS = {
+    'users': {
+        'discord_id': legacy_snowflake,
+        'guild_status': legacy_status,
+        'alt_guild_status': legacy_status,
+        'last_warning_date': lambda value: legacy_epoch(value, default=None),
+        'birthday': legacy_birthday,
+    },
+    'warnings': {'discord_id': legacy_snowflake, 'date': legacy_epoch},
+    'bans': {'discord_id': legacy_snowflake, 'date': legacy_epoch},
+    'mentor_applications': {'discord_id': legacy_snowflake, 'timestamp': lambda value: legacy_epoch(value, utc=True)},
+    'audit_log': {'actor_id': legacy_snowflake, 'target_id': legacy_snowflake},
+    'sessions': {'user_id': legacy_snowflake},
+}
+
+# The Discord ID a legacy row can't be kept without (discord_id unless listed)
+LEGACY_KEY_COLUMNS = {'audit_log': 'actor_id', 'sessions': 'user_id'}
+
+
+def convert_legacy_row(table, columns, row):
+    """A row of a legacy table in the typed format, or None if its Discord ID is unreadable."""
+    converters = LEGACY_CONVERTERS.get(table, {})
+    row = tuple(converters[column](value) if column in converters else value for column, value in zip(columns, row))
+    key = LEGACY_KEY_COLUMNS.get(table, 'discord_id')
+    if key in columns and row[columns.index(key)] is None:
+        return None
+    return row
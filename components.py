@@ -0,0 +1,85 @@
+# Standard library imports
+from urllib.parse import unquote
+
+# Third-party imports
+import discord
+
+# Discord's limit on the length of a custom_id
+CUSTOM_ID_LIMIT = 100
+
+# Handlers by action: async def handler(interaction, *args). Routed components carry their action and arguments
+# in the custom_id ("route:<action>:<arg>:<arg>"), so a click finds its handler with one dict lookup and works
+# after a restart, without a View object kept per message.
+ROUTES = {}
+
+
+def component_handler(action):
+    def decorator(handler):
+        ROUTES[action] = handler
+        return handler
+    return decorator
+
+
+def _quote(arg):
+    return str(arg).replace('%', '%25').replace(':', '%3A')
+
+
+def custom_id(action, *args):
+    value = ':'.join(['route', action] + [_quote(arg) for arg in args])
+    if len(value) > CUSTOM_ID_LIMIT:
+        raise ValueError(f"custom_id of {action} is longer than {CUSTOM_ID_LIMIT} characters")
+    return value
+
+
+class RoutedButton(discord.ui.DynamicItem[discord.ui.Button], template=r'route:(?P<action>[\w-]+)(?P<args>(:[^:]*)*)'):
+    """Button whose clicks go to the handler registered for `action`, called with `args` (as strings)."""
+
+    def __init__(self, action, *args, label=None, style=discord.ButtonStyle.primary, disabled=False):
+        super().__init__(discord.ui.Button(label=label, style=style, disabled=disabled,
+                                           custom_id=custom_id(action, *args)))
+        self.action = action
+        self.args = [str(arg) for arg in args]
+
+    @property
+    def label(self):
+        return self.item.label
+
+    @label.setter
+    def label(self, value):
+        self.item.label = value
+
+    @classmethod
+    async def from_custom_id(cls, interaction, item, match):
+        args = [unquote(arg) for arg in match['args'].split(':')[1:]]
+        return cls(match['action'], *args, label=item.label, style=item.style)
+
+    async def callback(self, interaction: discord.Interaction):
+        handler = ROUTES.get(self.action)
+        if handler is None:
+            await interaction.response.send_message("This button is no longer available.", ephemeral=True)
+            return
+        try:
+            await handler(interaction, *self.args)
+        except Exception as e:
+            print(f"Error in {self.action} button: {e}")
+            if not interaction.response.is_done():
+                await interaction.response.send_message("An error occurred. Please try again later.", ephemeral=True)
+
+
+def routed_view(*buttons):
+    """A View for sending routed buttons. Nothing is kept in memory for it once sent."""
+    view = discord.ui.View(timeout=None)
+    for button in buttons:
+        view.add_item(button)
+    return view
+
+
+async def mark_clicked(interaction: discord.Interaction, label):
+    """Disable the clicked button of a message and relabel it (e.g. "Welcome message sent")."""
+    view = discord.ui.View.from_message(interaction.message, timeout=None)
+    for item in view.children:
+        if getattr(item, 'custom_id', None) == interaction.data['custom_id']:
+            item.disabled = True
+            item.label = label
+    view.stop()  # Clicks are routed by custom_id, so the view isn't kept in the view store
+    await interaction.message.edit(view=view)
@@ -10,11 +10,27 @@ TOKEN = os.getenv('BOT_TOKEN')
 # Guild [DPS] API key & ID
 API_KEY = os.getenv('USER_API_KEY')
 GUILD_ID = os.getenv('GUILD_ID')
+GW2_API_URL = os.getenv('GW2_API_URL', 'https://api.guildwars2.com')
+
+# How long the stored guild roster is trusted before commands like /crosscheck refetch it
+ROSTER_MAX_AGE_MINUTES = int(os.getenv('ROSTER_MAX_AGE_MINUTES', '10'))
 
 
 # Discord Server (Guild) ID
 DISCORD_GUILD_ID = os.getenv('DISCORD_SERVER_ID')
 
+# Multi-server setup: JSON file with one object per server, using the setting names of this file as keys
+# (DISCORD_SERVER_ID, GUILD_ID, USER_API_KEY, ROLE_ID_*, CHANNEL_ID_*). Missing settings fall back to the values here.
+GUILDS_CONFIG_FILE = os.getenv('GUILDS_CONFIG_FILE')
+# Number of servers synced at the same time by the nightly update
+SYNC_CONCURRENCY = int(os.getenv('SYNC_CONCURRENCY', '4'))
+
+# Gateway intents & member cache
+# MEMBER_CACHE_FLAGS: 'joined' (cache members seen via the gateway) or 'none' (fetch on demand)
+PRESENCE_INTENT = os.getenv('PRESENCE_INTENT', 'false').lower() == 'true'
+MEMBER_CACHE_FLAGS = os.getenv('MEMBER_CACHE_FLAGS', 'joined').lower()
+CHUNK_GUILDS_AT_STARTUP = os.getenv('CHUNK_GUILDS_AT_STARTUP', 'false').lower() == 'true'
+
 # Role IDs
 ROLE_ID_CONFIRMATION = int(os.getenv('ROLE_ID_CONFIRMATION'))
 ROLE_ID_GUEST = int(os.getenv('ROLE_ID_GUEST'))
@@ -28,12 +44,78 @@ ROLE_ID_BIRTHDAY = int(os.getenv('ROLE_ID_BIRTHDAY'))
 CHANNEL_ID_MENTORS = int(os.getenv('CHANNEL_ID_MENTORS'))
 CHANNEL_ID_GENERAL = int(os.getenv('CHANNEL_ID_GENERAL'))
 CHANNEL_ID_RULES = int(os.getenv('CHANNEL_ID_RULES'))
+# Mentors channel notifications of the same kind arriving within this many seconds are sent as one digest (0 disables)
+NOTIFICATION_WINDOW_SECONDS = float(os.getenv('NOTIFICATION_WINDOW_SECONDS', '5'))
+# Outbox delivery (DMs, mentors channel posts, role edits): deliveries at a time, how often due retries are
+# looked for, and the attempts before an entry is given up on (retries back off exponentially up to the maximum)
+OUTBOX_WORKERS = int(os.getenv('OUTBOX_WORKERS', '5'))
+OUTBOX_POLL_SECONDS = float(os.getenv('OUTBOX_POLL_SECONDS', '5'))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', '8'))
+OUTBOX_MAX_BACKOFF_SECONDS = float(os.getenv('OUTBOX_MAX_BACKOFF_SECONDS', '900'))
+# Multi-step interaction sessions (see sessions.py): entries kept in memory per flow, whether they are also saved to
+# the database (so they survive a restart), and how long a mentor application draft is kept after its last update
+SESSION_MAX_ENTRIES = int(os.getenv('SESSION_MAX_ENTRIES', '1000'))
+SESSION_PERSISTENCE = os.getenv('SESSION_PERSISTENCE', 'true').lower() == 'true'
+APPLICATION_DRAFT_TTL_HOURS = float(os.getenv('APPLICATION_DRAFT_TTL_HOURS', '24'))
+# Moderation audit log (see audit.py): how often buffered entries are written, how many entries make a flush start
+# early, and how many unwritten entries are kept per server while the database can't be written (oldest dropped)
+AUDIT_FLUSH_SECONDS = float(os.getenv('AUDIT_FLUSH_SECONDS', '2'))
+AUDIT_MAX_BATCH = int(os.getenv('AUDIT_MAX_BATCH', '500'))
+AUDIT_MAX_BUFFER = int(os.getenv('AUDIT_MAX_BUFFER', '10000'))
+# Nightly database maintenance (see maintenance.py): rows older than this many days are moved to the server's
+# archive database (0 keeps them in the main database)
+ARCHIVE_WARNINGS_AFTER_DAYS = int(os.getenv('ARCHIVE_WARNINGS_AFTER_DAYS', '365'))
+ARCHIVE_APPLICATIONS_AFTER_DAYS = int(os.getenv('ARCHIVE_APPLICATIONS_AFTER_DAYS', '365'))
+ARCHIVE_AUDIT_LOG_AFTER_DAYS = int(os.getenv('ARCHIVE_AUDIT_LOG_AFTER_DAYS', '365'))
+# Channel the embed thumbnails are uploaded to once, so responses can reuse their CDN URLs (optional)
+CHANNEL_ID_ASSETS = int(os.getenv('CHANNEL_ID_ASSETS')) if os.getenv('CHANNEL_ID_ASSETS') else None
+
+# Metrics endpoint (disabled unless METRICS_PORT is set)
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT')) if os.getenv('METRICS_PORT') else None
+
+# Interaction tracing: log the span breakdown of commands slower than this (disabled if unset)
+TRACE_THRESHOLD_SECONDS = float(os.getenv('TRACE_THRESHOLD_SECONDS')) if os.getenv('TRACE_THRESHOLD_SECONDS') else None
+
+# SQL query profiler: statement stats plus EXPLAIN QUERY PLAN scan detection on tables with at least this many rows
+QUERY_PROFILING = os.getenv('QUERY_PROFILING', 'false').lower() == 'true'
+QUERY_PROFILER_LARGE_TABLE_ROWS = int(os.getenv('QUERY_PROFILER_LARGE_TABLE_ROWS', '1000'))
+
+# Event loop watchdog: capture the stack whenever the loop is blocked longer than this (disabled if unset)
+LOOP_WATCHDOG_THRESHOLD_SECONDS = float(os.getenv('LOOP_WATCHDOG_THRESHOLD_SECONDS')) \
+    if os.getenv('LOOP_WATCHDOG_THRESHOLD_SECONDS') else None
+
+# Cluster mode (see cluster.py): workers send all database access to the writer process on this Unix socket
+DB_WRITER_SOCKET = os.getenv('DB_WRITER_SOCKET')
+DB_WRITER_COMMIT_INTERVAL_MS = float(os.getenv('DB_WRITER_COMMIT_INTERVAL_MS', '5'))
+DB_WRITER_MAX_BATCH = int(os.getenv('DB_WRITER_MAX_BATCH', '256'))
+DB_READ_CACHE_SIZE = int(os.getenv('DB_READ_CACHE_SIZE', '2048'))
+# Seconds a worker waits for the writer's answer (the nightly maintenance runs a VACUUM, so it gets longer)
+DB_WRITER_TIMEOUT_SECONDS = float(os.getenv('DB_WRITER_TIMEOUT_SECONDS', '30'))
+DB_WRITER_MAINTENANCE_TIMEOUT_SECONDS = float(os.getenv('DB_WRITER_MAINTENANCE_TIMEOUT_SECONDS', '1800'))
+# Gateway shards run by this process (all of them if unset)
+SHARD_COUNT = int(os.getenv('SHARD_COUNT')) if os.getenv('SHARD_COUNT') else None
+SHARD_IDS = [int(shard_id) for shard_id in os.getenv('SHARD_IDS').split(',')] if os.getenv('SHARD_IDS') else None
 
 # Database
 CURRENT_DB_VERSION = os.getenv('CURRENT_DB_VERSION')
 DB_FILENAME_TEMPLATE = 'DPS_v{}.db'
+GUILD_DB_FILENAME_TEMPLATE = 'DPS_v{}_{}.db'
+ARCHIVE_DB_FILENAME = 'DPS_archive.db'
+GUILD_ARCHIVE_DB_FILENAME_TEMPLATE = 'DPS_archive_{}.db'
+# Storage behind the repositories used by the commands: 'sqlite' or 'memory' (tests and benchmarks, nothing is saved)
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'sqlite').lower()
+
+def get_db_filename(version=CURRENT_DB_VERSION, guild_id=None):
+    # The main server keeps the original file name, every other server gets its own database file
+    if guild_id is None or not DISCORD_GUILD_ID or str(guild_id) == DISCORD_GUILD_ID:
+        return DB_FILENAME_TEMPLATE.format(version)
+    return GUILD_DB_FILENAME_TEMPLATE.format(version, guild_id)
 
-def get_db_filename(version=CURRENT_DB_VERSION):
-    return DB_FILENAME_TEMPLATE.format(version)
+def get_archive_db_filename(guild_id=None):
+    # Archived rows outlive database versions, so the archive file name has none
+    if guild_id is None or not DISCORD_GUILD_ID or str(guild_id) == DISCORD_GUILD_ID:
+        return ARCHIVE_DB_FILENAME
+    return GUILD_ARCHIVE_DB_FILENAME_TEMPLATE.format(guild_id)
 
 CURRENT_DB_FILENAME = get_db_filename()
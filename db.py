@@ -1,18 +1,140 @@
 # Standard library imports
+import re
 import sqlite3
 import asyncio
 import aiohttp
 import os
 import time
 import shutil
+import threading
 from sqlite3 import Error
+from contextlib import contextmanager
 from datetime import datetime, timedelta
+from functools import lru_cache
 
 # Third-party imports
 from discord.ext import tasks
 
 # Personal files
-from config import CURRENT_DB_VERSION, get_db_filename, CURRENT_DB_FILENAME, GUILD_ID, API_KEY, ROLE_ID_BIRTHDAY, CHANNEL_ID_GENERAL
+from columns import GuildStatus, LEGACY_CONVERTERS, convert_legacy_row, legacy_snowflake
+from config import CURRENT_DB_VERSION, get_db_filename, get_archive_db_filename, SYNC_CONCURRENCY, DB_WRITER_SOCKET
+from dbwriter import connect_remote, maintain_remote
+from guilds import get_guild_config, configured_guilds
+from gw2 import fetch_guild_roster
+from maintenance import MaintenanceReport, maintain_file
+from members import get_all_members
+from metrics import DB_QUERY_LATENCY, UPDATE_PHASE_LATENCY
+from profiler import get_profiler
+from projection import UserProjection, get_user_projection, set_user_projection, drop_user_projection, \
+    today_key
+from tracing import span
+
+_STATEMENT_TABLE = re.compile(r'\b(?:FROM|INTO|UPDATE|TABLE(?: IF NOT EXISTS)?)\s+(\w+)', re.IGNORECASE)
+
+
+@lru_cache(maxsize=512)
+def statement_labels(sql):
+    """Return the (operation, table) metric labels for an SQL statement."""
+    words = sql.split(None, 1)
+    operation = words[0].upper() if words else '-'
+    match = _STATEMENT_TABLE.search(sql)
+    return operation, match.group(1).lower() if match else '-'
+
+
+class TimedCursor(sqlite3.Cursor):
+    """Cursor that records the execution time of every statement."""
+
+    def execute(self, sql, parameters=()):
+        operation, table = statement_labels(sql)
+        start = time.perf_counter()
+        with span(f"db {operation} {table}"):
+            try:
+                return super().execute(sql, parameters)
+            finally:
+                self._record(sql, parameters, operation, table, time.perf_counter() - start)
+
+    def executemany(self, sql, seq_of_parameters):
+        operation, table = statement_labels(sql)
+        start = time.perf_counter()
+        with span(f"db {operation} {table}"):
+            try:
+                return super().executemany(sql, seq_of_parameters)
+            finally:
+                self._record(sql, (), operation, table, time.perf_counter() - start)
+
+    def _record(self, sql, parameters, operation, table, duration):
+        DB_QUERY_LATENCY.observe(duration, operation=operation, table=table)
+        profiler = get_profiler()
+        if profiler:
+            profiler.record(self.connection, sql, parameters, duration)
+
+
+class TimedConnection(sqlite3.Connection):
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def connect(db_filename=None, guild_id=None):
+    """Open a connection to a server's database (main server by default) with statement timing and profiling."""
+    if db_filename is None:
+        db_filename = get_db_filename(CURRENT_DB_VERSION, guild_id)
+    if DB_WRITER_SOCKET:
+        # Cluster mode: the writer process owns the database files
+        return connect_remote(db_filename)
+    conn = sqlite3.connect(db_filename, factory=TimedConnection)
+    profiler = get_profiler()
+    if profiler:
+        conn.set_trace_callback(profiler.on_trace)
+    return conn
+
+
+class SharedConnection:
+    __slots__ = ('conn', 'generation', 'depth')
+
+    def __init__(self, conn, generation):
+        self.conn = conn
+        self.generation = generation
+        self.depth = 0  # Nested shared_cursor blocks
+
+
+# Long-lived connections of the repositories, one per thread and database file (worker threads of
+# asyncio.to_thread get their own). A file's generation is bumped when it is replaced, so they reconnect.
+_shared = threading.local()
+_generations = {}
+
+
+@contextmanager
+def shared_cursor(guild_id=None):
+    """A cursor on this thread's shared connection to a server's database. Changes are committed when the outermost
+    block exits without an error and rolled back otherwise; nested blocks are part of the same transaction."""
+    db_filename = get_db_filename(CURRENT_DB_VERSION, guild_id)
+    connections = _shared.__dict__.setdefault('connections', {})
+    shared = connections.get(db_filename)
+    if shared is None or shared.generation != _generations.get(db_filename, 0):
+        if shared is not None:
+            shared.conn.close()
+        shared = connections[db_filename] = SharedConnection(connect(db_filename), _generations.get(db_filename, 0))
+
+    shared.depth += 1
+    try:
+        if shared.depth > 1:
+            yield shared.conn.cursor()
+        else:
+            with shared.conn:
+                yield shared.conn.cursor()
+    finally:
+        shared.depth -= 1
+
+
+def reset_shared_connections(db_filename):
+    """Have every thread reopen its shared connection to a database file that was created or removed."""
+    _generations[db_filename] = _generations.get(db_filename, 0) + 1
 
 
 def get_current_db_version():
@@ -28,23 +150,25 @@ def set_current_db_version(version):
         f.write(version)
 
 
-def init_db(version, bot):
-    db_filename = get_db_filename(version)
-    conn = sqlite3.connect(db_filename)
-    c = conn.cursor()
+class DatabaseMigrationError(Exception):
+    """The databases can't be brought up to date automatically."""
+
 
-    # Users table
+def create_schema(c):
+    """Create any missing tables and indexes. Safe to run on an existing database."""
+    # Users table. Discord IDs are INTEGER snowflakes and dates Unix seconds throughout; guild_status and
+    # alt_guild_status hold a GuildStatus, birthday is yyyymmdd (0 if not set). See columns.py.
     c.execute('''
         CREATE TABLE IF NOT EXISTS users (
-            discord_id TEXT PRIMARY KEY,
+            discord_id INTEGER PRIMARY KEY,
             gw2_id TEXT NOT NULL COLLATE NOCASE DEFAULT 'Unknown',
-            guild_status TEXT NOT NULL DEFAULT '-',
+            guild_status INTEGER NOT NULL DEFAULT 0,
             alt_gw2_id TEXT NOT NULL COLLATE NOCASE DEFAULT '-',
-            alt_guild_status TEXT NOT NULL DEFAULT '-',
+            alt_guild_status INTEGER NOT NULL DEFAULT 0,
             watchlist_reason TEXT NOT NULL DEFAULT '-',
             warnings INTEGER NOT NULL DEFAULT 0,
-            last_warning_date TEXT NOT NULL DEFAULT '-',
-            birthday TEXT NOT NULL DEFAULT '-'
+            last_warning_date INTEGER,
+            birthday INTEGER NOT NULL DEFAULT 0
         )
     ''')
 
@@ -52,19 +176,20 @@ def init_db(version, bot):
     c.execute('''
         CREATE TABLE IF NOT EXISTS warnings (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
-            discord_id TEXT NOT NULL,
+            discord_id INTEGER NOT NULL,
             reason TEXT NOT NULL,
-            date TEXT NOT NULL,
+            date INTEGER NOT NULL,
             FOREIGN KEY(discord_id) REFERENCES users(discord_id) ON DELETE CASCADE
         )
     ''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_warnings_discord_id ON warnings (discord_id, date)")
 
     # Bans table
     c.execute('''
         CREATE TABLE IF NOT EXISTS bans (
-            discord_id TEXT PRIMARY KEY,
+            discord_id INTEGER PRIMARY KEY,
             reason TEXT NOT NULL,
-            date TEXT NOT NULL
+            date INTEGER NOT NULL
         )
     ''')
 
@@ -72,8 +197,8 @@ def init_db(version, bot):
     c.execute('''
         CREATE TABLE IF NOT EXISTS mentor_applications (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
-            timestamp TEXT DEFAULT CURRENT_TIMESTAMP,
-            discord_id TEXT NOT NULL,
+            timestamp INTEGER NOT NULL DEFAULT (CAST(strftime('%s', 'now') AS INTEGER)),
+            discord_id INTEGER NOT NULL,
             gw2_id TEXT NOT NULL,
             joined_how TEXT NOT NULL,
             timezone TEXT NOT NULL,
@@ -85,13 +210,184 @@ def init_db(version, bot):
         )
     ''')
 
+    # GW2 guild roster, refreshed whenever the roster is fetched from the API
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS guild_roster (
+            name TEXT PRIMARY KEY COLLATE NOCASE,
+            rank TEXT NOT NULL DEFAULT '-',
+            joined TEXT,
+            updated_at TEXT NOT NULL
+        )
+    ''')
+
+    # Discord side effects (DMs, mentors channel posts, role edits) written together with the change that causes
+    # them, and delivered by the outbox workers (see outbox.py). A row is deleted once delivered.
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            idempotency_key TEXT NOT NULL UNIQUE,
+            kind TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL,
+            created_at TEXT NOT NULL,
+            last_error TEXT,
+            status TEXT NOT NULL DEFAULT 'pending'
+        )
+    ''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox (status, next_attempt_at)")
+
+    # State of multi-step interactions, e.g. mentor application drafts (see sessions.py)
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS sessions (
+            flow TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            data TEXT NOT NULL,
+            expires_at REAL NOT NULL,
+            PRIMARY KEY (flow, user_id)
+        )
+    ''')
+
+    # Append-only record of moderation actions, written in batches (see audit.py). Browsed by actor, target and
+    # time range, newest first.
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS audit_log (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            created_at REAL NOT NULL,
+            actor_id INTEGER NOT NULL,
+            action TEXT NOT NULL,
+            target_id INTEGER,
+            details TEXT
+        )
+    ''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_audit_log_created_at ON audit_log (created_at)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_audit_log_actor ON audit_log (actor_id, created_at)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_audit_log_target ON audit_log (target_id, created_at)")
+
+    # Indexes for looking up users and joining them against the roster by GW2 ID
+    c.execute("CREATE INDEX IF NOT EXISTS idx_users_gw2_id ON users (gw2_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_users_alt_gw2_id ON users (alt_gw2_id)")
+
+    create_search_index(c)
+
+
+def is_legacy_table(c, table):
+    """Whether a table predates the typed schema (its Discord IDs are TEXT)."""
+    snowflakes = {column for column, convert in LEGACY_CONVERTERS[table].items() if convert is legacy_snowflake}
+    c.execute(f"PRAGMA table_info({table})")
+    return any(column[1] in snowflakes and column[2].upper() == 'TEXT' for column in c.fetchall())
+
+
+def convert_legacy_rows(table, columns, rows):
+    """Convert the rows of a legacy table to the typed schema, reporting the rows that can't be converted."""
+    converted = []
+    for row in rows:
+        typed = convert_legacy_row(table, columns, row)
+        if typed is None:
+            print(f"Dropped a row of {table} with an unreadable Discord ID: {dict(zip(columns, row))}")
+        else:
+            converted.append(typed)
+    return converted
+
+
+# Full-text search tables (see /search). Warnings and applications are indexed as external content (the FTS
+# table stores only the index); the watchlist reasons are copied, since `INSERT OR REPLACE INTO users` removes the
+# old row without firing a delete trigger.
+SEARCH_TABLES = {
+    'warnings_fts': (
+        "CREATE VIRTUAL TABLE warnings_fts USING fts5(reason, content='warnings', content_rowid='id', "
+        "tokenize='porter unicode61 remove_diacritics 2')",
+        "INSERT INTO warnings_fts (warnings_fts) VALUES ('rebuild')",
+    ),
+    'applications_fts': (
+        "CREATE VIRTUAL TABLE applications_fts USING fts5(gw2_id, joined_how, timezone, has_commander_tag, "
+        "content_preference, has_led_event, event_interest, changes_suggested, content='mentor_applications', "
+        "content_rowid='id', tokenize='porter unicode61 remove_diacritics 2')",
+        "INSERT INTO applications_fts (applications_fts) VALUES ('rebuild')",
+    ),
+    'watchlist_fts': (
+        "CREATE VIRTUAL TABLE watchlist_fts USING fts5(discord_id UNINDEXED, reason, "
+        "tokenize='porter unicode61 remove_diacritics 2')",
+        "INSERT INTO watchlist_fts (discord_id, reason) "
+        "SELECT discord_id, watchlist_reason FROM users WHERE watchlist_reason != '-'",
+    ),
+}
+
+APPLICATION_TEXT_COLUMNS = ('gw2_id', 'joined_how', 'timezone', 'has_commander_tag', 'content_preference',
+                            'has_led_event', 'event_interest', 'changes_suggested')
+
+_TRIGGER_NAME = re.compile(r'TRIGGER IF NOT EXISTS (\w+)')
+
+SEARCH_TRIGGERS = [
+    """CREATE TRIGGER IF NOT EXISTS warnings_fts_insert AFTER INSERT ON warnings BEGIN
+        INSERT INTO warnings_fts (rowid, reason) VALUES (new.id, new.reason);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS warnings_fts_delete AFTER DELETE ON warnings BEGIN
+        INSERT INTO warnings_fts (warnings_fts, rowid, reason) VALUES ('delete', old.id, old.reason);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS warnings_fts_update AFTER UPDATE OF reason ON warnings BEGIN
+        INSERT INTO warnings_fts (warnings_fts, rowid, reason) VALUES ('delete', old.id, old.reason);
+        INSERT INTO warnings_fts (rowid, reason) VALUES (new.id, new.reason);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS applications_fts_insert AFTER INSERT ON mentor_applications BEGIN
+        INSERT INTO applications_fts (rowid, {', '.join(APPLICATION_TEXT_COLUMNS)})
+        VALUES (new.id, {', '.join('new.' + column for column in APPLICATION_TEXT_COLUMNS)});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS applications_fts_delete AFTER DELETE ON mentor_applications BEGIN
+        INSERT INTO applications_fts (applications_fts, rowid, {', '.join(APPLICATION_TEXT_COLUMNS)})
+        VALUES ('delete', old.id, {', '.join('old.' + column for column in APPLICATION_TEXT_COLUMNS)});
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS watchlist_fts_insert AFTER INSERT ON users BEGIN
+        DELETE FROM watchlist_fts WHERE discord_id = new.discord_id;
+        INSERT INTO watchlist_fts (discord_id, reason)
+        SELECT new.discord_id, new.watchlist_reason WHERE new.watchlist_reason != '-';
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS watchlist_fts_update AFTER UPDATE OF discord_id, watchlist_reason ON users
+    WHEN old.watchlist_reason != new.watchlist_reason OR old.discord_id != new.discord_id BEGIN
+        DELETE FROM watchlist_fts WHERE discord_id = old.discord_id;
+        INSERT INTO watchlist_fts (discord_id, reason)
+        SELECT new.discord_id, new.watchlist_reason WHERE new.watchlist_reason != '-';
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS watchlist_fts_delete AFTER DELETE ON users WHEN old.watchlist_reason != '-' BEGIN
+        DELETE FROM watchlist_fts WHERE discord_id = old.discord_id;
+    END""",
+]
+
+
+def create_search_index(c):
+    """Create the full-text search tables and their triggers, indexing the existing rows of new tables."""
+    c.execute(f"SELECT name FROM sqlite_master WHERE type = 'table' "
+              f"AND name IN ({', '.join('?' * len(SEARCH_TABLES))})", tuple(SEARCH_TABLES))
+    existing = {row[0] for row in c.fetchall()}
+    for name, (create, populate) in SEARCH_TABLES.items():
+        if name not in existing:
+            c.execute(create)
+            c.execute(populate)
+    for trigger in SEARCH_TRIGGERS:
+        c.execute(trigger)
+
+
+def init_db(version, members, guild_id=None):
+    db_filename = get_db_filename(version, guild_id)
+    reset_shared_connections(db_filename)
+    if not DB_WRITER_SOCKET:
+        # Must be set before the first table is created and outside a transaction; the nightly maintenance then
+        # returns free pages with PRAGMA incremental_vacuum. (Cluster databases are converted by the maintenance.)
+        plain = sqlite3.connect(db_filename, isolation_level=None)
+        plain.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        plain.close()
+    conn = connect(db_filename)
+    c = conn.cursor()
+    create_schema(c)
+
     # Populate users table with current Discord members
-    guild = bot.guilds[0]  # Assuming the bot is only in one server
-    for member in guild.members:
-        c.execute("INSERT OR IGNORE INTO users (discord_id) VALUES (?)", (str(member.id),))
+    for member in members:
+        c.execute("INSERT OR IGNORE INTO users (discord_id) VALUES (?)", (member.id,))
 
     conn.commit()
     conn.close()
+    # A server's projection of its previous users table is stale now (the main server's may be keyed by ID)
+    drop_user_projection(guild_id)
     print(f"Database initialized successfully: {db_filename}")
 
 
@@ -105,20 +401,29 @@ def get_common_columns(old_cursor, new_cursor, table_name):
     return list(old_columns.intersection(new_columns))
 
 
-def migrate_data(old_version, new_version):
-    old_db = get_db_filename(old_version)
-    new_db = get_db_filename(new_version)
+def migrate_data(old_version, new_version, guild_id=None):
+    old_db = get_db_filename(old_version, guild_id)
+    new_db = get_db_filename(new_version, guild_id)
 
-    old_conn = sqlite3.connect(old_db)
-    new_conn = sqlite3.connect(new_db)
+    old_conn = connect(old_db)
+    new_conn = connect(new_db)
     old_cursor = old_conn.cursor()
     new_cursor = new_conn.cursor()
 
     try:
+        # Values of a legacy database (before the typed schema) are converted; the old file is left as it is
+        legacy = {table for table in LEGACY_CONVERTERS if is_legacy_table(old_cursor, table)}
+
+        def read(table, columns, sql, params=()):
+            old_cursor.execute(sql, params)
+            rows = old_cursor.fetchall()
+            if table in legacy:
+                rows = convert_legacy_rows(table, columns, rows)
+            return rows
+
         # Migrate users table
         common_user_columns = get_common_columns(old_cursor, new_cursor, 'users')
-        old_cursor.execute(f"SELECT {', '.join(common_user_columns)} FROM users")
-        users = old_cursor.fetchall()
+        users = read('users', common_user_columns, f"SELECT {', '.join(common_user_columns)} FROM users")
 
         for user in users:
             discord_id = user[common_user_columns.index('discord_id')]
@@ -136,9 +441,9 @@ def migrate_data(old_version, new_version):
         common_warning_columns = get_common_columns(old_cursor, new_cursor, 'warnings')
         for user in users:
             discord_id = user[common_user_columns.index('discord_id')]
-            old_cursor.execute(f"SELECT {', '.join(common_warning_columns)} FROM warnings WHERE discord_id = ?",
-                               (discord_id,))
-            warnings = old_cursor.fetchall()
+            warnings = read('warnings', common_warning_columns,
+                            f"SELECT {', '.join(common_warning_columns)} FROM warnings WHERE discord_id = ?",
+                            (discord_id,))
             for warning in warnings:
                 placeholders = ', '.join(['?' for _ in common_warning_columns])
                 new_cursor.execute(f'''
@@ -146,11 +451,12 @@ def migrate_data(old_version, new_version):
                     VALUES ({placeholders})
                 ''', warning)
 
-        # Migrate other tables: bans, mentor_applications, shouts
-        for table in ['bans', 'mentor_applications']:
+        # Migrate other tables: bans, mentor_applications, undelivered outbox entries, the audit log
+        for table in ['bans', 'mentor_applications', 'outbox', 'audit_log']:
             common_columns = get_common_columns(old_cursor, new_cursor, table)
-            old_cursor.execute(f"SELECT {', '.join(common_columns)} FROM {table}")
-            rows = old_cursor.fetchall()
+            if not common_columns:
+                continue  # Not in the old version
+            rows = read(table, common_columns, f"SELECT {', '.join(common_columns)} FROM {table}")
 
             for row in rows:
                 placeholders = ', '.join(['?' for _ in common_columns])
@@ -171,157 +477,251 @@ def migrate_data(old_version, new_version):
         new_conn.close()
 
 
-def check_and_update_db(bot):
+async def check_and_update_db(bot):
     current_version = get_current_db_version()
+    if current_version == CURRENT_DB_VERSION:
+        for guild in configured_guilds(bot.guilds):
+            await prepare_guild_db(guild)
+        print(f"Database structure is up to date (version {CURRENT_DB_VERSION})")
+        return
 
     if not current_version:
         print("No existing database found. Initializing new database.")
-        init_db(CURRENT_DB_VERSION, bot)
+        for guild in configured_guilds(bot.guilds):
+            init_db(CURRENT_DB_VERSION, await get_all_members(guild), guild.id)
         set_current_db_version(CURRENT_DB_VERSION)
         return
 
     if current_version != CURRENT_DB_VERSION:
         print(f"Database structure update required. Current version: {current_version}, Latest version: {CURRENT_DB_VERSION}")
 
-        # Initialize the new database
-        new_db_filename = get_db_filename(CURRENT_DB_VERSION)
-        init_db(CURRENT_DB_VERSION, bot)
+        migrated = True
+        for guild in configured_guilds(bot.guilds):
+            # A server added since the last version has nothing to migrate
+            if not os.path.exists(get_db_filename(current_version, guild.id)):
+                init_db(CURRENT_DB_VERSION, await get_all_members(guild), guild.id)
+                continue
+            migrated = await update_guild_db(guild, current_version) and migrated
 
-        try:
-            # Perform data migration
-            if migrate_data(current_version, CURRENT_DB_VERSION):
-                # Update the version file only if migration was successful
-                set_current_db_version(CURRENT_DB_VERSION)
-                print("Database structure update completed successfully")
-            else:
-                print("Database update failed. Reverting to previous version.")
-                if os.path.exists(new_db_filename):
-                    os.remove(new_db_filename)
+        # Update the version file only if every server's migration was successful
+        if migrated:
+            set_current_db_version(CURRENT_DB_VERSION)
+            print("Database structure update completed successfully")
 
-        except Exception as e:
-            print(f"Failed to update database: {e}")
-            # Delete the newly created database file if migration failed
-            if os.path.exists(new_db_filename):
-                os.remove(new_db_filename)
-            print(f"Deleted new database file: {new_db_filename}")
-    else:
-        print(f"Database structure is up to date (version {CURRENT_DB_VERSION})")
 
+async def update_guild_db(guild, current_version):
+    """Move a server's data from the `current_version` database to a new database. Returns True on success."""
+    # Initialize the new database
+    new_db_filename = get_db_filename(CURRENT_DB_VERSION, guild.id)
+    init_db(CURRENT_DB_VERSION, await get_all_members(guild), guild.id)
+
+    try:
+        # Perform data migration
+        if migrate_data(current_version, CURRENT_DB_VERSION, guild.id):
+            return True
+        print("Database update failed. Reverting to previous version.")
+        if os.path.exists(new_db_filename):
+            os.remove(new_db_filename)
+
+    except Exception as e:
+        print(f"Failed to update database: {e}")
+        # Delete the newly created database file if migration failed
+        if os.path.exists(new_db_filename):
+            os.remove(new_db_filename)
+        print(f"Deleted new database file: {new_db_filename}")
+    reset_shared_connections(new_db_filename)
+    return False
+
+
+async def prepare_guild_db(guild):
+    """Create the database of a server that does not have one yet, or add any missing tables to it."""
+    if not os.path.exists(get_db_filename(CURRENT_DB_VERSION, guild.id)):
+        init_db(CURRENT_DB_VERSION, await get_all_members(guild), guild.id)
+        return
+
+    conn = connect(guild_id=guild.id)
+    try:
+        c = conn.cursor()
+        # The typed schema needs a new version: migrate_data converts the data into a new file and keeps the old one
+        legacy = [table for table in LEGACY_CONVERTERS if is_legacy_table(c, table)]
+        if legacy:
+            raise DatabaseMigrationError(
+                f"{get_db_filename(CURRENT_DB_VERSION, guild.id)} predates the typed schema ({', '.join(legacy)}). "
+                f"Set CURRENT_DB_VERSION to a new version to migrate it to a new database file.")
+
+        # Add tables and indexes introduced without a version bump
+        create_schema(c)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def save_guild_roster(conn, roster):
+    """Replace the stored guild roster with a fresh copy from the GW2 API."""
+    now = datetime.now().isoformat()
+    c = conn.cursor()
+    c.execute("DELETE FROM guild_roster")
+    c.executemany("INSERT OR REPLACE INTO guild_roster (name, rank, joined, updated_at) VALUES (?, ?, ?, ?)",
+                  [(member['name'], member.get('rank') or '-', member.get('joined'), now) for member in roster])
+    conn.commit()
 
-async def get_guild_members():
+
+async def get_guild_members(guild_id=None):
+    """Fetch a server's guild roster and store it. Returns the roster entries, or None on failure."""
     async with aiohttp.ClientSession() as session:
-        url = f"https://api.guildwars2.com/v2/guild/{GUILD_ID}/members"
-        headers = {"Authorization": f"Bearer {API_KEY}"}
-        async with session.get(url, headers=headers) as response:
-            if response.status == 200:
-                return [member['name'] for member in await response.json()]
-            else:
-                print(f"Failed to fetch guild members: {response.status}")
-                return []
+        status, roster = await fetch_guild_roster(session, guild_id)
+        if roster is None:
+            print(f"Failed to fetch guild members: {status}")
+            return None
+
+    with connect(guild_id=guild_id) as conn:
+        save_guild_roster(conn, roster)
+    conn.close()
+    return roster
 
 
 async def update_database(bot):
-    print("Updating database...")
-    conn = sqlite3.connect(CURRENT_DB_FILENAME)
+    """Sync every server's database, at most SYNC_CONCURRENCY servers at a time."""
+    semaphore = asyncio.Semaphore(SYNC_CONCURRENCY)
+
+    async def sync(guild):
+        async with semaphore:
+            try:
+                await update_guild_database(bot, guild)
+            except Exception as e:
+                # One server failing must not stop the others
+                print(f"Database update failed for {guild.name}: {e}")
+
+    await asyncio.gather(*(sync(guild) for guild in configured_guilds(bot.guilds)))
+
+
+async def update_guild_database(bot, guild):
+    print(f"Updating database for {guild.name}...")
+    guild_config = get_guild_config(guild.id)
+    conn = connect(guild_id=guild.id)
     c = conn.cursor()
 
     # Get all current members from the Discord server
-    guild = bot.guilds[0]  # Assuming the bot is only in one server
-    current_members = set(str(member.id) for member in guild.members)
-
-    # Get all users currently in the database
-    c.execute("SELECT discord_id, gw2_id, alt_gw2_id, birthday FROM users")
-    db_users = {
-        row[0]: {'gw2_id': row[1], 'alt_gw2_id': row[2], 'birthday': row[3]}
-        for row in c.fetchall()
-    }
-
-    # Fetch guild members from GW2 API
-    guild_members = await get_guild_members()
-
-    # Add new members to the database
-    new_members = current_members - set(db_users.keys())
-    for member_id in new_members:
-        c.execute("INSERT INTO users (discord_id, gw2_id, birthday) VALUES (?, ?, ?)", (member_id, "Unknown", '-'))
-        print(f"Added new user: {member_id}")
-
-    # Remove members who are no longer on the server
-    removed_members = set(db_users.keys()) - current_members
-    for member_id in removed_members:
-        c.execute("DELETE FROM users WHERE discord_id = ?", (member_id,))
-        c.execute("DELETE FROM warnings WHERE discord_id = ?", (member_id,))
-        print(f"Removed user: {member_id}")
-
-    # Get the birthday role
-    birthday_role = guild.get_role(ROLE_ID_BIRTHDAY)  # Use ROLE_ID_BIRTHDAY to get the role
-
-    # Prepare a list for birthday users
-    birthday_users = []
-
-    # Update Guild Status for all users and manage birthday roles
-    today = datetime.now().strftime("%d.%m")  # Format as "day.month"
-    for discord_id, user_data in db_users.items():
-        gw2_id = user_data['gw2_id']
-        alt_gw2_id = user_data['alt_gw2_id']
-        birthday = user_data['birthday']
-
-        guild_status = "Member" if gw2_id in guild_members else "-"
-        alt_guild_status = "Member" if alt_gw2_id in guild_members else "-"
-
-        # Update user status in database
-        c.execute("""
-            UPDATE users
-            SET guild_status = ?, alt_guild_status = ?
-            WHERE discord_id = ?
-        """, (guild_status, alt_guild_status, discord_id))
-
-        # Print update details
-        # print(f"Updated user {discord_id}: Guild Status: {guild_status}, Alt Guild Status: {alt_guild_status}")
-
-        # Handle birthday role assignment and collect birthday users
-        member = guild.get_member(int(discord_id))
-        if member:
-            if birthday != '-' and birthday:
-                try:
-                    # Format birthday as "day.month" and compare with today's date
-                    birthday_date = datetime.strptime(birthday, "%d.%m.%Y")
-                    birthday_today = birthday_date.strftime("%d.%m")
-
-                    if birthday_today == today:
-                        if birthday_role and birthday_role not in member.roles:
-                            await member.add_roles(birthday_role)
-                            print(f"Assigned birthday role to {discord_id}")
-                        birthday_users.append(member.mention)  # Collect mentions for the announcement
-                    else:
-                        if birthday_role and birthday_role in member.roles:
-                            await member.remove_roles(birthday_role)
-                            print(f"Removed birthday role from {discord_id}")
-                except ValueError as e:
-                    print(f"Error parsing birthday for {discord_id}: {e}")
-            else:
-                # If birthday is '-' or None, ensure the role is removed
-                if birthday_role and birthday_role in member.roles:
-                    await member.remove_roles(birthday_role)
-                    print(f"Removed birthday role from {discord_id}")
+    with UPDATE_PHASE_LATENCY.time(phase='discord_members'):
+        members_by_id = {member.id: member for member in await get_all_members(guild)}
+
+    # The users table as of the last sync, read from the database only on the first one
+    with UPDATE_PHASE_LATENCY.time(phase='load_users'):
+        users = get_user_projection(guild.id)
+        if users is None:
+            users = UserProjection()
+            c.execute("SELECT discord_id, gw2_id, alt_gw2_id, guild_status, alt_guild_status, birthday FROM users")
+            users.load(c.fetchall())
+            set_user_projection(guild.id, users)
+
+    # Fetch guild members from GW2 API into the guild_roster table
+    with UPDATE_PHASE_LATENCY.time(phase='gw2_roster'):
+        roster = await get_guild_members(guild.id)
+
+    # No awaits from here to the commit, so no command writes to the users table in between
+    try:
+        # Add new members to the database
+        with UPDATE_PHASE_LATENCY.time(phase='add_members'):
+            new_members, removed_members = users.diff(members_by_id)
+            for member_id in new_members:
+                c.execute("INSERT INTO users (discord_id) VALUES (?)", (member_id,))
+                print(f"Added new user: {member_id}")
+
+        # Remove members who are no longer on the server
+        with UPDATE_PHASE_LATENCY.time(phase='remove_members'):
+            for member_id in removed_members:
+                c.execute("DELETE FROM users WHERE discord_id = ?", (member_id,))
+                c.execute("DELETE FROM warnings WHERE discord_id = ?", (member_id,))
+                print(f"Removed user: {member_id}")
+
+        # Update the guild statuses that differ from the roster
+        # (keeps the last known statuses if the roster could not be fetched)
+        with UPDATE_PHASE_LATENCY.time(phase='statuses'):
+            status_changes = []
+            if roster is not None:
+                status_changes = users.status_changes(member['name'] for member in roster)
+                c.executemany("UPDATE users SET guild_status = ?, alt_guild_status = ? WHERE discord_id = ?",
+                              [(GuildStatus(member), GuildStatus(alt_member), discord_id)
+                               for discord_id, member, alt_member in status_changes])
+
+        with UPDATE_PHASE_LATENCY.time(phase='commit'):
+            conn.commit()
+    except Exception:
+        # The projection no longer matches the table; the next sync reads it again
+        drop_user_projection(guild.id)
+        raise
+    finally:
+        conn.close()
+
+    # Users without a row yet have no birthday, and those who left have no roles to change
+    birthday_role = guild.get_role(guild_config.role_birthday)
+    today = today_key()
+    celebrated, done = [], []
+    for discord_id, user in users.users.items():
+        member = members_by_id.get(discord_id)
+        if not member:
+            continue
+        if user.birthday == today:
+            celebrated.append(member)
+        elif birthday_role and birthday_role in member.roles:
+            done.append(member)
+
+    with UPDATE_PHASE_LATENCY.time(phase='projection'):
+        for member_id in new_members:
+            users.put(member_id)
+        for member_id in removed_members:
+            users.discard(member_id)
+        users.set_statuses(status_changes)
+
+    # Manage birthday roles
+    with UPDATE_PHASE_LATENCY.time(phase='birthdays'):
+        for member in celebrated:
+            if birthday_role and birthday_role not in member.roles:
+                await member.add_roles(birthday_role)
+                print(f"Assigned birthday role to {member.id}")
+        for member in done:
+            await member.remove_roles(birthday_role)
+            print(f"Removed birthday role from {member.id}")
 
     # Send birthday announcement message if there are birthday users
-    if birthday_users:
-        birthday_message = f"# 🎂 *Happy Birthday!* 🎂{''.join(birthday_users)} 🎉 *Have a great day!* 🎉"
+    with UPDATE_PHASE_LATENCY.time(phase='birthday_announcement'):
+        if celebrated:
+            birthday_mentions = ''.join(member.mention for member in celebrated)
+            birthday_message = f"# 🎂 *Happy Birthday!* 🎂{birthday_mentions} 🎉 *Have a great day!* 🎉"
 
-        # Send the message to general channel
-        channel = guild.get_channel(CHANNEL_ID_GENERAL)  # Replace YOUR_CHANNEL_ID with the actual channel ID
-        if channel:
-            await channel.send(birthday_message)
-            print("Sent birthday announcement.")
+            # Send the message to general channel
+            channel = guild.get_channel(guild_config.channel_general)
+            if channel:
+                await channel.send(birthday_message)
+                print("Sent birthday announcement.")
 
-    conn.commit()
-    conn.close()
-    print("Database update completed.")
+    print(f"Database update completed for {guild.name}.")
+
+
+def run_maintenance(guild_id=None, retention=None):
+    """Archive, vacuum, analyze and checkpoint a server's database (see maintenance.py)."""
+    db_filename = get_db_filename(CURRENT_DB_VERSION, guild_id)
+    archive_filename = get_archive_db_filename(guild_id)
+    if DB_WRITER_SOCKET:
+        # The writer runs it on its connection and invalidates the workers' cached reads of archived tables
+        return MaintenanceReport(**maintain_remote(db_filename, archive_filename, retention))
+    return maintain_file(db_filename, archive_filename, retention)
+
+
+async def maintain_databases(bot):
+    """Run the maintenance of every server's database, one at a time, off the event loop."""
+    for guild in configured_guilds(bot.guilds):
+        try:
+            report = await asyncio.to_thread(run_maintenance, guild.id)
+            print(report.summary())
+        except Exception as e:
+            print(f"Database maintenance failed for {guild.name}: {e}")
 
 
 @tasks.loop(hours=24)
 async def daily_update(bot):
     await update_database(bot)
+    await maintain_databases(bot)
 
 
 async def start_daily_update(bot):
@@ -0,0 +1,517 @@
+# Standard library imports
+import os
+import re
+import sys
+import json
+import time
+import socket
+import sqlite3
+import asyncio
+import threading
+from collections import OrderedDict
+
+# Personal files
+from config import DB_WRITER_SOCKET, DB_WRITER_COMMIT_INTERVAL_MS, DB_WRITER_MAX_BATCH, DB_READ_CACHE_SIZE, \
+    DB_WRITER_TIMEOUT_SECONDS, DB_WRITER_MAINTENANCE_TIMEOUT_SECONDS
+from maintenance import maintain
+from metrics import DB_QUERY_LATENCY, record_cache
+from tracing import span
+
+_READ_STATEMENT = re.compile(r'^\s*(?:SELECT|EXPLAIN|WITH|PRAGMA\s+\w+\s*(?:\(|;|$))', re.IGNORECASE)
+_READ_TABLES = re.compile(r'\b(?:FROM|JOIN)\s+(\w+)', re.IGNORECASE)
+_WRITE_TABLES = re.compile(
+    r'\b(?:INSERT(?:\s+OR\s+\w+)?\s+INTO|REPLACE\s+INTO|UPDATE(?:\s+OR\s+\w+)?|DELETE\s+FROM'
+    r'|(?:CREATE|DROP|ALTER)\s+(?:VIRTUAL\s+)?TABLE(?:\s+IF\s+(?:NOT\s+)?EXISTS)?'
+    r'|INDEX(?:\s+IF\s+(?:NOT\s+)?EXISTS)?\s+\w+\s+ON)\s+(\w+)', re.IGNORECASE)
+_TRIGGER_TARGET = re.compile(r'\bON\s+(\w+)', re.IGNORECASE)
+_SCHEMA_STATEMENT = re.compile(r'^\s*(?:CREATE|DROP|ALTER)\b', re.IGNORECASE)
+
+# Largest request line the writer accepts (bulk inserts send every row in one message)
+MESSAGE_LIMIT = 256 * 1024 * 1024
+
+
+def is_read(sql):
+    return bool(_READ_STATEMENT.match(sql))
+
+
+def read_tables(sql):
+    return {table.lower() for table in _READ_TABLES.findall(sql)}
+
+
+def write_tables(sql):
+    return {table.lower() for table in _WRITE_TABLES.findall(sql)}
+
+
+# -------------- Writer process ----------------
+class DatabaseWriter:
+    """Owns the SQLite files in cluster mode and serves the worker processes over a Unix socket.
+
+    Reads run immediately. Writes arrive as small transactions, are queued and applied in group commits:
+    everything queued within `commit_interval` seconds (up to `max_batch` transactions) shares one COMMIT,
+    each transaction inside its own savepoint. After a commit, every worker is told which tables changed
+    before the writing worker gets its answer, so no worker serves a cached read older than a write it saw.
+    """
+
+    def __init__(self, socket_path, commit_interval=DB_WRITER_COMMIT_INTERVAL_MS / 1000,
+                 max_batch=DB_WRITER_MAX_BATCH):
+        self.socket_path = socket_path
+        self.commit_interval = commit_interval
+        self.max_batch = max_batch
+        self._connections = {}
+        self._triggers = {}
+        self._clients = set()
+        self._queue = asyncio.Queue()
+        self.commits = 0
+        self.transactions = 0
+
+    def _connect(self, database):
+        conn = self._connections.get(database)
+        if conn is None:
+            conn = sqlite3.connect(database, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._connections[database] = conn
+        return conn
+
+    def _trigger_tables(self, conn, database):
+        """Map each table to the tables its triggers write to, so their cached reads are invalidated too."""
+        if database not in self._triggers:
+            triggers = {}
+            for (sql,) in conn.execute("SELECT sql FROM sqlite_master WHERE type = 'trigger' AND sql IS NOT NULL"):
+                match = _TRIGGER_TARGET.search(sql)
+                if match:
+                    triggers.setdefault(match.group(1).lower(), set()).update(write_tables(sql))
+            self._triggers[database] = triggers
+        return self._triggers[database]
+
+    async def serve(self):
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        server = await asyncio.start_unix_server(self._handle_client, path=self.socket_path, limit=MESSAGE_LIMIT)
+        os.chmod(self.socket_path, 0o600)
+        commit_task = asyncio.create_task(self._commit_loop())
+        print(f"Database writer listening on {self.socket_path}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            commit_task.cancel()
+            for conn in self._connections.values():
+                conn.close()
+
+    async def _handle_client(self, reader, writer):
+        self._clients.add(writer)
+        try:
+            while line := await reader.readline():
+                request = json.loads(line)
+                if request['op'] == 'query':
+                    self._send(writer, self._query(request))
+                elif request['op'] == 'maintenance':
+                    self._send(writer, self._maintain(request))
+                else:
+                    await self._queue.put((writer, request))
+        except (ConnectionError, ValueError) as e:
+            print(f"Database writer client error: {e}")
+        finally:
+            self._clients.discard(writer)
+            writer.close()
+
+    def _query(self, request):
+        try:
+            cursor = self._connect(request['database']).execute(request['sql'], request['params'])
+            return {
+                'id': request['id'],
+                'rows': cursor.fetchall(),
+                'description': [column[0] for column in cursor.description or ()],
+            }
+        except sqlite3.Error as e:
+            return {'id': request['id'], 'error': str(e), 'error_type': type(e).__name__}
+
+    def _maintain(self, request):
+        """Run the nightly maintenance on the writer's own connection, between two group commits."""
+        database = request['database']
+        conn = self._connect(database)
+        try:
+            report = maintain(conn, database, request['archive'], request.get('retention'))
+        except sqlite3.Error as e:
+            return {'id': request['id'], 'error': str(e), 'error_type': type(e).__name__}
+
+        changed = set(report.changed_tables)
+        for table in list(changed):
+            changed |= self._trigger_tables(conn, database).get(table, set())
+        if changed:
+            message = {'invalidate': sorted(changed), 'database': database}
+            for client in list(self._clients):
+                self._send(client, message)
+        return {'id': request['id'], 'report': report._asdict()}
+
+    async def _commit_loop(self):
+        while True:
+            batch = [await self._queue.get()]
+            # Give concurrent writers a moment to join this commit
+            deadline = time.monotonic() + self.commit_interval
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                self._commit(batch)
+            except Exception as e:
+                # Keep committing later batches; _commit answers the transactions of a failed database itself
+                print(f"Database writer commit loop error: {e}")
+
+    def _commit(self, batch):
+        by_database = {}
+        for writer, request in batch:
+            by_database.setdefault(request['database'], []).append((writer, request))
+
+        responses = []
+        for database, requests in by_database.items():
+            changed = set()
+            try:
+                conn = self._connect(database)
+                conn.execute("BEGIN IMMEDIATE")
+                applied = [(writer, self._apply(conn, request, changed)) for writer, request in requests]
+                conn.execute("COMMIT")
+            except Exception as e:
+                # A failed group commit (busy database, full disk...) fails its transactions, not the writer
+                print(f"Group commit of {len(requests)} transactions to {database} failed: {e}")
+                self._rollback(database)
+                responses += [(writer, {'id': request['id'], 'error': str(e), 'error_type': type(e).__name__})
+                              for writer, request in requests]
+                continue
+            responses += applied
+            self.commits += 1
+            self.transactions += len(requests)
+
+            # Schema changes may add or drop triggers and change what sqlite_master reads return
+            if any(_SCHEMA_STATEMENT.match(statement['sql'])
+                   for _, request in requests for statement in request['statements']):
+                self._triggers.pop(database, None)
+                changed.add('sqlite_master')
+            try:
+                for table in list(changed):
+                    changed |= self._trigger_tables(conn, database).get(table, set())
+            except sqlite3.Error as e:
+                # The commit went through; drop every cached read of the database rather than miss a table
+                print(f"Failed to read the triggers of {database}: {e}")
+                changed.add('*')
+
+            # Invalidate first, answer second
+            if changed:
+                message = {'invalidate': sorted(changed), 'database': database}
+                for client in list(self._clients):
+                    self._send(client, message)
+
+        for writer, response in responses:
+            self._send(writer, response)
+
+    def _rollback(self, database):
+        conn = self._connections.get(database)
+        if conn is None or not conn.in_transaction:
+            return
+        try:
+            conn.execute("ROLLBACK")
+        except sqlite3.Error as e:
+            # Start over with a new connection
+            print(f"Rollback on {database} failed: {e}")
+            conn.close()
+            del self._connections[database]
+
+    @staticmethod
+    def _apply(conn, request, changed):
+        """Run one worker transaction inside a savepoint. Returns its response."""
+        conn.execute("SAVEPOINT worker_transaction")
+        results = []
+        try:
+            for statement in request['statements']:
+                if statement.get('many'):
+                    cursor = conn.executemany(statement['sql'], statement['params'])
+                else:
+                    cursor = conn.execute(statement['sql'], statement['params'])
+                results.append([cursor.rowcount, cursor.lastrowid])
+            conn.execute("RELEASE worker_transaction")
+        except sqlite3.Error as e:
+            conn.execute("ROLLBACK TO worker_transaction")
+            conn.execute("RELEASE worker_transaction")
+            return {'id': request['id'], 'error': str(e), 'error_type': type(e).__name__}
+
+        for statement in request['statements']:
+            changed.update(write_tables(statement['sql']))
+        return {'id': request['id'], 'results': results}
+
+    @staticmethod
+    def _send(writer, message):
+        if not writer.is_closing():
+            writer.write(json.dumps(message).encode() + b'\n')
+
+
+# -------------- Worker side ----------------
+class ReadCache:
+    """LRU cache of query results, dropped per table when the writer reports a change."""
+
+    def __init__(self, size=DB_READ_CACHE_SIZE):
+        self.size = size
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key, tables, description, rows):
+        if self.size <= 0:
+            return
+        self._entries[key] = (tables, description, rows)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, database, tables):
+        """Drop the cached reads of `tables` ('*' for all tables) of a database."""
+        tables = set(tables)
+        everything = '*' in tables
+        for key in [key for key, entry in self._entries.items()
+                    if key[0] == database and (everything or entry[0] & tables)]:
+            del self._entries[key]
+
+
+class WriterClient:
+    """A worker's connection to the database writer. Blocking, like sqlite3, and shared by the whole process."""
+
+    def __init__(self, socket_path, cache_size=DB_READ_CACHE_SIZE, timeout=DB_WRITER_TIMEOUT_SECONDS):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self.cache = ReadCache(cache_size)
+        self._sock = None
+        self._buffer = b''
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._sock is None:
+            self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._sock.settimeout(self.timeout)
+            self._sock.connect(self.socket_path)
+            self._buffer = b''
+            # Cached reads may have missed invalidations while disconnected
+            self.cache = ReadCache(self.cache.size)
+
+    def _handle(self, message):
+        if 'invalidate' in message:
+            self.cache.invalidate(message['database'], message['invalidate'])
+            return None
+        return message
+
+    def _disconnect(self):
+        self._sock.close()
+        self._sock = None
+
+    def _read_message(self, blocking=True, timeout=None):
+        while b'\n' not in self._buffer:
+            self._sock.settimeout((timeout or self.timeout) if blocking else 0)
+            try:
+                data = self._sock.recv(65536)
+            except BlockingIOError:
+                return None
+            except socket.timeout:
+                # The answer may still come; a new connection keeps it from being taken for another one's
+                self._disconnect()
+                raise sqlite3.OperationalError(f"Database writer did not answer within {timeout or self.timeout}s")
+            if not data:
+                self._disconnect()
+                raise ConnectionError("Database writer closed the connection")
+            self._buffer += data
+        line, self._buffer = self._buffer.split(b'\n', 1)
+        return json.loads(line)
+
+    def _drain(self):
+        """Apply the invalidations that arrived since the last request."""
+        while (message := self._read_message(blocking=False)) is not None:
+            self._handle(message)
+
+    def _request(self, message, timeout=None):
+        self._connect()
+        self._next_id += 1
+        message['id'] = self._next_id
+        self._sock.settimeout(timeout or self.timeout)
+        try:
+            self._sock.sendall(json.dumps(message).encode() + b'\n')
+        except socket.timeout:
+            self._disconnect()
+            raise sqlite3.OperationalError("Database writer is not reading requests")
+        while True:
+            response = self._handle(self._read_message(timeout=timeout))
+            if response is not None and response.get('id') == message['id']:
+                break
+        if 'error' in response:
+            raise getattr(sqlite3, response['error_type'], sqlite3.Error)(response['error'])
+        return response
+
+    def query(self, database, sql, params):
+        with self._lock:
+            self._connect()
+            self._drain()
+            key = (database, sql, json.dumps(params))
+            cached = self.cache.get(key)
+            record_cache('db_read', cached is not None)
+            if cached is not None:
+                return cached[1], cached[2]
+
+            response = self._request({'op': 'query', 'database': database, 'sql': sql, 'params': params})
+            rows = [tuple(row) for row in response['rows']]
+            tables = read_tables(sql)
+            # Reads of no table (PRAGMAs such as table_info) can't be invalidated, so they aren't cached
+            if tables:
+                self.cache.put(key, tables, response['description'], rows)
+            return response['description'], rows
+
+    def transaction(self, database, statements):
+        with self._lock:
+            return self._request({'op': 'transaction', 'database': database, 'statements': statements})['results']
+
+    def maintenance(self, database, archive, retention=None):
+        with self._lock:
+            return self._request({'op': 'maintenance', 'database': database, 'archive': archive,
+                                  'retention': retention}, DB_WRITER_MAINTENANCE_TIMEOUT_SECONDS)['report']
+
+
+class RemoteCursor:
+    """sqlite3.Cursor stand-in used by workers in cluster mode."""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.description = None
+        self.rowcount = -1
+        self.lastrowid = None
+        self._rows = []
+
+    def execute(self, sql, parameters=()):
+        parameters = list(parameters) if not isinstance(parameters, dict) else parameters
+        if is_read(sql):
+            self.connection.flush()
+            start = time.perf_counter()
+            with span("db remote read"):
+                columns, rows = self.connection.client.query(self.connection.database, sql, parameters)
+            self._rows = list(rows)  # The cached list itself must not be consumed
+            DB_QUERY_LATENCY.observe(time.perf_counter() - start, operation='SELECT', table='remote')
+            self.description = tuple((column, None, None, None, None, None, None) for column in columns) or None
+            self.rowcount = -1
+        else:
+            self.connection.queue_write(self, {'sql': sql, 'params': parameters})
+            self._rows = []
+            self.description = None
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        self.connection.queue_write(self, {'sql': sql, 'params': [list(p) for p in seq_of_parameters], 'many': True})
+        self._rows = []
+        return self
+
+    def fetchone(self):
+        return self._rows.pop(0) if self._rows else None
+
+    def fetchall(self):
+        rows, self._rows = self._rows, []
+        return rows
+
+    def fetchmany(self, size=1):
+        rows, self._rows = self._rows[:size], self._rows[size:]
+        return rows
+
+    def __iter__(self):
+        while self._rows:
+            yield self._rows.pop(0)
+
+    def close(self):
+        self._rows = []
+
+
+class RemoteConnection:
+    """sqlite3.Connection stand-in that sends its writes to the database writer as one transaction on commit.
+
+    Reads see everything committed so far: a read flushes the writes queued before it. Rowcounts and
+    lastrowid of writes are filled in once they are flushed.
+    """
+
+    def __init__(self, client, database):
+        self.client = client
+        self.database = database
+        self._pending = []
+
+    def cursor(self, factory=None):
+        return RemoteCursor(self)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def queue_write(self, cursor, statement):
+        self._pending.append((cursor, statement))
+
+    def flush(self):
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, []
+        with span("db remote commit"):
+            results = self.client.transaction(self.database, [statement for _, statement in pending])
+        for (cursor, _), (rowcount, lastrowid) in zip(pending, results):
+            cursor.rowcount, cursor.lastrowid = rowcount, lastrowid
+
+    def commit(self):
+        self.flush()
+
+    def rollback(self):
+        self._pending = []
+
+    def close(self):
+        # Like sqlite3, uncommitted writes are discarded
+        self._pending = []
+
+    def set_trace_callback(self, callback):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.rollback()
+        return False
+
+
+# The worker's client, created on first use when DB_WRITER_SOCKET is set
+_client = None
+
+
+def connect_remote(db_filename, socket_path=DB_WRITER_SOCKET):
+    global _client
+    if _client is None:
+        _client = WriterClient(socket_path)
+    return RemoteConnection(_client, os.path.abspath(db_filename))
+
+
+def maintain_remote(db_filename, archive_filename, retention=None, socket_path=DB_WRITER_SOCKET):
+    """Have the writer run the nightly maintenance of a database. Returns the report as a dict."""
+    global _client
+    if _client is None:
+        _client = WriterClient(socket_path)
+    return _client.maintenance(os.path.abspath(db_filename), os.path.abspath(archive_filename), retention)
+
+
+if __name__ == "__main__":
+    path = sys.argv[1] if len(sys.argv) > 1 else DB_WRITER_SOCKET
+    if not path:
+        sys.exit("Usage: python dbwriter.py SOCKET_PATH (or set DB_WRITER_SOCKET)")
+    try:
+        asyncio.run(DatabaseWriter(path).serve())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,129 @@
+# Standard library imports
+import re
+
+# Candidates (by shared trigrams) that get a full edit distance check
+CANDIDATE_LIMIT = 64
+
+_ACCOUNT_SUFFIX = re.compile(r'\.\d+$')
+
+
+def trigrams(text):
+    """The 3-character grams of a lowercased, padded name (so short names and name edges still match)."""
+    padded = f"  {text.lower()} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def edit_distance(a, b, limit):
+    """Levenshtein distance between a and b, or limit + 1 as soon as it is known to exceed `limit`.
+
+    Only the band of cells within `limit` of the diagonal is computed.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    over = limit + 1
+    previous = [j if j <= limit else over for j in range(len(b) + 1)]
+    for i, char_a in enumerate(a, 1):
+        current = [over] * (len(b) + 1)
+        current[0] = row_min = i if i <= limit else over
+        for j in range(max(1, i - limit), min(len(b), i + limit) + 1):
+            value = previous[j - 1] + (char_a != b[j - 1])
+            if previous[j] + 1 < value:
+                value = previous[j] + 1
+            if current[j - 1] + 1 < value:
+                value = current[j - 1] + 1
+            current[j] = value
+            if value < row_min:
+                row_min = value
+        if row_min > limit:
+            return over
+        previous = current
+    return min(previous[-1], over)
+
+
+class RosterIndex:
+    """Trigram index over the GW2 account names of a guild roster, for "did you mean" suggestions."""
+    __slots__ = ('names', 'fingerprint', '_name_grams', '_grams')
+
+    def __init__(self, names, fingerprint=None):
+        self.names = list(names)
+        self.fingerprint = fingerprint if fingerprint is not None else roster_fingerprint(self.names)
+        self._name_grams = [trigrams(name) for name in self.names]
+        self._grams = {}
+        for position, grams in enumerate(self._name_grams):
+            for gram in grams:
+                self._grams.setdefault(gram, []).append(position)
+
+    def suggest(self, query, limit=3, max_distance=None):
+        """Roster names closest to `query` by edit distance (case-insensitive), best first.
+
+        A query without the ".1234" part of the account name is also compared to the names without it.
+        """
+        query = query.strip().lower()
+        if not query:
+            return []
+        if max_distance is None:
+            max_distance = max(2, len(query) // 4)
+        compare_base = '.' not in query
+
+        # Each edit changes at most 3 trigrams, so a close name shares at least `required` of the query's
+        # trigrams (one less when comparing without the account suffix, whose first gram then differs). Any
+        # such name contains one of the rarest len - required + 1 query trigrams, so only those are looked up.
+        query_grams = sorted(trigrams(query), key=lambda gram: len(self._grams.get(gram, ())))
+        required = len(query_grams) - 3 * max_distance - compare_base
+        probe = query_grams[:len(query_grams) - required + 1] if required > 0 else query_grams
+        candidates = set()
+        for gram in probe:
+            candidates.update(self._grams.get(gram, ()))
+
+        query_gram_set = set(query_grams)
+        shared = [(len(self._name_grams[position] & query_gram_set), position) for position in candidates]
+        shared = [(count, position) for count, position in shared if count >= required]
+        shared.sort(reverse=True)
+
+        scored = []
+        bound = max_distance
+        for _, position in shared[:CANDIDATE_LIMIT]:
+            name = self.names[position].lower()
+            distance = edit_distance(query, name, bound)
+            if compare_base and distance:
+                distance = min(distance, edit_distance(query, _ACCOUNT_SUFFIX.sub('', name), bound))
+            if distance <= bound:
+                scored.append((distance, self.names[position]))
+                # Once there are `limit` matches, only closer names can still make the list
+                if len(scored) >= limit:
+                    scored.sort()
+                    del scored[limit:]
+                    bound = scored[-1][0]
+        scored.sort()
+        return [name for _, name in scored[:limit]]
+
+
+def roster_fingerprint(names):
+    return hash(frozenset(names))
+
+
+# Latest index per server, rebuilt only when the roster's names change
+_indexes = {}
+
+
+def get_roster_index(guild_id, roster):
+    """The trigram index of a server's roster (a list of GW2 API member dicts)."""
+    names = [member['name'] for member in roster]
+    fingerprint = roster_fingerprint(names)
+    key = str(guild_id) if guild_id is not None else None
+    index = _indexes.get(key)
+    if index is None or index.fingerprint != fingerprint:
+        index = _indexes[key] = RosterIndex(names, fingerprint)
+    return index
+
+
+def suggest_gw2_ids(guild_id, roster, query, limit=3):
+    """Up to `limit` roster names that `query` may have been a typo of."""
+    return get_roster_index(guild_id, roster).suggest(query, limit)
+
+
+def did_you_mean(suggestions):
+    """The "did you mean" line for a failed GW2 ID lookup, or an empty string without suggestions."""
+    if not suggestions:
+        return ""
+    return "\n\nDid you mean: " + ", ".join(f"`{name}`" for name in suggestions) + "?"
@@ -0,0 +1,120 @@
+# Standard library imports
+import json
+
+# Third-party imports
+import discord
+from discord import app_commands
+
+# Personal files
+from config import (DISCORD_GUILD_ID, GUILD_ID, API_KEY, GUILDS_CONFIG_FILE, ROLE_ID_CONFIRMATION, ROLE_ID_GUEST,
+                    ROLE_ID_MEMBER, ROLE_ID_FAMED_MEMBER, ROLE_ID_STAFF, ROLE_ID_ADMIN, ROLE_ID_BIRTHDAY,
+                    CHANNEL_ID_MENTORS, CHANNEL_ID_GENERAL, CHANNEL_ID_RULES)
+
+# Attribute name -> setting name in config.py / the guilds config file
+SETTINGS = {
+    'discord_guild_id': 'DISCORD_SERVER_ID',
+    'gw2_guild_id': 'GUILD_ID',
+    'api_key': 'USER_API_KEY',
+    'role_confirmation': 'ROLE_ID_CONFIRMATION',
+    'role_guest': 'ROLE_ID_GUEST',
+    'role_member': 'ROLE_ID_MEMBER',
+    'role_famed_member': 'ROLE_ID_FAMED_MEMBER',
+    'role_staff': 'ROLE_ID_STAFF',
+    'role_admin': 'ROLE_ID_ADMIN',
+    'role_birthday': 'ROLE_ID_BIRTHDAY',
+    'channel_mentors': 'CHANNEL_ID_MENTORS',
+    'channel_general': 'CHANNEL_ID_GENERAL',
+    'channel_rules': 'CHANNEL_ID_RULES',
+}
+
+
+class GuildConfig:
+    """Role, channel and GW2 guild settings of one Discord server."""
+    __slots__ = tuple(SETTINGS)
+
+    def __init__(self, **settings):
+        for name in SETTINGS:
+            value = settings.get(name)
+            if value is not None and (name.startswith('role_') or name.startswith('channel_')):
+                value = int(value)
+            setattr(self, name, value)
+
+    @classmethod
+    def from_settings(cls, data, defaults=None):
+        """Build a config from a dict keyed by setting name, taking missing settings from `defaults`."""
+        values = {name: data.get(key, getattr(defaults, name, None)) for name, key in SETTINGS.items()}
+        if values['discord_guild_id'] is not None:
+            values['discord_guild_id'] = str(values['discord_guild_id'])
+        return cls(**values)
+
+    def role(self, name):
+        return getattr(self, f"role_{name}")
+
+    def __repr__(self):
+        return f"<GuildConfig discord_guild_id={self.discord_guild_id} gw2_guild_id={self.gw2_guild_id}>"
+
+
+# The main server, configured through the environment as before
+DEFAULT_GUILD = GuildConfig(
+    discord_guild_id=DISCORD_GUILD_ID, gw2_guild_id=GUILD_ID, api_key=API_KEY,
+    role_confirmation=ROLE_ID_CONFIRMATION, role_guest=ROLE_ID_GUEST, role_member=ROLE_ID_MEMBER,
+    role_famed_member=ROLE_ID_FAMED_MEMBER, role_staff=ROLE_ID_STAFF, role_admin=ROLE_ID_ADMIN,
+    role_birthday=ROLE_ID_BIRTHDAY, channel_mentors=CHANNEL_ID_MENTORS, channel_general=CHANNEL_ID_GENERAL,
+    channel_rules=CHANNEL_ID_RULES)
+
+
+def load_guild_configs(path=GUILDS_CONFIG_FILE):
+    """Read the per-server settings file. Returns the configs by Discord server ID."""
+    configs = {}
+    if DEFAULT_GUILD.discord_guild_id:
+        configs[DEFAULT_GUILD.discord_guild_id] = DEFAULT_GUILD
+    if not path:
+        return configs
+
+    with open(path, 'r') as f:
+        for entry in json.load(f):
+            config = GuildConfig.from_settings(entry, DEFAULT_GUILD)
+            if not config.discord_guild_id:
+                raise ValueError(f"Server entry without DISCORD_SERVER_ID in {path}")
+            configs[config.discord_guild_id] = config
+    return configs
+
+
+GUILDS = load_guild_configs()
+if not GUILDS:
+    print("No server is configured: set DISCORD_SERVER_ID or list the servers in GUILDS_CONFIG_FILE")
+
+
+def get_guild_config(guild_id):
+    """Return the settings of a server (the main server's if None), or None if the server is not configured.
+
+    Servers the bot was added to without an entry in the settings are left alone: they must not be synced against
+    or post into the main server.
+    """
+    if guild_id is None:
+        return DEFAULT_GUILD
+    return GUILDS.get(str(guild_id))
+
+
+def configured_guilds(guilds):
+    """The servers among `guilds` that have settings."""
+    return [guild for guild in guilds if str(guild.id) in GUILDS]
+
+
+def has_guild_role(*names):
+    """Like app_commands.checks.has_role/has_any_role, with the role IDs taken from the server's settings."""
+    def predicate(interaction: discord.Interaction) -> bool:
+        if not isinstance(interaction.user, discord.Member):
+            raise app_commands.NoPrivateMessage()
+
+        config = get_guild_config(interaction.guild_id)
+        if config is None:
+            raise app_commands.CheckFailure(f"Server {interaction.guild_id} is not configured")
+        role_ids = [config.role(name) for name in names]
+        if any(interaction.user.get_role(role_id) is not None for role_id in role_ids):
+            return True
+        if len(role_ids) == 1:
+            raise app_commands.MissingRole(role_ids[0])
+        raise app_commands.MissingAnyRole(role_ids)
+
+    return app_commands.check(predicate)
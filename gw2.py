@@ -0,0 +1,52 @@
+# Standard library imports
+import time
+
+# Third-party imports
+import aiohttp
+import requests
+
+# Personal files
+from config import GW2_API_URL
+from guilds import get_guild_config
+from metrics import GW2_ROSTER_LATENCY
+from tracing import span
+
+GUILD_MEMBERS_URL = GW2_API_URL + "/v2/guild/{}/members"
+
+
+def _request_args(guild_id):
+    """Return the roster URL and headers for the GW2 guild of a Discord server (main server if None)."""
+    config = get_guild_config(guild_id)
+    if config is None:
+        raise ValueError(f"Server {guild_id} is not configured")
+    return GUILD_MEMBERS_URL.format(config.gw2_guild_id), {"Authorization": f"Bearer {config.api_key}"}
+
+
+def get_guild_roster(guild_id=None):
+    """Fetch the guild roster from the GW2 API with requests. Returns the response object."""
+    url, headers = _request_args(guild_id)
+    start = time.perf_counter()
+    status = 'error'
+    try:
+        with span("http GET gw2 guild members"):
+            response = requests.get(url, headers=headers)
+        status = response.status_code
+        return response
+    finally:
+        GW2_ROSTER_LATENCY.observe(time.perf_counter() - start, status=status)
+
+
+async def fetch_guild_roster(session: aiohttp.ClientSession, guild_id=None):
+    """Fetch the guild roster from the GW2 API with aiohttp. Returns (status, roster or None)."""
+    url, headers = _request_args(guild_id)
+    start = time.perf_counter()
+    status = 'error'
+    try:
+        with span("http GET gw2 guild members"):
+            async with session.get(url, headers=headers) as response:
+                status = response.status
+                if response.status != 200:
+                    return response.status, None
+                return response.status, await response.json()
+    finally:
+        GW2_ROSTER_LATENCY.observe(time.perf_counter() - start, status=status)
@@ -0,0 +1,151 @@
+# Standard library imports
+import os
+import sys
+import time
+import asyncio
+import threading
+import traceback
+from datetime import datetime
+
+_REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def _call_site(stack):
+    """Describe where the loop was stuck: the two innermost frames in the bot's own code, innermost first.
+
+    Falls back to the innermost frame if no frame belongs to the bot.
+    """
+    sites = []
+    for frame in reversed(stack):
+        filename = os.path.abspath(frame.filename)
+        if filename.startswith(_REPO_DIR) and filename != os.path.abspath(__file__) \
+                and os.sep + 'benchmarks' + os.sep not in filename:
+            sites.append(f"{os.path.relpath(filename, _REPO_DIR)}:{frame.lineno} in {frame.name}")
+            if len(sites) == 2:
+                break
+    if not sites:
+        frame = stack[-1]
+        return f"{frame.filename}:{frame.lineno} in {frame.name}"
+    return " <- ".join(sites)
+
+
+class BlockingSite:
+    __slots__ = ('site', 'count', 'total', 'worst', 'last_seen', 'stack')
+
+    def __init__(self, site):
+        self.site = site
+        self.count = 0
+        self.total = 0.0
+        self.worst = 0.0
+        self.last_seen = None
+        self.stack = None
+
+    def as_dict(self):
+        return {
+            "site": self.site,
+            "count": self.count,
+            "total_s": round(self.total, 3),
+            "worst_s": round(self.worst, 3),
+            "last_seen": self.last_seen.isoformat() if self.last_seen else None,
+            "stack": self.stack,
+        }
+
+
+class LoopWatchdog:
+    """Detects event loop blocking from a separate thread.
+
+    A heartbeat task on the loop records when it last ran. If the watchdog thread sees no heartbeat for
+    longer than `threshold` seconds, it captures the loop thread's stack and charges the block to the
+    innermost call site in the bot's own code once the loop recovers.
+    """
+
+    def __init__(self, threshold=0.25, interval=None):
+        self.threshold = threshold
+        self.interval = interval or min(0.05, threshold / 4)
+        self.started_at = None
+        self._sites = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._last_beat = time.monotonic()
+        self._loop_thread_id = None
+        self._task = None
+        self._thread = None
+
+    async def _heartbeat(self):
+        while True:
+            self._last_beat = time.monotonic()
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        """Start the heartbeat task and the watchdog thread. Must be called from the event loop thread."""
+        self.started_at = datetime.now()
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._task = asyncio.create_task(self._heartbeat())
+        self._thread = threading.Thread(target=self._watch, name='loop-watchdog', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._task:
+            self._task.cancel()
+
+    def _capture_stack(self):
+        frame = sys._current_frames().get(self._loop_thread_id)
+        return traceback.extract_stack(frame) if frame else None
+
+    def _watch(self):
+        block_beat, block_stack, block_duration = None, None, 0.0
+        while not self._stopped.wait(self.interval):
+            beat = self._last_beat
+            blocked_for = time.monotonic() - beat - self.interval
+            if blocked_for > self.threshold:
+                if block_beat != beat:
+                    # A new block: the stack is captured while the loop is still stuck in it
+                    block_beat, block_stack = beat, self._capture_stack()
+                block_duration = blocked_for
+            elif block_beat is not None:
+                self._record(block_stack, block_duration)
+                block_beat, block_stack = None, None
+
+    def _record(self, stack, duration):
+        if not stack:
+            return
+        site = _call_site(stack)
+        with self._lock:
+            entry = self._sites.get(site)
+            if entry is None:
+                entry = self._sites[site] = BlockingSite(site)
+            entry.count += 1
+            entry.total += duration
+            entry.last_seen = datetime.now()
+            if duration >= entry.worst:
+                entry.worst = duration
+                entry.stack = ''.join(traceback.format_list(stack[-12:]))
+        print(f"Event loop blocked for {duration:.2f}s at {site}")
+
+    def report(self, key='worst'):
+        """Return the blocking call sites, ranked by `key` ('worst', 'total' or 'count')."""
+        with self._lock:
+            return sorted(self._sites.values(), key=lambda entry: getattr(entry, key), reverse=True)
+
+    def reset(self):
+        with self._lock:
+            self._sites.clear()
+            self.started_at = datetime.now()
+
+
+# The running watchdog, or None when it is disabled
+_watchdog = None
+
+
+def start_loop_watchdog(threshold, interval=None):
+    global _watchdog
+    if _watchdog is None:
+        _watchdog = LoopWatchdog(threshold, interval)
+        _watchdog.start()
+    return _watchdog
+
+
+def get_loop_watchdog():
+    return _watchdog
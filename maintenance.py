@@ -0,0 +1,167 @@
+# Standard library imports
+import os
+import time
+import sqlite3
+from typing import NamedTuple
+
+# Personal files
+from config import ARCHIVE_WARNINGS_AFTER_DAYS, ARCHIVE_APPLICATIONS_AFTER_DAYS, ARCHIVE_AUDIT_LOG_AFTER_DAYS
+from metrics import DB_MAINTENANCE_DURATION, DB_MAINTENANCE_RECLAIMED_BYTES, DB_ARCHIVED_ROWS
+
+# Tables whose old rows are moved to the archive database: table -> time column (Unix seconds)
+ARCHIVED_TABLES = {
+    'warnings': 'date',
+    'mentor_applications': 'timestamp',
+    'audit_log': 'created_at',
+}
+
+# Rows per ANALYZE sample; approximate statistics are enough for the planner and keep the run short
+ANALYSIS_LIMIT = 400
+
+
+def default_retention():
+    """Days after which rows are archived, per table (0 keeps them)."""
+    return {'warnings': ARCHIVE_WARNINGS_AFTER_DAYS, 'mentor_applications': ARCHIVE_APPLICATIONS_AFTER_DAYS,
+            'audit_log': ARCHIVE_AUDIT_LOG_AFTER_DAYS}
+
+
+class MaintenanceReport(NamedTuple):
+    database: str
+    duration_s: float
+    size_before: int  # Bytes of the database file and its WAL
+    size_after: int
+    freed_pages: int  # Pages the database file shrank by
+    archived: dict  # Table -> rows moved to the archive database
+    converted: bool  # Switched to auto_vacuum=INCREMENTAL (with a full VACUUM) during this run
+    changed_tables: list  # Tables whose rows changed, for read caches
+
+    @property
+    def reclaimed(self):
+        return self.size_before - self.size_after
+
+    def summary(self):
+        archived = ", ".join(f"{rows} {table}" for table, rows in self.archived.items() if rows) or "nothing"
+        return (f"Maintenance of {self.database} took {self.duration_s:.2f}s: archived {archived}, "
+                f"reclaimed {self.reclaimed / 1024:.0f} KiB ({self.size_before / 1024:.0f} KiB -> "
+                f"{self.size_after / 1024:.0f} KiB)" + (", switched to incremental auto-vacuum" if self.converted else ""))
+
+
+def file_size(database):
+    return sum(os.path.getsize(path) for path in (database, database + '-wal') if os.path.exists(path))
+
+
+def cutoff(days, now):
+    """The time column value below which rows are older than `days`."""
+    return now - days * 86400
+
+
+def _columns(conn, schema, table):
+    return [row[1] for row in conn.execute(f"PRAGMA {schema}.table_info({table})")]
+
+
+def prepare_archive_table(conn, table):
+    """Create the archive copy of a table, adding any columns the main table gained since. Returns the columns."""
+    conn.execute(f"CREATE TABLE IF NOT EXISTS archive.{table} AS SELECT * FROM main.{table} WHERE 0")
+    conn.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS archive.idx_{table}_id ON {table} (id)")
+    archived_columns = _columns(conn, 'archive', table)
+    for column in _columns(conn, 'main', table):
+        if column not in archived_columns:
+            conn.execute(f"ALTER TABLE archive.{table} ADD COLUMN {column}")
+    return _columns(conn, 'main', table)
+
+
+def archive_table(conn, table, days, now):
+    """Move the rows of a table older than `days` to the attached archive database. Returns the number moved."""
+    column = ARCHIVED_TABLES[table]
+    columns = ', '.join(prepare_archive_table(conn, table))
+    limit = cutoff(days, now)
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # The unique ID makes a repeated run (e.g. after a crash between the two files) harmless
+        conn.execute(f"INSERT OR IGNORE INTO archive.{table} ({columns}) "
+                     f"SELECT {columns} FROM main.{table} WHERE {column} < ?", (limit,))
+        if table == 'warnings':
+            affected = [row[0] for row in conn.execute(
+                "SELECT DISTINCT discord_id FROM main.warnings WHERE date < ?", (limit,))]
+        moved = conn.execute(f"DELETE FROM main.{table} WHERE {column} < ?", (limit,)).rowcount
+        if table == 'warnings':
+            # Keep the users' warning counts in line with the warnings left
+            conn.executemany("UPDATE main.users SET warnings = "
+                             "(SELECT COUNT(*) FROM main.warnings WHERE discord_id = ?) WHERE discord_id = ?",
+                             [(discord_id, discord_id) for discord_id in affected])
+        conn.execute("COMMIT")
+    except sqlite3.Error:
+        conn.execute("ROLLBACK")
+        raise
+    return moved
+
+
+def maintain(conn, database, archive_database, retention=None, now=None):
+    """Archive old rows, give free pages back, refresh the planner statistics and checkpoint the WAL.
+
+    `conn` is a connection to `database` in autocommit mode (isolation_level=None).
+    """
+    retention = default_retention() if retention is None else retention
+    now = time.time() if now is None else now
+    start = time.perf_counter()
+    size_before = file_size(database)
+    pages_before = conn.execute("PRAGMA page_count").fetchone()[0]
+    archived, changed = {}, set()
+
+    # Move rows past their retention window to the archive database
+    with DB_MAINTENANCE_DURATION.time(step='archive'):
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        to_archive = [table for table, days in retention.items() if days and table in tables]
+        if to_archive:
+            conn.execute("ATTACH DATABASE ? AS archive", (archive_database,))
+            try:
+                for table in to_archive:
+                    archived[table] = archive_table(conn, table, retention[table], now)
+                    DB_ARCHIVED_ROWS.inc(archived[table], table=table)
+                    if archived[table]:
+                        changed.add(table)
+                        if table == 'warnings':
+                            changed.add('users')
+            finally:
+                conn.execute("DETACH DATABASE archive")
+
+    # Give free pages back to the file system. Databases created before incremental auto-vacuum was set up are
+    # converted once, which takes a full VACUUM.
+    with DB_MAINTENANCE_DURATION.time(step='vacuum'):
+        converted = conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 0
+        if converted:
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.execute("VACUUM")
+        else:
+            # execute() would only step the pragma once, freeing a single page
+            conn.executescript("PRAGMA incremental_vacuum;")
+
+    # Planner statistics (bounded sample) and merged full-text index segments
+    with DB_MAINTENANCE_DURATION.time(step='analyze'):
+        conn.execute(f"PRAGMA analysis_limit = {ANALYSIS_LIMIT}")
+        conn.execute("ANALYZE")
+        conn.execute("PRAGMA optimize")
+        for (fts_table,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' "
+                                         "AND sql LIKE 'CREATE VIRTUAL TABLE % USING fts5%'").fetchall():
+            conn.execute(f"INSERT INTO {fts_table} ({fts_table}) VALUES ('optimize')")
+
+    # Fold the WAL back into the database file and truncate it (no-op outside WAL mode)
+    with DB_MAINTENANCE_DURATION.time(step='checkpoint'):
+        if conn.execute("PRAGMA journal_mode").fetchone()[0].lower() == 'wal':
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+
+    size_after = file_size(database)
+    freed_pages = pages_before - conn.execute("PRAGMA page_count").fetchone()[0]
+    DB_MAINTENANCE_RECLAIMED_BYTES.inc(max(0, size_before - size_after))
+    return MaintenanceReport(database, time.perf_counter() - start, size_before, size_after,
+                             freed_pages, archived, converted, sorted(changed))
+
+
+def maintain_file(database, archive_database, retention=None, now=None, timeout=30.0):
+    """Run `maintain` on its own connection to a database file."""
+    conn = sqlite3.connect(database, isolation_level=None, timeout=timeout)
+    try:
+        return maintain(conn, database, archive_database, retention, now)
+    finally:
+        conn.close()
@@ -0,0 +1,29 @@
+# Third-party imports
+import discord
+
+# Personal files
+from metrics import record_cache
+
+
+async def get_all_members(guild: discord.Guild):
+    """Return every member of a guild, requesting a gateway chunk if the member cache is incomplete."""
+    if guild.chunked:
+        return list(guild.members)
+
+    # Chunk on demand. cache=False only takes effect when the cache profile doesn't keep joined members
+    # (MEMBER_CACHE_FLAGS=none): discord.py caches the chunk anyway if MemberCacheFlags.joined is set, after which
+    # the guild counts as chunked and later calls are served from the cache.
+    return await guild.chunk(cache=False)
+
+
+async def get_or_fetch_member(guild: discord.Guild, member_id: int):
+    """Return a member from the cache, falling back to the API. Returns None if they are not in the guild."""
+    member = guild.get_member(member_id)
+    record_cache('member', member is not None)
+    if member is not None:
+        return member
+
+    try:
+        return await guild.fetch_member(member_id)
+    except discord.NotFound:
+        return None
@@ -0,0 +1,226 @@
+# Standard library imports
+import time
+import asyncio
+import logging
+import threading
+from contextlib import contextmanager
+
+# Third-party imports
+import discord
+from aiohttp import web
+from discord import app_commands
+
+# Personal files
+from config import TRACE_THRESHOLD_SECONDS
+from tracing import start_trace, finish_trace
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_registry = []
+
+
+def _format_labels(labelnames, labelvalues, extra=None):
+    pairs = list(zip(labelnames, labelvalues))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    """Base class for metrics exposed in the Prometheus text format."""
+    type_name = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+        _registry.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        with self._lock:
+            for labelvalues, value in sorted(self._values.items()):
+                lines.extend(self._render_sample(labelvalues, value))
+        return lines
+
+    def _render_sample(self, labelvalues, value):
+        return [f"{self.name}{_format_labels(self.labelnames, labelvalues)} {_format_value(value)}"]
+
+
+class Counter(_Metric):
+    type_name = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    type_name = 'gauge'
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _render_sample(self, labelvalues, value):
+        counts, total = value
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, counts):
+            cumulative += count
+            labels = _format_labels(self.labelnames, labelvalues, ('le', _format_value(bound)))
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labelnames, labelvalues)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+# -------------- Metrics ----------------
+COMMAND_LATENCY = Histogram('scrubbot_command_duration_seconds', 'Application command latency.',
+                            ['command', 'status'])
+DB_QUERY_LATENCY = Histogram('scrubbot_db_query_duration_seconds', 'SQLite statement execution time.',
+                             ['operation', 'table'])
+GW2_ROSTER_LATENCY = Histogram('scrubbot_gw2_roster_fetch_duration_seconds', 'GW2 guild roster fetch latency.',
+                               ['status'])
+UPDATE_PHASE_LATENCY = Histogram('scrubbot_update_database_phase_duration_seconds',
+                                 'Duration of each update_database phase.', ['phase'],
+                                 buckets=DEFAULT_BUCKETS + (60.0, 120.0, 300.0))
+CACHE_REQUESTS = Counter('scrubbot_cache_requests_total', 'Cache lookups by cache and result (hit/miss).',
+                         ['cache', 'result'])
+DISCORD_RATE_LIMITS = Counter('scrubbot_discord_rate_limits_total', 'Discord HTTP 429 responses.', ['scope'])
+EVENT_LOOP_LAG = Histogram('scrubbot_event_loop_lag_seconds', 'Event loop scheduling lag.',
+                           buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0))
+EVENT_LOOP_LAG_CURRENT = Gauge('scrubbot_event_loop_lag_current_seconds', 'Most recent event loop lag sample.')
+DB_MAINTENANCE_DURATION = Histogram('scrubbot_db_maintenance_duration_seconds',
+                                    'Duration of each nightly database maintenance step.', ['step'],
+                                    buckets=DEFAULT_BUCKETS + (60.0, 120.0, 300.0))
+DB_MAINTENANCE_RECLAIMED_BYTES = Counter('scrubbot_db_maintenance_reclaimed_bytes_total',
+                                         'Bytes given back to the file system by database maintenance.')
+DB_ARCHIVED_ROWS = Counter('scrubbot_db_archived_rows_total', 'Rows moved to the archive databases.', ['table'])
+
+
+def record_cache(cache, hit):
+    CACHE_REQUESTS.inc(cache=cache, result='hit' if hit else 'miss')
+
+
+def render_metrics():
+    """Render every registered metric in the Prometheus text exposition format."""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+# -------------- Instrumentation ----------------
+class InstrumentedCommandTree(app_commands.CommandTree):
+    """Command tree that records the latency and a trace of every application command."""
+
+    def __init__(self, client, *args, **kwargs):
+        super().__init__(client, *args, **kwargs)
+        client.add_listener(self.on_app_command_completion)
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if interaction.type is discord.InteractionType.application_command:
+            interaction.extras['started_at'] = time.perf_counter()
+            interaction.extras['trace'] = start_trace(f"/{interaction.data.get('name', '?')}")
+        return await super().interaction_check(interaction)
+
+    async def on_app_command_completion(self, interaction: discord.Interaction, command):
+        observe_command(interaction, 'ok')
+
+    async def on_error(self, interaction: discord.Interaction, error: app_commands.AppCommandError):
+        observe_command(interaction, 'error')
+        await super().on_error(interaction, error)
+
+
+def observe_command(interaction: discord.Interaction, status):
+    started_at = interaction.extras.pop('started_at', None)
+    if started_at is None or interaction.command is None:
+        return
+    COMMAND_LATENCY.observe(time.perf_counter() - started_at, command=interaction.command.qualified_name,
+                            status=status)
+    finish_trace(interaction.extras.pop('trace'), TRACE_THRESHOLD_SECONDS)
+
+
+class RateLimitLogHandler(logging.Handler):
+    """Counts the rate limit warnings discord.py logs for HTTP 429 responses."""
+
+    def emit(self, record):
+        message = str(record.msg)
+        if 'Global rate limit' in message:
+            DISCORD_RATE_LIMITS.inc(scope='global')
+        elif '429' in message:
+            DISCORD_RATE_LIMITS.inc(scope='route')
+
+
+async def monitor_event_loop_lag(interval=0.5):
+    """Sample how late the event loop wakes up from a sleep of `interval` seconds."""
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        lag = max(0.0, loop.time() - start - interval)
+        EVENT_LOOP_LAG.observe(lag)
+        EVENT_LOOP_LAG_CURRENT.set(lag)
+
+
+async def start_metrics_server(bot, host, port):
+    """Serve /metrics on host:port and start the background samplers."""
+    async def handle_metrics(request):
+        return web.Response(text=render_metrics(), content_type='text/plain', charset='utf-8')
+
+    logging.getLogger('discord.http').addHandler(RateLimitLogHandler(level=logging.WARNING))
+    bot.loop_lag_task = asyncio.create_task(monitor_event_loop_lag())
+
+    app = web.Application()
+    app.router.add_get('/metrics', handle_metrics)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    print(f"Metrics endpoint listening on http://{host}:{port}/metrics")
+    return runner
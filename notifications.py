@@ -0,0 +1,179 @@
+# Standard library imports
+import asyncio
+
+# Third-party imports
+import discord
+
+# Personal files
+from config import NOTIFICATION_WINDOW_SECONDS
+from guilds import get_guild_config
+
+MESSAGE_LIMIT = 2000
+COMPONENT_LIMIT = 25  # Buttons per message (5 rows of 5)
+
+# Header of a digest message per category
+DIGEST_TITLES = {
+    'verification': "✅ __**Verifications**__",
+    'id_update': "🆔 __**GW2 ID updates**__",
+    'invite': "🚨 __**Guild invitations needed**__ 🚨",
+    'application': "🚨 __**New Mentor applications**__ 🚨",
+    'warning': "⚠️ __**Warnings issued**__",
+}
+
+
+class Notification:
+    """One event for the mentors channel. `summary` is its line in a digest, `buttons` act on this event only.
+
+    `receipt` is an optional future, resolved once the message carrying the event was sent or failed with the
+    Discord error of the send (the outbox acknowledges its entries with it).
+    """
+    __slots__ = ('content', 'summary', 'buttons', 'label', 'receipt')
+
+    def __init__(self, content, summary=None, buttons=(), label=None, receipt=None):
+        self.content = content
+        self.summary = summary or content
+        self.buttons = list(buttons)
+        self.label = label
+        self.receipt = receipt
+
+    def settle(self, error=None):
+        if self.receipt is None or self.receipt.done():
+            return
+        if error is None:
+            self.receipt.set_result(True)
+        else:
+            self.receipt.set_exception(error)
+
+
+class NotificationAggregator:
+    """Debounces notifications per category and posts each burst as a single digest message.
+
+    The first event of a category opens a window of `window` seconds; everything that arrives in it is sent
+    together. A lone event is sent exactly as it would have been on its own. Urgent events skip the window.
+    """
+
+    def __init__(self, client, channel_id, window=NOTIFICATION_WINDOW_SECONDS):
+        self.client = client
+        self.channel_id = channel_id
+        self.window = window
+        self._pending = {}
+        self._timers = {}
+
+    @property
+    def channel(self):
+        return self.client.get_channel(self.channel_id)
+
+    async def notify(self, category, notification, urgent=False):
+        """Queue a notification (send it now if urgent). Returns False if the channel does not exist.
+
+        True only means the notification was accepted: its receipt tells whether it was actually sent.
+        """
+        channel = self.channel
+        if channel is None:
+            print(f"Mentors channel with ID {self.channel_id} not found")
+            return False
+
+        if urgent or not self.window:
+            await self._send(channel, category, [notification])
+            return True
+
+        self._pending.setdefault(category, []).append(notification)
+        if category not in self._timers:
+            self._timers[category] = asyncio.create_task(self._flush_later(category))
+        return True
+
+    async def _flush_later(self, category):
+        try:
+            await asyncio.sleep(self.window)
+        finally:
+            self._timers.pop(category, None)
+        await self.flush(category)
+
+    async def flush(self, category=None):
+        """Send the pending notifications of one category (or all of them) now."""
+        categories = [category] if category else list(self._pending)
+        for name in categories:
+            notifications = self._pending.pop(name, [])
+            timer = self._timers.pop(name, None)
+            if timer and timer is not asyncio.current_task():
+                timer.cancel()
+            channel = self.channel
+            if notifications and channel:
+                await self._send(channel, name, notifications)
+            elif notifications:
+                print(f"Mentors channel with ID {self.channel_id} not found, dropping {len(notifications)} "
+                      f"{name} notification(s)")
+                for notification in notifications:
+                    notification.settle(RuntimeError("Mentors channel not found"))
+
+    async def _send(self, channel, category, notifications):
+        """Send the notifications (several as digests) and settle their receipts with the outcome of the message
+        carrying them. Failures of notifications without a receipt are only printed."""
+        batches = [notifications] if len(notifications) == 1 else list(self._batches(category, notifications))
+        for i, batch in enumerate(batches):
+            try:
+                if len(notifications) == 1:
+                    notification = notifications[0]
+                    await channel.send(notification.content, view=self._view(notification.buttons))
+                else:
+                    lines = [DIGEST_TITLES.get(category, category), ""] + [n.summary for n in batch]
+                    buttons = []
+                    for notification in batch:
+                        for button in notification.buttons:
+                            # Several items share the message, so say which one each button is for
+                            if notification.label:
+                                button.label = f"{button.label}: {notification.label}"[:80]
+                            buttons.append(button)
+                    await channel.send("\n".join(lines), view=self._view(buttons))
+            except discord.DiscordException as e:
+                print(f"Failed to send {category} notification to the mentors channel: {e}")
+                for notification in (n for rest in batches[i:] for n in rest):
+                    notification.settle(e)
+                return
+            for notification in batch:
+                notification.settle()
+
+    @staticmethod
+    def _batches(category, notifications):
+        """Split a digest so each message stays within the content and component limits."""
+        batch, length, components = [], len(DIGEST_TITLES.get(category, category)) + 2, 0
+        for notification in notifications:
+            line_length = len(notification.summary) + 1
+            if batch and (length + line_length > MESSAGE_LIMIT
+                          or components + len(notification.buttons) > COMPONENT_LIMIT):
+                yield batch
+                batch, length, components = [], len(DIGEST_TITLES.get(category, category)) + 2, 0
+            batch.append(notification)
+            length += line_length
+            components += len(notification.buttons)
+        if batch:
+            yield batch
+
+    @staticmethod
+    def _view(buttons):
+        if not buttons:
+            return None
+        view = discord.ui.View(timeout=None)
+        for button in buttons:
+            view.add_item(button)
+        return view
+
+
+async def notify_mentors(client, guild_id, category, content, summary=None, buttons=(), label=None, urgent=False,
+                         receipt=None):
+    """Send a notification to a server's mentors channel through the client's aggregator for that channel.
+
+    `receipt` (a future) is resolved when the notification was actually sent, see Notification.
+    """
+    if not hasattr(client, 'mentors_notifiers'):
+        client.mentors_notifiers = {}
+
+    config = get_guild_config(guild_id)
+    if config is None:
+        print(f"Server {guild_id} is not configured, not posting to a mentors channel")
+        return False
+    channel_id = config.channel_mentors
+    if channel_id not in client.mentors_notifiers:
+        client.mentors_notifiers[channel_id] = NotificationAggregator(client, channel_id)
+    notifier = client.mentors_notifiers[channel_id]
+    return await notifier.notify(category, Notification(content, summary, buttons, label, receipt), urgent)
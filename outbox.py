@@ -0,0 +1,242 @@
+# Standard library imports
+import json
+import time
+import random
+import asyncio
+import sqlite3
+
+# Third-party imports
+import discord
+
+# Personal files
+from config import OUTBOX_WORKERS, OUTBOX_POLL_SECONDS, OUTBOX_MAX_ATTEMPTS, OUTBOX_MAX_BACKOFF_SECONDS
+from repositories import get_storage, add_outbox_listener, OutboxEffect
+from members import get_or_fetch_member
+from notifications import notify_mentors
+from guilds import configured_guilds
+
+
+class UndeliverableEffect(Exception):
+    """An effect that will fail however often it is retried (e.g. the member left the server)."""
+
+
+# -------------- Effects ----------------
+# Handlers by effect kind: async def handler(client, guild_id, **payload). A handler that only hands the effect on
+# (like a debounced mentors post) returns a future resolved once it was actually delivered; the entry stays pending
+# until then.
+HANDLERS = {}
+# Buttons attached to mentors channel posts are rebuilt at delivery: async def builder(client, guild_id, *args)
+BUTTON_BUILDERS = {}
+
+
+def outbox_handler(kind):
+    def decorator(handler):
+        HANDLERS[kind] = handler
+        return handler
+    return decorator
+
+
+def register_button(name, builder):
+    BUTTON_BUILDERS[name] = builder
+
+
+def dm(user_id, content, key):
+    """Effect: send a direct message."""
+    return OutboxEffect('dm', {'user_id': int(user_id), 'content': content}, key)
+
+
+def mentors_post(category, content, key, summary=None, buttons=(), label=None, urgent=False):
+    """Effect: post to the mentors channel. `buttons` are (builder name, *args) lists, see register_button."""
+    return OutboxEffect('mentors', {'category': category, 'content': content, 'summary': summary,
+                                    'buttons': [list(button) for button in buttons], 'label': label,
+                                    'urgent': urgent}, key)
+
+
+def role_update(user_id, key, add=(), remove=(), remove_all=False, reason=None):
+    """Effect: edit a member's roles. `remove_all` removes every role except @everyone and the added ones."""
+    return OutboxEffect('roles', {'user_id': int(user_id), 'add': [int(role_id) for role_id in add],
+                                  'remove': [int(role_id) for role_id in remove], 'remove_all': remove_all,
+                                  'reason': reason}, key)
+
+
+@outbox_handler('dm')
+async def deliver_dm(client, guild_id, user_id, content):
+    user = client.get_user(user_id) or await client.fetch_user(user_id)
+    await user.send(content)
+
+
+@outbox_handler('mentors')
+async def deliver_mentors_post(client, guild_id, category, content, summary, buttons, label, urgent):
+    built = [await BUTTON_BUILDERS[name](client, guild_id, *args) for name, *args in buttons]
+    receipt = asyncio.get_running_loop().create_future()
+    if not await notify_mentors(client, guild_id, category, content, summary=summary,
+                                buttons=[button for button in built if button], label=label, urgent=urgent,
+                                receipt=receipt):
+        raise RuntimeError("Mentors channel not found")
+    # Resolved when the post (or the digest carrying it) was sent
+    return receipt
+
+
+@outbox_handler('roles')
+async def deliver_role_update(client, guild_id, user_id, add, remove, remove_all, reason):
+    guild = client.get_guild(guild_id)
+    if guild is None:
+        raise UndeliverableEffect(f"Server {guild_id} is not available")
+    member = await get_or_fetch_member(guild, user_id)
+    if member is None:
+        raise UndeliverableEffect(f"Member {user_id} is not in the server")
+
+    # Role edits are compared against the member's current roles, so repeating one is harmless
+    roles_to_add = [role for role in (guild.get_role(role_id) for role_id in add) if role and role not in member.roles]
+    if remove_all:
+        roles_to_remove = [role for role in member.roles if role != guild.default_role and role.id not in add]
+    else:
+        roles_to_remove = [role for role in member.roles if role.id in remove]
+    if roles_to_remove:
+        await member.remove_roles(*roles_to_remove, reason=reason)
+    if roles_to_add:
+        await member.add_roles(*roles_to_add, reason=reason)
+
+
+def is_permanent(error):
+    """Errors that a retry won't fix: client errors from Discord (403, 404...) and unknown effects."""
+    if isinstance(error, (UndeliverableEffect, KeyError, TypeError)):
+        return True
+    return isinstance(error, discord.HTTPException) and 400 <= error.status < 500 and error.status != 429
+
+
+def backoff(attempts):
+    """Seconds before the next attempt: exponential with jitter, capped at OUTBOX_MAX_BACKOFF_SECONDS."""
+    return min(OUTBOX_MAX_BACKOFF_SECONDS, 2 ** attempts) * random.uniform(0.5, 1.0)
+
+
+# -------------- Workers ----------------
+class OutboxWorker:
+    """Delivers the outbox of every server the client is in, with a bounded pool of worker tasks.
+
+    A dispatcher task loads due entries when woken by a new entry or every `poll_interval` seconds (for retries)
+    and hands them to the workers. Delivered entries are deleted, failed ones are retried with backoff until
+    `max_attempts`, then kept as 'failed'. Entries whose handler returns a receipt are settled when it resolves,
+    without holding a worker meanwhile; they stay pending in the table until then.
+    """
+
+    def __init__(self, client, workers=OUTBOX_WORKERS, poll_interval=OUTBOX_POLL_SECONDS,
+                 max_attempts=OUTBOX_MAX_ATTEMPTS):
+        self.client = client
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.queue = asyncio.Queue(maxsize=workers * 4)
+        self.delivered = 0
+        self.failed = 0
+        self._wake = asyncio.Event()
+        self._in_flight = set()
+        self._settling = set()
+        self._tasks = []
+
+    def start(self):
+        add_outbox_listener(self.wake)
+        self._tasks = [asyncio.create_task(self._dispatch())]
+        self._tasks += [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def stop(self):
+        # Entries still waiting for their receipt stay pending and are delivered after the restart
+        tasks = self._tasks + list(self._settling)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks = []
+
+    def wake(self, guild_id=None):
+        self._wake.set()
+
+    async def drain(self, timeout=None):
+        """Wait until no entry is due or being delivered (for shutdown and tests)."""
+        async def idle():
+            while True:
+                await self.queue.join()
+                if not self._in_flight and not self._due_entries(limit=1):
+                    return
+                self.wake()
+                await asyncio.sleep(0.01)
+        await asyncio.wait_for(idle(), timeout)
+
+    def _due_entries(self, limit=None):
+        entries = []
+        # Entries in flight are still pending (e.g. waiting for a digest), so look past them
+        limit = (limit or self.queue.maxsize) + len(self._in_flight)
+        for guild in configured_guilds(self.client.guilds):
+            try:
+                due = get_storage(guild.id).outbox.due(time.time(), limit)
+            except sqlite3.Error as e:
+                print(f"Failed to read the outbox of {guild.name}: {e}")
+                continue
+            entries += [(guild.id, entry) for entry in due if (guild.id, entry.id) not in self._in_flight]
+        return entries
+
+    async def _dispatch(self):
+        while True:
+            self._wake.clear()
+            for guild_id, entry in self._due_entries():
+                self._in_flight.add((guild_id, entry.id))
+                await self.queue.put((guild_id, entry))
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _work(self):
+        while True:
+            guild_id, entry = await self.queue.get()
+            settled = True
+            try:
+                settled = await self.deliver(guild_id, entry)
+            except Exception as e:
+                print(f"Outbox entry {entry.id} ({entry.kind}) could not be updated: {e}")
+            finally:
+                if settled:
+                    self._in_flight.discard((guild_id, entry.id))
+                self.queue.task_done()
+
+    async def deliver(self, guild_id, entry):
+        """Run the entry's handler. Returns False if the entry is settled later, when its receipt resolves."""
+        try:
+            receipt = await HANDLERS[entry.kind](self.client, guild_id, **json.loads(entry.payload))
+        except Exception as e:
+            self.settle(guild_id, entry, e)
+            return True
+        if receipt is None:
+            self.settle(guild_id, entry)
+            return True
+        task = asyncio.create_task(self._settle_later(guild_id, entry, receipt))
+        self._settling.add(task)
+        task.add_done_callback(self._settling.discard)
+        return False
+
+    async def _settle_later(self, guild_id, entry, receipt):
+        try:
+            try:
+                await receipt
+            except Exception as e:
+                self.settle(guild_id, entry, e)
+            else:
+                self.settle(guild_id, entry)
+        except Exception as e:
+            print(f"Outbox entry {entry.id} ({entry.kind}) could not be updated: {e}")
+        finally:
+            self._in_flight.discard((guild_id, entry.id))
+
+    def settle(self, guild_id, entry, error=None):
+        """Delete a delivered entry, or schedule the retry of a failed one (keep it as 'failed' after the last)."""
+        outbox = get_storage(guild_id).outbox
+        if error is None:
+            outbox.delivered(entry.id)
+            self.delivered += 1
+            return
+        attempts = entry.attempts + 1
+        if is_permanent(error) or attempts >= self.max_attempts:
+            print(f"Outbox entry {entry.id} ({entry.kind}) failed after {attempts} attempt(s): {error!r}")
+            outbox.fail(entry.id, repr(error))
+            self.failed += 1
+        else:
+            outbox.retry(entry.id, time.time() + backoff(attempts), repr(error))
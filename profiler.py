@@ -0,0 +1,169 @@
+# Standard library imports
+import re
+import json
+import sqlite3
+import threading
+from datetime import datetime
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?(?![\w.])")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+_SCAN = re.compile(r"^SCAN (?:TABLE )?(\w+)(.*)$")
+_EXPLAINABLE = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE', 'WITH')
+
+
+def normalize_sql(sql):
+    """Reduce a statement to its shape: literals become ?, IN lists collapse and whitespace is squashed."""
+    sql = _STRING_LITERAL.sub('?', sql)
+    sql = _NUMBER_LITERAL.sub('?', sql)
+    sql = _IN_LIST.sub('(?)', sql)
+    return _WHITESPACE.sub(' ', sql).strip().rstrip(';')
+
+
+class StatementStats:
+    __slots__ = ('sql', 'calls', 'total_time', 'max_time', 'plan', 'scans')
+
+    def __init__(self, sql):
+        self.sql = sql
+        self.calls = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.plan = None
+        self.scans = []
+
+    def as_dict(self):
+        return {
+            "sql": self.sql,
+            "calls": self.calls,
+            "total_ms": round(self.total_time * 1000, 3),
+            "avg_ms": round(self.total_time * 1000 / self.calls, 3) if self.calls else 0.0,
+            "max_ms": round(self.max_time * 1000, 3),
+            "plan": self.plan or [],
+            "large_table_scans": self.scans,
+        }
+
+
+class QueryProfiler:
+    """Collects per-statement call counts and timings, and the query plan of every new statement shape.
+
+    Call counts come from the sqlite3 trace callback, so statements run by executescript or implicit
+    transaction handling are counted too. Timings come from the database cursor.
+    """
+
+    def __init__(self, large_table_rows=1000):
+        self.large_table_rows = large_table_rows
+        self.started_at = datetime.now()
+        self._stats = {}
+        self._table_rows = {}
+        self._lock = threading.Lock()
+
+    def _get(self, shape):
+        stats = self._stats.get(shape)
+        if stats is None:
+            stats = self._stats[shape] = StatementStats(shape)
+        return stats
+
+    def on_trace(self, statement):
+        """sqlite3 trace callback: count the executed statement under its normalized shape."""
+        shape = normalize_sql(statement)
+        with self._lock:
+            self._get(shape).calls += 1
+
+    def record(self, conn, sql, parameters, duration):
+        """Record the execution time of a statement, explaining it if its shape is new."""
+        shape = normalize_sql(sql)
+        with self._lock:
+            stats = self._get(shape)
+            stats.total_time += duration
+            stats.max_time = max(stats.max_time, duration)
+            needs_plan = stats.plan is None
+            if needs_plan:
+                stats.plan = []
+
+        if needs_plan and sql.lstrip().upper().startswith(_EXPLAINABLE):
+            plan, scans = self.explain(conn, sql, parameters)
+            with self._lock:
+                stats.plan, stats.scans = plan, scans
+            for table, rows in scans:
+                print(f"Query profiler: full scan of {table} ({rows} rows) in: {shape}")
+
+    def explain(self, conn, sql, parameters):
+        """Run EXPLAIN QUERY PLAN for a statement. Returns the plan lines and any scans of large tables."""
+        if not isinstance(parameters, (tuple, list, dict)) or not parameters:
+            # executemany/unknown parameters: the plan does not depend on the bound values
+            parameters = (None,) * sql.count('?')
+        # Plain cursor and no trace callback, so the EXPLAIN itself is neither timed nor profiled
+        conn.set_trace_callback(None)
+        try:
+            rows = conn.cursor(sqlite3.Cursor).execute(f"EXPLAIN QUERY PLAN {sql}", parameters).fetchall()
+
+            plan, scans = [], []
+            for row in rows:
+                detail = row[-1]
+                plan.append(detail)
+                match = _SCAN.match(detail)
+                if match:
+                    table = match.group(1)
+                    row_count = self._row_count(conn, table)
+                    if row_count >= self.large_table_rows:
+                        scans.append((table, row_count))
+            return plan, scans
+        except sqlite3.Error as e:
+            return [f"EXPLAIN failed: {e}"], []
+        finally:
+            conn.set_trace_callback(self.on_trace)
+
+    def _row_count(self, conn, table):
+        if table not in self._table_rows:
+            try:
+                self._table_rows[table] = conn.cursor(sqlite3.Cursor).execute(
+                    f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            except sqlite3.Error:
+                self._table_rows[table] = 0
+        return self._table_rows[table]
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+            self._table_rows.clear()
+            self.started_at = datetime.now()
+
+    def top(self, limit=None, key='total_time'):
+        """Return the statement stats sorted by `key`, highest first."""
+        with self._lock:
+            stats = sorted(self._stats.values(), key=lambda s: getattr(s, key), reverse=True)
+        return stats[:limit] if limit else stats
+
+    def flagged(self):
+        """Return the statements whose plan scans a large table."""
+        return [stats for stats in self.top() if stats.scans]
+
+    def report(self):
+        return {
+            "started_at": self.started_at.isoformat(),
+            "generated_at": datetime.now().isoformat(),
+            "large_table_rows": self.large_table_rows,
+            "statements": [stats.as_dict() for stats in self.top()],
+        }
+
+    def write_report(self, path):
+        """Dump the report as JSON to `path` and return the path."""
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent=2)
+        return path
+
+
+# The active profiler, or None when query profiling is disabled
+_profiler = None
+
+
+def enable_profiling(large_table_rows=1000):
+    global _profiler
+    if _profiler is None:
+        _profiler = QueryProfiler(large_table_rows)
+    return _profiler
+
+
+def get_profiler():
+    return _profiler
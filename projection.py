@@ -0,0 +1,123 @@
+# Standard library imports
+from datetime import datetime
+
+# GW2 ID column values that mean "no ID" rather than an actual account name
+NO_GW2_ID = ('-', 'Unknown')
+
+
+def today_key(now=None):
+    """Today as month * 100 + day, the day and month of a yyyymmdd birthday."""
+    now = now or datetime.now()
+    return now.month * 100 + now.day
+
+
+class ProjectedUser:
+    """The columns of a `users` row the nightly sync works with."""
+    __slots__ = ('gw2_id', 'alt_gw2_id', 'member', 'alt_member', 'birthday')
+
+    def __init__(self, gw2_id, alt_gw2_id, member, alt_member, birthday):
+        self.gw2_id = gw2_id
+        self.alt_gw2_id = alt_gw2_id
+        self.member = member  # guild_status == GuildStatus.MEMBER
+        self.alt_member = alt_member
+        self.birthday = birthday  # month * 100 + day, 0 if not set
+
+
+class UserProjection:
+    """Compact in-memory copy of one server's `users` table, keyed by integer Discord ID.
+
+    Loaded from the table once, then kept current by the writes themselves (the user repository listeners and the
+    nightly sync), so the sync diffs the members, roster and birthdays against it without reading the table again.
+    Lowercased GW2 IDs map to the set of users linked to them like the NOCASE columns (the columns aren't unique),
+    one index for main and one for alt IDs.
+    """
+    __slots__ = ('users', '_owners', '_alt_owners')
+
+    def __init__(self):
+        self.users = {}
+        self._owners = {}
+        self._alt_owners = {}
+
+    def __len__(self):
+        return len(self.users)
+
+    def load(self, rows):
+        """Replace the projection with `users` rows of (discord_id, gw2_id, alt_gw2_id, guild_status,
+        alt_guild_status, birthday)."""
+        self.users, self._owners, self._alt_owners = {}, {}, {}
+        for row in rows:
+            self.put(*row)
+
+    def put(self, discord_id, gw2_id='Unknown', alt_gw2_id='-', guild_status=0, alt_guild_status=0, birthday=0):
+        self.discard(discord_id)
+        self.users[discord_id] = ProjectedUser(gw2_id, alt_gw2_id, bool(guild_status), bool(alt_guild_status),
+                                               birthday % 10000)
+        if gw2_id not in NO_GW2_ID:
+            self._owners.setdefault(gw2_id.lower(), set()).add(discord_id)
+        if alt_gw2_id not in NO_GW2_ID:
+            self._alt_owners.setdefault(alt_gw2_id.lower(), set()).add(discord_id)
+
+    def discard(self, discord_id):
+        user = self.users.pop(discord_id, None)
+        if user is not None:
+            _remove_owner(self._owners, user.gw2_id, discord_id)
+            _remove_owner(self._alt_owners, user.alt_gw2_id, discord_id)
+
+    def owner_of(self, gw2_id, include_alt=True):
+        """Integer Discord ID of a user linked to a GW2 ID (main, or main/alt with `include_alt`), the lowest one if
+        several share it."""
+        owners = self._owners.get(gw2_id.lower())
+        if not owners and include_alt:
+            owners = self._alt_owners.get(gw2_id.lower())
+        return min(owners) if owners else None
+
+    def diff(self, member_ids):
+        """(members without a row, rows of users no longer on the server), as sets of integer Discord IDs."""
+        member_ids = set(member_ids)
+        return member_ids - self.users.keys(), self.users.keys() - member_ids
+
+    def status_changes(self, roster_names):
+        """(discord_id, member, alt_member) of the users whose guild statuses differ from the roster's."""
+        members, alt_members = set(), set()
+        for name in roster_names:
+            lowered = name.lower()
+            members.update(self._owners.get(lowered, ()))
+            alt_members.update(self._alt_owners.get(lowered, ()))
+        return [(discord_id, discord_id in members, discord_id in alt_members)
+                for discord_id, user in self.users.items()
+                if user.member != (discord_id in members) or user.alt_member != (discord_id in alt_members)]
+
+    def set_statuses(self, changes):
+        for discord_id, member, alt_member in changes:
+            user = self.users[discord_id]
+            user.member, user.alt_member = member, alt_member
+
+
+def _remove_owner(index, gw2_id, discord_id):
+    """Unlink one user from a GW2 ID index entry, dropping the entry once nobody is left."""
+    owners = index.get(gw2_id.lower())
+    if owners is not None:
+        owners.discard(discord_id)
+        if not owners:
+            del index[gw2_id.lower()]
+
+
+# Projection per server, loaded by the first sync and kept in memory after that
+_projections = {}
+
+
+def get_user_projection(guild_id):
+    """The server's projection, or None if it has not been loaded yet."""
+    return _projections.get(str(guild_id))
+
+
+def set_user_projection(guild_id, projection):
+    _projections[str(guild_id)] = projection
+
+
+def drop_user_projection(guild_id=None):
+    """Forget a server's projection (all of them without `guild_id`), e.g. after its database was replaced."""
+    if guild_id is None:
+        _projections.clear()
+    else:
+        _projections.pop(str(guild_id), None)
@@ -0,0 +1,1174 @@
+# Standard library imports
+import re
+import json
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+from typing import NamedTuple, Optional
+
+# Personal files
+from config import STORAGE_BACKEND, ROSTER_MAX_AGE_MINUTES
+from db import shared_cursor, save_guild_roster
+from gw2 import get_guild_roster
+from columns import GuildStatus, NO_BIRTHDAY, now_epoch
+from projection import NO_GW2_ID, get_user_projection
+
+
+# -------------- Records ----------------
+# Field order matches the table columns, so a record can be built straight from a `SELECT *` row
+class UserRecord(NamedTuple):
+    discord_id: int
+    gw2_id: str = 'Unknown'
+    guild_status: int = GuildStatus.NONE
+    alt_gw2_id: str = '-'
+    alt_guild_status: int = GuildStatus.NONE
+    watchlist_reason: str = '-'
+    warnings: int = 0
+    last_warning_date: Optional[int] = None  # Unix seconds
+    birthday: int = NO_BIRTHDAY  # yyyymmdd
+
+    @property
+    def on_watchlist(self):
+        return self.watchlist_reason != '-'
+
+
+class WarningRecord(NamedTuple):
+    id: int
+    discord_id: int
+    reason: str
+    date: int  # Unix seconds
+
+
+class BanRecord(NamedTuple):
+    discord_id: int
+    reason: str
+    date: int  # Unix seconds
+
+
+class ApplicationRecord(NamedTuple):
+    id: int
+    timestamp: int  # Unix seconds
+    discord_id: int
+    gw2_id: str
+    joined_how: str
+    timezone: str
+    has_commander_tag: str
+    content_preference: str
+    has_led_event: str
+    event_interest: Optional[str] = None
+    changes_suggested: Optional[str] = None
+
+
+class RosterEntry(NamedTuple):
+    name: str
+    rank: str = '-'
+    joined: Optional[str] = None
+
+
+class SearchResult(NamedTuple):
+    kind: str  # 'warning', 'watchlist' or 'application'
+    id: Optional[int]
+    discord_id: int
+    snippet: str
+    date: Optional[int]  # Unix seconds
+    score: float  # Lower is a better match
+
+
+class OutboxEffect(NamedTuple):
+    kind: str  # Name of the outbox handler that delivers it, e.g. 'dm' (see outbox.py)
+    payload: dict  # JSON-serialisable arguments of the handler
+    key: str  # Idempotency key: an effect is queued once, however often it is enqueued
+
+
+class OutboxRecord(NamedTuple):
+    id: int
+    idempotency_key: str
+    kind: str
+    payload: str  # JSON
+    attempts: int
+    next_attempt_at: float  # Unix time
+    created_at: str
+    last_error: Optional[str]
+    status: str  # 'pending' or 'failed' (delivered entries are deleted)
+
+
+class AuditRecord(NamedTuple):
+    id: Optional[int]  # None until written
+    created_at: float  # Unix time
+    actor_id: int
+    action: str  # e.g. 'warning_add' (see AUDIT_ACTIONS in audit.py)
+    target_id: Optional[int]
+    details: Optional[str]
+
+
+SEARCH_SCOPES = ('warnings', 'watchlist', 'applications')
+
+
+def fts_query(text: str):
+    """Turn free text into an FTS5 query: every word must match, `word*` matches a prefix.
+
+    Words are quoted, so punctuation and FTS5 operators in the input can't cause a syntax error.
+    """
+    terms = []
+    for word in text.split():
+        prefix = word.endswith('*')
+        word = word.rstrip('*').replace('"', '""')
+        if word:
+            terms.append(f'"{word}"' + ('*' if prefix else ''))
+    return ' '.join(terms)
+
+
+# Callbacks run with (guild_id, discord_id) after a user's GW2 IDs or birthday are written, e.g. to keep autocomplete
+# and the users projection current
+_user_listeners = []
+
+
+def add_user_listener(callback):
+    _user_listeners.append(callback)
+
+
+def notify_user_changed(guild_id, discord_id):
+    discord_id = int(discord_id)
+    for callback in _user_listeners:
+        callback(guild_id, discord_id)
+
+
+# Callbacks run with the guild ID after side effects were added to its outbox, to wake the outbox workers
+_outbox_listeners = []
+
+
+def add_outbox_listener(callback):
+    _outbox_listeners.append(callback)
+
+
+def notify_outbox(guild_id):
+    for callback in _outbox_listeners:
+        callback(guild_id)
+
+
+def resolve_effects(effects, result):
+    """Write methods take their outbox effects as a list, or as a function of the method's result."""
+    return list(effects(result) if callable(effects) else effects)
+
+
+def parse_discord_id(identifier: str):
+    """Strip the mention syntax (<@id> or <@!id>) from a user identifier."""
+    if identifier.startswith('<@') and identifier.endswith('>'):
+        return identifier.strip('<@!>')
+    return identifier
+
+
+def snowflake(identifier: str) -> Optional[int]:
+    """The Discord ID of a user identifier, or None if it isn't an ID or mention."""
+    discord_id = parse_discord_id(identifier)
+    return int(discord_id) if discord_id.isdigit() else None
+
+
+# -------------- Interfaces ----------------
+class UserRepository(ABC):
+    @abstractmethod
+    def get(self, discord_id) -> Optional[UserRecord]:
+        ...
+
+    @abstractmethod
+    def all(self) -> list[UserRecord]:
+        ...
+
+    @abstractmethod
+    def find(self, identifier: str) -> Optional[UserRecord]:
+        """Find a user by @mention, Discord ID, main GW2 ID or alt GW2 ID (in that order)."""
+
+    @abstractmethod
+    def owner_of(self, gw2_id, include_alt=True) -> Optional[int]:
+        """Discord ID of the user linked to a GW2 ID (main, or main/alt with `include_alt`)."""
+
+    @abstractmethod
+    def link(self, discord_id, gw2_id, effects=()):
+        """Register a verified user with their main GW2 ID, replacing any previous record.
+
+        `effects` are queued in the outbox in the same transaction (as with the other write methods taking them).
+        """
+
+    @abstractmethod
+    def set_gw2_ids(self, discord_id, gw2_id=None, alt_gw2_id=None, effects=()):
+        """Set the given GW2 IDs and mark them as guild members."""
+
+    @abstractmethod
+    def clear_gw2_id(self, discord_id, alt=False):
+        ...
+
+    @abstractmethod
+    def set_birthday(self, discord_id, birthday=NO_BIRTHDAY):
+        """Set a yyyymmdd birthday (see columns.birthday_value), or clear it."""
+
+
+class WatchlistRepository(ABC):
+    @abstractmethod
+    def add(self, discord_id, reason):
+        ...
+
+    @abstractmethod
+    def remove(self, discord_id):
+        ...
+
+    @abstractmethod
+    def list(self) -> list[UserRecord]:
+        ...
+
+
+class WarningRepository(ABC):
+    @abstractmethod
+    def for_user(self, discord_id, newest_first=False) -> list[WarningRecord]:
+        ...
+
+    def add(self, discord_id, reason, date, expire_days=90, effects=()) -> int:
+        """Add a warning, dropping the user's warnings older than `expire_days`. Returns the new warning count."""
+        discord_id = int(discord_id)
+        if callable(effects):
+            count_effects = effects
+            effects = lambda counts: count_effects(counts[discord_id])
+        return self.add_many([discord_id], reason, date, expire_days, effects)[discord_id]
+
+    @abstractmethod
+    def add_many(self, discord_ids, reason, date, expire_days=90, effects=()) -> dict:
+        """Add the same warning to several users at once. Returns the new warning count by Discord ID."""
+
+    @abstractmethod
+    def remove(self, discord_id, warning_id):
+        ...
+
+
+class BanRepository(ABC):
+    @abstractmethod
+    def add(self, discord_id, reason, date):
+        ...
+
+    @abstractmethod
+    def all(self) -> dict:
+        """All recorded bans by Discord ID."""
+
+    @abstractmethod
+    def sync(self, missing_bans, stale_ban_ids=()):
+        """Record bans made outside of the bot and drop the records of lifted bans."""
+
+
+class ApplicationRepository(ABC):
+    @abstractmethod
+    def add(self, application: dict) -> int:
+        ...
+
+    @abstractmethod
+    def get(self, app_id) -> Optional[ApplicationRecord]:
+        ...
+
+    @abstractmethod
+    def list(self) -> list[ApplicationRecord]:
+        """All applications, most recent first."""
+
+    @abstractmethod
+    def delete(self, app_id) -> bool:
+        ...
+
+
+class RosterRepository(ABC):
+    @abstractmethod
+    def replace(self, roster):
+        """Replace the stored roster with a fresh copy from the GW2 API."""
+
+    @abstractmethod
+    def updated_at(self) -> Optional[datetime]:
+        ...
+
+    @abstractmethod
+    def joined(self, name) -> Optional[str]:
+        ...
+
+    @abstractmethod
+    def count_unlinked(self) -> int:
+        """Number of roster entries whose GW2 ID is not linked to any Discord account (Legacy Members excluded)."""
+
+    @abstractmethod
+    def find_unlinked(self, limit=-1, offset=0) -> list[RosterEntry]:
+        """One page of unlinked roster entries, ordered by name."""
+
+
+class SearchRepository(ABC):
+    @abstractmethod
+    def count(self, query: str, scopes=SEARCH_SCOPES) -> int:
+        ...
+
+    @abstractmethod
+    def search(self, query: str, scopes=SEARCH_SCOPES, limit=10, offset=0) -> list[SearchResult]:
+        """Full-text search over warning reasons, watchlist reasons and applications, best matches first."""
+
+
+class OutboxRepository(ABC):
+    @abstractmethod
+    def enqueue(self, effects):
+        """Queue side effects that don't go with a database change."""
+
+    @abstractmethod
+    def due(self, now, limit=50) -> list[OutboxRecord]:
+        """Pending entries whose next attempt is due at `now`, oldest first."""
+
+    @abstractmethod
+    def delivered(self, entry_id):
+        ...
+
+    @abstractmethod
+    def retry(self, entry_id, next_attempt_at, error):
+        ...
+
+    @abstractmethod
+    def fail(self, entry_id, error):
+        """Give up on an entry. It stays in the outbox with the last error, for staff to look into."""
+
+    @abstractmethod
+    def pending_count(self) -> int:
+        ...
+
+
+class AuditLogRepository(ABC):
+    @abstractmethod
+    def add_many(self, entries: list[AuditRecord]):
+        """Append entries in one transaction (their IDs are assigned by the database)."""
+
+    @abstractmethod
+    def count(self, actor_id=None, target_id=None, since=None, until=None) -> int:
+        ...
+
+    @abstractmethod
+    def query(self, actor_id=None, target_id=None, since=None, until=None, limit=10, offset=0) -> list[AuditRecord]:
+        """Entries by an actor and/or about a target, created in [since, until), newest first."""
+
+
+class SessionRepository(ABC):
+    @abstractmethod
+    def get(self, flow, user_id, now) -> Optional[tuple]:
+        """(data, expires_at) of a user's session in a flow, or None if there is none or it expired before `now`."""
+
+    @abstractmethod
+    def put(self, flow, user_id, data: dict, expires_at):
+        ...
+
+    @abstractmethod
+    def delete(self, flow, user_id):
+        ...
+
+    @abstractmethod
+    def purge_expired(self, now) -> int:
+        ...
+
+
+class Storage:
+    """The repositories of one server's data."""
+    users: UserRepository
+    watchlist: WatchlistRepository
+    warnings: WarningRepository
+    bans: BanRepository
+    applications: ApplicationRepository
+    roster: RosterRepository
+    search: SearchRepository
+    outbox: OutboxRepository
+    sessions: SessionRepository
+    audit: AuditLogRepository
+
+
+# -------------- SQLite ----------------
+class SqliteRepository:
+    def __init__(self, guild_id=None):
+        self.guild_id = guild_id
+
+    def cursor(self):
+        """A cursor on the server's database; changes are committed when the block exits without an error."""
+        return shared_cursor(self.guild_id)
+
+
+def insert_effects(c, effects):
+    """Queue outbox effects on the cursor of the transaction that causes them."""
+    now, created_at = time.time(), datetime.now().isoformat()
+    c.executemany("INSERT OR IGNORE INTO outbox (idempotency_key, kind, payload, next_attempt_at, created_at) "
+                  "VALUES (?, ?, ?, ?, ?)",
+                  [(effect.key, effect.kind, json.dumps(effect.payload), now, created_at) for effect in effects])
+
+
+class SqliteUserRepository(SqliteRepository, UserRepository):
+    def get(self, discord_id):
+        with self.cursor() as c:
+            c.execute("SELECT * FROM users WHERE discord_id = ?", (int(discord_id),))
+            row = c.fetchone()
+        return UserRecord(*row) if row else None
+
+    def all(self):
+        with self.cursor() as c:
+            c.execute("SELECT * FROM users")
+            return [UserRecord(*row) for row in c.fetchall()]
+
+    def find(self, identifier):
+        with self.cursor() as c:
+            for query, value in [
+                ("SELECT * FROM users WHERE discord_id = ?", snowflake(identifier)),
+                ("SELECT * FROM users WHERE gw2_id = ?", identifier),
+                ("SELECT * FROM users WHERE alt_gw2_id = ?", identifier)
+            ]:
+                c.execute(query, (value,))
+                row = c.fetchone()
+                if row:
+                    return UserRecord(*row)
+        return None
+
+    def owner_of(self, gw2_id, include_alt=True):
+        with self.cursor() as c:
+            if include_alt:
+                c.execute("SELECT discord_id FROM users WHERE gw2_id = ? OR alt_gw2_id = ?", (gw2_id, gw2_id))
+            else:
+                c.execute("SELECT discord_id FROM users WHERE gw2_id = ?", (gw2_id,))
+            row = c.fetchone()
+        return row[0] if row else None
+
+    def link(self, discord_id, gw2_id, effects=()):
+        effects = resolve_effects(effects, None)
+        with self.cursor() as c:
+            c.execute("INSERT OR REPLACE INTO users (discord_id, gw2_id, guild_status) VALUES (?, ?, ?)",
+                      (int(discord_id), gw2_id, GuildStatus.MEMBER))
+            insert_effects(c, effects)
+        notify_user_changed(self.guild_id, discord_id)
+        if effects:
+            notify_outbox(self.guild_id)
+
+    def set_gw2_ids(self, discord_id, gw2_id=None, alt_gw2_id=None, effects=()):
+        update_fields, update_data = [], []
+        if gw2_id:
+            update_fields.extend(["gw2_id = ?", "guild_status = ?"])
+            update_data.extend([gw2_id, GuildStatus.MEMBER])
+        if alt_gw2_id:
+            update_fields.extend(["alt_gw2_id = ?", "alt_guild_status = ?"])
+            update_data.extend([alt_gw2_id, GuildStatus.MEMBER])
+        if not update_fields:
+            return
+        effects = resolve_effects(effects, None)
+        with self.cursor() as c:
+            c.execute(f"UPDATE users SET {', '.join(update_fields)} WHERE discord_id = ?",
+                      (*update_data, int(discord_id)))
+            insert_effects(c, effects)
+        notify_user_changed(self.guild_id, discord_id)
+        if effects:
+            notify_outbox(self.guild_id)
+
+    def clear_gw2_id(self, discord_id, alt=False):
+        with self.cursor() as c:
+            if alt:
+                c.execute("UPDATE users SET alt_gw2_id = '-', alt_guild_status = 0 WHERE discord_id = ?",
+                          (int(discord_id),))
+            else:
+                c.execute("UPDATE users SET gw2_id = '-', guild_status = 0 WHERE discord_id = ?",
+                          (int(discord_id),))
+        notify_user_changed(self.guild_id, discord_id)
+
+    def set_birthday(self, discord_id, birthday=NO_BIRTHDAY):
+        with self.cursor() as c:
+            c.execute("UPDATE users SET birthday = ? WHERE discord_id = ?", (birthday, int(discord_id)))
+        notify_user_changed(self.guild_id, discord_id)
+
+
+class SqliteWatchlistRepository(SqliteRepository, WatchlistRepository):
+    def add(self, discord_id, reason):
+        with self.cursor() as c:
+            c.execute("UPDATE users SET watchlist_reason = ? WHERE discord_id = ?", (reason, int(discord_id)))
+
+    def remove(self, discord_id):
+        with self.cursor() as c:
+            c.execute("UPDATE users SET watchlist_reason = '-' WHERE discord_id = ?", (int(discord_id),))
+
+    def list(self):
+        with self.cursor() as c:
+            c.execute("SELECT * FROM users WHERE watchlist_reason != '-' ORDER BY discord_id")
+            return [UserRecord(*row) for row in c.fetchall()]
+
+
+class SqliteWarningRepository(SqliteRepository, WarningRepository):
+    def for_user(self, discord_id, newest_first=False):
+        order = "DESC" if newest_first else "ASC"
+        with self.cursor() as c:
+            c.execute(f"SELECT * FROM warnings WHERE discord_id = ? ORDER BY date {order}", (int(discord_id),))
+            return [WarningRecord(*row) for row in c.fetchall()]
+
+    def add_many(self, discord_ids, reason, date, expire_days=90, effects=()):
+        discord_ids = list(dict.fromkeys(int(discord_id) for discord_id in discord_ids))
+        expired = date - expire_days * 86400
+        with self.cursor() as c:
+            c.executemany("DELETE FROM warnings WHERE discord_id = ? AND date < ?",
+                          [(discord_id, expired) for discord_id in discord_ids])
+            c.executemany("INSERT INTO warnings (discord_id, reason, date) VALUES (?, ?, ?)",
+                          [(discord_id, reason, date) for discord_id in discord_ids])
+            c.executemany("UPDATE users SET warnings = (SELECT COUNT(*) FROM warnings WHERE discord_id = ?), "
+                          "last_warning_date = ? WHERE discord_id = ?",
+                          [(discord_id, date, discord_id) for discord_id in discord_ids])
+            placeholders = ', '.join('?' * len(discord_ids))
+            c.execute(f"SELECT discord_id, warnings FROM users WHERE discord_id IN ({placeholders})", discord_ids)
+            counts = dict(c.fetchall())
+            counts = {discord_id: counts.get(discord_id, 0) for discord_id in discord_ids}
+            effects = resolve_effects(effects, counts)
+            insert_effects(c, effects)
+        if effects:
+            notify_outbox(self.guild_id)
+        return counts
+
+    def remove(self, discord_id, warning_id):
+        with self.cursor() as c:
+            c.execute("DELETE FROM warnings WHERE id = ? AND discord_id = ?", (warning_id, int(discord_id)))
+            if c.rowcount:
+                c.execute("UPDATE users SET warnings = warnings - 1 WHERE discord_id = ?", (int(discord_id),))
+
+
+class SqliteBanRepository(SqliteRepository, BanRepository):
+    def add(self, discord_id, reason, date):
+        with self.cursor() as c:
+            c.execute("INSERT OR REPLACE INTO bans (discord_id, reason, date) VALUES (?, ?, ?)",
+                      (int(discord_id), reason, date))
+
+    def all(self):
+        with self.cursor() as c:
+            c.execute("SELECT discord_id, reason, date FROM bans")
+            return {row[0]: BanRecord(*row) for row in c.fetchall()}
+
+    def sync(self, missing_bans, stale_ban_ids=()):
+        with self.cursor() as c:
+            c.executemany("INSERT OR REPLACE INTO bans (discord_id, reason, date) VALUES (?, ?, ?)", missing_bans)
+            c.executemany("DELETE FROM bans WHERE discord_id = ?", [(ban_id,) for ban_id in stale_ban_ids])
+
+
+class SqliteApplicationRepository(SqliteRepository, ApplicationRepository):
+    COLUMNS = ApplicationRecord._fields[2:]
+
+    def add(self, application):
+        with self.cursor() as c:
+            c.execute(f"INSERT INTO mentor_applications ({', '.join(self.COLUMNS)}) "
+                      f"VALUES ({', '.join('?' * len(self.COLUMNS))})",
+                      tuple(application.get(column) for column in self.COLUMNS))
+        # Filled in once committed (cluster mode sends writes on commit)
+        return c.lastrowid
+
+    def get(self, app_id):
+        with self.cursor() as c:
+            c.execute("SELECT * FROM mentor_applications WHERE id = ?", (app_id,))
+            row = c.fetchone()
+        return ApplicationRecord(*row) if row else None
+
+    def list(self):
+        with self.cursor() as c:
+            c.execute("SELECT * FROM mentor_applications ORDER BY id DESC")
+            return [ApplicationRecord(*row) for row in c.fetchall()]
+
+    def delete(self, app_id):
+        with self.cursor() as c:
+            c.execute("DELETE FROM mentor_applications WHERE id = ?", (app_id,))
+        return c.rowcount > 0
+
+
+UNLINKED_MEMBERS_FILTER = """
+    FROM guild_roster r
+    WHERE r.rank != 'Legacy Member'
+      AND NOT EXISTS (SELECT 1 FROM users u WHERE u.gw2_id = r.name)
+      AND NOT EXISTS (SELECT 1 FROM users u WHERE u.alt_gw2_id = r.name)
+"""
+
+
+class SqliteRosterRepository(SqliteRepository, RosterRepository):
+    def replace(self, roster):
+        with self.cursor() as c:
+            save_guild_roster(c.connection, roster)
+
+    def updated_at(self):
+        with self.cursor() as c:
+            c.execute("SELECT MAX(updated_at) FROM guild_roster")
+            updated_at = c.fetchone()[0]
+        return datetime.fromisoformat(updated_at) if updated_at else None
+
+    def joined(self, name):
+        with self.cursor() as c:
+            c.execute("SELECT joined FROM guild_roster WHERE name = ?", (name,))
+            row = c.fetchone()
+        return row[0] if row else None
+
+    def count_unlinked(self):
+        with self.cursor() as c:
+            c.execute(f"SELECT COUNT(*) {UNLINKED_MEMBERS_FILTER}")
+            return c.fetchone()[0]
+
+    def find_unlinked(self, limit=-1, offset=0):
+        with self.cursor() as c:
+            c.execute(f"SELECT r.name, r.rank, r.joined {UNLINKED_MEMBERS_FILTER} ORDER BY r.name LIMIT ? OFFSET ?",
+                      (limit, offset))
+            return [RosterEntry(*row) for row in c.fetchall()]
+
+
+class SqliteSearchRepository(SqliteRepository, SearchRepository):
+    TABLES = {'warnings': 'warnings_fts', 'watchlist': 'watchlist_fts', 'applications': 'applications_fts'}
+    KINDS = {'warnings': 'warning', 'watchlist': 'watchlist', 'applications': 'application'}
+    SNIPPET = "'**', '**', '…', 16"
+    # Details of one hit; the snippet is only built for the results that are shown
+    DETAILS = {
+        'warning': f"""
+            SELECT w.id, w.discord_id, snippet(warnings_fts, 0, {SNIPPET}), w.date
+            FROM warnings_fts JOIN warnings w ON w.id = warnings_fts.rowid
+            WHERE warnings_fts MATCH ? AND warnings_fts.rowid = ?""",
+        'watchlist': f"""
+            SELECT NULL, discord_id, snippet(watchlist_fts, 1, {SNIPPET}), NULL
+            FROM watchlist_fts
+            WHERE watchlist_fts MATCH ? AND rowid = ?""",
+        'application': f"""
+            SELECT a.id, a.discord_id, snippet(applications_fts, -1, {SNIPPET}), a.timestamp
+            FROM applications_fts JOIN mentor_applications a ON a.id = applications_fts.rowid
+            WHERE applications_fts MATCH ? AND applications_fts.rowid = ?""",
+    }
+
+    def count(self, query, scopes=SEARCH_SCOPES):
+        match = fts_query(query)
+        if not match or not scopes:
+            return 0
+        counts = [f"(SELECT COUNT(*) FROM {self.TABLES[scope]} WHERE {self.TABLES[scope]} MATCH ?)"
+                  for scope in scopes]
+        with self.cursor() as c:
+            c.execute(f"SELECT {' + '.join(counts)}", (match,) * len(scopes))
+            return c.fetchone()[0]
+
+    def search(self, query, scopes=SEARCH_SCOPES, limit=10, offset=0):
+        match = fts_query(query)
+        if not match or not scopes:
+            return []
+        # Rank each table's hits by BM25 and keep only what the requested page can contain
+        depth = offset + limit if limit >= 0 else -1
+        ranked = " UNION ALL ".join(
+            f"SELECT * FROM (SELECT '{self.KINDS[scope]}' AS kind, rowid, bm25({self.TABLES[scope]}) AS score "
+            f"FROM {self.TABLES[scope]} WHERE {self.TABLES[scope]} MATCH ? ORDER BY score LIMIT ?)"
+            for scope in scopes)
+        results = []
+        with self.cursor() as c:
+            c.execute(f"{ranked} ORDER BY score LIMIT ? OFFSET ?", (match, depth) * len(scopes) + (limit, offset))
+            for kind, rowid, score in c.fetchall():
+                c.execute(self.DETAILS[kind], (match, rowid))
+                row = c.fetchone()
+                if row:
+                    results.append(SearchResult(kind, *row, score))
+        return results
+
+
+class SqliteOutboxRepository(SqliteRepository, OutboxRepository):
+    def enqueue(self, effects):
+        effects = list(effects)
+        with self.cursor() as c:
+            insert_effects(c, effects)
+        if effects:
+            notify_outbox(self.guild_id)
+
+    def due(self, now, limit=50):
+        with self.cursor() as c:
+            c.execute("SELECT * FROM outbox WHERE status = 'pending' AND next_attempt_at <= ? "
+                      "ORDER BY next_attempt_at, id LIMIT ?", (now, limit))
+            return [OutboxRecord(*row) for row in c.fetchall()]
+
+    def delivered(self, entry_id):
+        with self.cursor() as c:
+            c.execute("DELETE FROM outbox WHERE id = ?", (entry_id,))
+
+    def retry(self, entry_id, next_attempt_at, error):
+        with self.cursor() as c:
+            c.execute("UPDATE outbox SET attempts = attempts + 1, next_attempt_at = ?, last_error = ? WHERE id = ?",
+                      (next_attempt_at, error, entry_id))
+
+    def fail(self, entry_id, error):
+        with self.cursor() as c:
+            c.execute("UPDATE outbox SET attempts = attempts + 1, status = 'failed', last_error = ? WHERE id = ?",
+                      (error, entry_id))
+
+    def pending_count(self):
+        with self.cursor() as c:
+            c.execute("SELECT COUNT(*) FROM outbox WHERE status = 'pending'")
+            return c.fetchone()[0]
+
+
+class SqliteSessionRepository(SqliteRepository, SessionRepository):
+    def get(self, flow, user_id, now):
+        with self.cursor() as c:
+            c.execute("SELECT data, expires_at FROM sessions WHERE flow = ? AND user_id = ? AND expires_at > ?",
+                      (flow, user_id, now))
+            row = c.fetchone()
+        return (json.loads(row[0]), row[1]) if row else None
+
+    def put(self, flow, user_id, data, expires_at):
+        with self.cursor() as c:
+            c.execute("INSERT OR REPLACE INTO sessions (flow, user_id, data, expires_at) VALUES (?, ?, ?, ?)",
+                      (flow, user_id, json.dumps(data), expires_at))
+
+    def delete(self, flow, user_id):
+        with self.cursor() as c:
+            c.execute("DELETE FROM sessions WHERE flow = ? AND user_id = ?", (flow, user_id))
+
+    def purge_expired(self, now):
+        with self.cursor() as c:
+            c.execute("DELETE FROM sessions WHERE expires_at <= ?", (now,))
+        return c.rowcount
+
+
+class SqliteAuditLogRepository(SqliteRepository, AuditLogRepository):
+    @staticmethod
+    def _where(actor_id, target_id, since, until):
+        clauses, params = [], []
+        for clause, value in (("actor_id = ?", actor_id), ("target_id = ?", target_id),
+                              ("created_at >= ?", since), ("created_at < ?", until)):
+            if value is not None:
+                clauses.append(clause)
+                params.append(value)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def add_many(self, entries):
+        with self.cursor() as c:
+            c.executemany("INSERT INTO audit_log (created_at, actor_id, action, target_id, details) "
+                          "VALUES (?, ?, ?, ?, ?)", [entry[1:] for entry in entries])
+
+    def count(self, actor_id=None, target_id=None, since=None, until=None):
+        where, params = self._where(actor_id, target_id, since, until)
+        with self.cursor() as c:
+            c.execute(f"SELECT COUNT(*) FROM audit_log{where}", params)
+            return c.fetchone()[0]
+
+    def query(self, actor_id=None, target_id=None, since=None, until=None, limit=10, offset=0):
+        where, params = self._where(actor_id, target_id, since, until)
+        with self.cursor() as c:
+            c.execute(f"SELECT * FROM audit_log{where} ORDER BY created_at DESC, id DESC LIMIT ? OFFSET ?",
+                      params + [limit, offset])
+            return [AuditRecord(*row) for row in c.fetchall()]
+
+
+class SqliteStorage(Storage):
+    """Repositories on the server's SQLite database (or the database writer in cluster mode)."""
+
+    def __init__(self, guild_id=None):
+        self.guild_id = guild_id
+        self.users = SqliteUserRepository(guild_id)
+        self.watchlist = SqliteWatchlistRepository(guild_id)
+        self.warnings = SqliteWarningRepository(guild_id)
+        self.bans = SqliteBanRepository(guild_id)
+        self.applications = SqliteApplicationRepository(guild_id)
+        self.roster = SqliteRosterRepository(guild_id)
+        self.search = SqliteSearchRepository(guild_id)
+        self.outbox = SqliteOutboxRepository(guild_id)
+        self.sessions = SqliteSessionRepository(guild_id)
+        self.audit = SqliteAuditLogRepository(guild_id)
+
+
+# -------------- In-memory ----------------
+class InMemoryUserRepository(UserRepository):
+    def __init__(self, outbox, guild_id=None):
+        self.outbox = outbox
+        self.guild_id = guild_id
+        self.rows = {}
+        # Lowercased GW2 ID -> Discord ID, like the NOCASE columns
+        self.by_gw2_id = {}
+        self.by_alt_gw2_id = {}
+
+    def put(self, user: UserRecord):
+        old = self.rows.get(user.discord_id)
+        if old:
+            self.by_gw2_id.pop(old.gw2_id.lower(), None)
+            self.by_alt_gw2_id.pop(old.alt_gw2_id.lower(), None)
+        self.rows[user.discord_id] = user
+        if user.gw2_id not in NO_GW2_ID:
+            self.by_gw2_id[user.gw2_id.lower()] = user.discord_id
+        if user.alt_gw2_id not in NO_GW2_ID:
+            self.by_alt_gw2_id[user.alt_gw2_id.lower()] = user.discord_id
+
+    def update(self, discord_id, **changes):
+        user = self.rows.get(int(discord_id))
+        if user:
+            self.put(user._replace(**changes))
+
+    def is_linked(self, gw2_id):
+        return gw2_id.lower() in self.by_gw2_id or gw2_id.lower() in self.by_alt_gw2_id
+
+    def get(self, discord_id):
+        return self.rows.get(int(discord_id))
+
+    def all(self):
+        return list(self.rows.values())
+
+    def find(self, identifier):
+        user = self.rows.get(snowflake(identifier))
+        if user:
+            return user
+        discord_id = self.by_gw2_id.get(identifier.lower()) or self.by_alt_gw2_id.get(identifier.lower())
+        return self.rows.get(discord_id)
+
+    def owner_of(self, gw2_id, include_alt=True):
+        discord_id = self.by_gw2_id.get(gw2_id.lower())
+        if discord_id is None and include_alt:
+            discord_id = self.by_alt_gw2_id.get(gw2_id.lower())
+        return discord_id
+
+    def link(self, discord_id, gw2_id, effects=()):
+        self.put(UserRecord(int(discord_id), gw2_id, GuildStatus.MEMBER))
+        notify_user_changed(self.guild_id, discord_id)
+        self.outbox.enqueue(resolve_effects(effects, None))
+
+    def set_gw2_ids(self, discord_id, gw2_id=None, alt_gw2_id=None, effects=()):
+        changes = {}
+        if gw2_id:
+            changes.update(gw2_id=gw2_id, guild_status=GuildStatus.MEMBER)
+        if alt_gw2_id:
+            changes.update(alt_gw2_id=alt_gw2_id, alt_guild_status=GuildStatus.MEMBER)
+        if changes:
+            self.update(discord_id, **changes)
+            notify_user_changed(self.guild_id, discord_id)
+            self.outbox.enqueue(resolve_effects(effects, None))
+
+    def clear_gw2_id(self, discord_id, alt=False):
+        if alt:
+            self.update(discord_id, alt_gw2_id='-', alt_guild_status=GuildStatus.NONE)
+        else:
+            self.update(discord_id, gw2_id='-', guild_status=GuildStatus.NONE)
+        notify_user_changed(self.guild_id, discord_id)
+
+    def set_birthday(self, discord_id, birthday=NO_BIRTHDAY):
+        self.update(discord_id, birthday=birthday)
+        notify_user_changed(self.guild_id, discord_id)
+
+
+class InMemoryWatchlistRepository(WatchlistRepository):
+    def __init__(self, users: InMemoryUserRepository):
+        self.users = users
+
+    def add(self, discord_id, reason):
+        self.users.update(discord_id, watchlist_reason=reason)
+
+    def remove(self, discord_id):
+        self.users.update(discord_id, watchlist_reason='-')
+
+    def list(self):
+        return sorted((user for user in self.users.rows.values() if user.on_watchlist),
+                      key=lambda user: user.discord_id)
+
+
+class InMemoryWarningRepository(WarningRepository):
+    def __init__(self, users: InMemoryUserRepository):
+        self.users = users
+        self.outbox = users.outbox
+        self.rows = {}
+        self.next_id = 1
+
+    def for_user(self, discord_id, newest_first=False):
+        return sorted((warning for warning in self.rows.values() if warning.discord_id == int(discord_id)),
+                      key=lambda warning: warning.date, reverse=newest_first)
+
+    def add_many(self, discord_ids, reason, date, expire_days=90, effects=()):
+        expired = date - expire_days * 86400
+        counts = {}
+        for discord_id in dict.fromkeys(int(discord_id) for discord_id in discord_ids):
+            for warning in self.for_user(discord_id):
+                if warning.date < expired:
+                    del self.rows[warning.id]
+            self.rows[self.next_id] = WarningRecord(self.next_id, discord_id, reason, date)
+            self.next_id += 1
+
+            self.users.update(discord_id, warnings=len(self.for_user(discord_id)), last_warning_date=date)
+            user = self.users.get(discord_id)
+            counts[discord_id] = user.warnings if user else 0
+        self.outbox.enqueue(resolve_effects(effects, counts))
+        return counts
+
+    def remove(self, discord_id, warning_id):
+        warning = self.rows.get(warning_id)
+        if warning is None or warning.discord_id != int(discord_id):
+            return
+        del self.rows[warning_id]
+        user = self.users.get(discord_id)
+        if user:
+            self.users.update(discord_id, warnings=user.warnings - 1)
+
+
+class InMemoryBanRepository(BanRepository):
+    def __init__(self):
+        self.rows = {}
+
+    def add(self, discord_id, reason, date):
+        self.rows[int(discord_id)] = BanRecord(int(discord_id), reason, date)
+
+    def all(self):
+        return dict(self.rows)
+
+    def sync(self, missing_bans, stale_ban_ids=()):
+        for ban in missing_bans:
+            self.add(*ban)
+        for ban_id in stale_ban_ids:
+            self.rows.pop(ban_id, None)
+
+
+class InMemoryApplicationRepository(ApplicationRepository):
+    def __init__(self):
+        self.rows = {}
+        self.next_id = 1
+
+    def add(self, application):
+        app_id = self.next_id
+        self.next_id += 1
+        timestamp = now_epoch()
+        self.rows[app_id] = ApplicationRecord(app_id, timestamp, **{
+            column: application.get(column) for column in ApplicationRecord._fields[2:]})
+        return app_id
+
+    def get(self, app_id):
+        return self.rows.get(app_id)
+
+    def list(self):
+        return [self.rows[app_id] for app_id in sorted(self.rows, reverse=True)]
+
+    def delete(self, app_id):
+        return self.rows.pop(app_id, None) is not None
+
+
+class InMemoryRosterRepository(RosterRepository):
+    def __init__(self, users: InMemoryUserRepository):
+        self.users = users
+        self.entries = {}
+        self.updated = None
+
+    def replace(self, roster):
+        self.entries = {member['name'].lower(): RosterEntry(member['name'], member.get('rank') or '-',
+                                                            member.get('joined'))
+                        for member in roster}
+        self.updated = datetime.now()
+
+    def updated_at(self):
+        return self.updated if self.entries else None
+
+    def joined(self, name):
+        entry = self.entries.get(name.lower())
+        return entry.joined if entry else None
+
+    def _unlinked(self):
+        return [entry for entry in self.entries.values()
+                if entry.rank != 'Legacy Member' and not self.users.is_linked(entry.name)]
+
+    def count_unlinked(self):
+        return len(self._unlinked())
+
+    def find_unlinked(self, limit=-1, offset=0):
+        entries = sorted(self._unlinked(), key=lambda entry: entry.name.lower())
+        return entries[offset:] if limit < 0 else entries[offset:offset + limit]
+
+
+class InMemoryOutboxRepository(OutboxRepository):
+    def __init__(self, guild_id=None):
+        self.guild_id = guild_id
+        self.rows = {}
+        self.keys = set()
+        self.next_id = 1
+
+    def enqueue(self, effects):
+        queued = False
+        for effect in effects:
+            if effect.key in self.keys:
+                continue
+            self.rows[self.next_id] = OutboxRecord(self.next_id, effect.key, effect.kind, json.dumps(effect.payload),
+                                                   0, time.time(), datetime.now().isoformat(), None, 'pending')
+            self.keys.add(effect.key)
+            self.next_id += 1
+            queued = True
+        if queued:
+            notify_outbox(self.guild_id)
+
+    def due(self, now, limit=50):
+        entries = sorted((entry for entry in self.rows.values()
+                          if entry.status == 'pending' and entry.next_attempt_at <= now),
+                         key=lambda entry: (entry.next_attempt_at, entry.id))
+        return entries[:limit]
+
+    def delivered(self, entry_id):
+        self.rows.pop(entry_id, None)
+
+    def retry(self, entry_id, next_attempt_at, error):
+        entry = self.rows[entry_id]
+        self.rows[entry_id] = entry._replace(attempts=entry.attempts + 1, next_attempt_at=next_attempt_at,
+                                             last_error=error)
+
+    def fail(self, entry_id, error):
+        entry = self.rows[entry_id]
+        self.rows[entry_id] = entry._replace(attempts=entry.attempts + 1, status='failed', last_error=error)
+
+    def pending_count(self):
+        return sum(1 for entry in self.rows.values() if entry.status == 'pending')
+
+
+class InMemorySessionRepository(SessionRepository):
+    def __init__(self):
+        self.rows = {}
+
+    def get(self, flow, user_id, now):
+        session = self.rows.get((flow, user_id))
+        if session is None or session[1] <= now:
+            return None
+        return json.loads(session[0]), session[1]
+
+    def put(self, flow, user_id, data, expires_at):
+        self.rows[(flow, user_id)] = (json.dumps(data), expires_at)
+
+    def delete(self, flow, user_id):
+        self.rows.pop((flow, user_id), None)
+
+    def purge_expired(self, now):
+        expired = [key for key, (_, expires_at) in self.rows.items() if expires_at <= now]
+        for key in expired:
+            del self.rows[key]
+        return len(expired)
+
+
+class InMemoryAuditLogRepository(AuditLogRepository):
+    def __init__(self):
+        self.rows = []
+        self.next_id = 1
+
+    def add_many(self, entries):
+        for entry in entries:
+            self.rows.append(entry._replace(id=self.next_id))
+            self.next_id += 1
+
+    def _matches(self, actor_id, target_id, since, until):
+        return [entry for entry in self.rows
+                if (actor_id is None or entry.actor_id == actor_id)
+                and (target_id is None or entry.target_id == target_id)
+                and (since is None or entry.created_at >= since)
+                and (until is None or entry.created_at < until)]
+
+    def count(self, actor_id=None, target_id=None, since=None, until=None):
+        return len(self._matches(actor_id, target_id, since, until))
+
+    def query(self, actor_id=None, target_id=None, since=None, until=None, limit=10, offset=0):
+        entries = sorted(self._matches(actor_id, target_id, since, until),
+                         key=lambda entry: (entry.created_at, entry.id), reverse=True)
+        return entries[offset:] if limit < 0 else entries[offset:offset + limit]
+
+
+class InMemorySearchRepository(SearchRepository):
+    """Word matching without stemming; scores by the number of matching words."""
+
+    def __init__(self, users, warnings, applications):
+        self.users = users
+        self.warnings = warnings
+        self.applications = applications
+
+    def _documents(self, scopes):
+        if 'warnings' in scopes:
+            for warning in self.warnings.rows.values():
+                yield 'warning', warning.id, warning.discord_id, warning.reason, warning.date
+        if 'watchlist' in scopes:
+            for user in self.users.rows.values():
+                if user.on_watchlist:
+                    yield 'watchlist', None, user.discord_id, user.watchlist_reason, None
+        if 'applications' in scopes:
+            for application in self.applications.rows.values():
+                text = ' '.join(str(value) for value in application[3:] if value)
+                yield 'application', application.id, application.discord_id, text, application.timestamp
+
+    def _matches(self, query, scopes):
+        terms = []
+        for term in query.split():
+            words = re.findall(r'\w+', term.lower())
+            terms += [(word, term.endswith('*') and i == len(words) - 1) for i, word in enumerate(words)]
+        if not terms:
+            return []
+        results = []
+        for kind, item_id, discord_id, text, date in self._documents(scopes):
+            words = re.findall(r'\w+', text.lower())
+            hits = [sum(1 for word in words if (word.startswith(term) if prefix else word == term))
+                    for term, prefix in terms]
+            if all(hits):
+                results.append(SearchResult(kind, item_id, discord_id, text[:120], date, -float(sum(hits))))
+        results.sort(key=lambda result: result.score)
+        return results
+
+    def count(self, query, scopes=SEARCH_SCOPES):
+        return len(self._matches(query, scopes))
+
+    def search(self, query, scopes=SEARCH_SCOPES, limit=10, offset=0):
+        results = self._matches(query, scopes)
+        return results[offset:] if limit < 0 else results[offset:offset + limit]
+
+
+class InMemoryStorage(Storage):
+    """Repositories kept in process memory, for tests and benchmarks. Nothing is written to disk."""
+
+    def __init__(self, guild_id=None):
+        self.guild_id = guild_id
+        self.outbox = InMemoryOutboxRepository(guild_id)
+        self.sessions = InMemorySessionRepository()
+        self.audit = InMemoryAuditLogRepository()
+        self.users = InMemoryUserRepository(self.outbox, guild_id)
+        self.watchlist = InMemoryWatchlistRepository(self.users)
+        self.warnings = InMemoryWarningRepository(self.users)
+        self.bans = InMemoryBanRepository()
+        self.applications = InMemoryApplicationRepository()
+        self.roster = InMemoryRosterRepository(self.users)
+        self.search = InMemorySearchRepository(self.users, self.warnings, self.applications)
+
+
+STORAGE_BACKENDS = {
+    'sqlite': SqliteStorage,
+    'memory': InMemoryStorage,
+}
+
+_storages = {}
+_backend = STORAGE_BACKEND
+
+
+def set_storage_backend(name):
+    """Switch every server to another backend (dropping in-memory data)."""
+    global _backend
+    if name not in STORAGE_BACKENDS:
+        raise ValueError(f"Unknown storage backend: {name}")
+    _backend = name
+    _storages.clear()
+
+
+def get_storage(guild_id=None) -> Storage:
+    """The repositories of a server, on the configured backend."""
+    key = str(guild_id) if guild_id is not None else None
+    if key not in _storages:
+        _storages[key] = STORAGE_BACKENDS[_backend](guild_id)
+    return _storages[key]
+
+
+# -------------- Users projection ----------------
+def _project_user(guild_id, discord_id):
+    # The projection mirrors the SQLite table the nightly sync writes to
+    projection = get_user_projection(guild_id)
+    if projection is None or not isinstance(get_storage(guild_id), SqliteStorage):
+        return
+    user = get_storage(guild_id).users.get(discord_id)
+    if user is None:
+        projection.discard(discord_id)
+    else:
+        projection.put(user.discord_id, user.gw2_id, user.alt_gw2_id, user.guild_status, user.alt_guild_status,
+                       user.birthday)
+
+
+add_user_listener(_project_user)
+
+
+# -------------- Guild roster ----------------
+def refresh_guild_roster(guild_id=None):
+    """Fetch a server's guild roster (blocking) and store it. Returns (status, roster), roster is None on failure."""
+    response = get_guild_roster(guild_id)
+    if response.status_code != 200:
+        return response.status_code, None
+    roster = response.json()
+    get_storage(guild_id).roster.replace(roster)
+    return response.status_code, roster
+
+
+def ensure_guild_roster(guild_id=None, max_age_minutes=ROSTER_MAX_AGE_MINUTES):
+    """Refresh the stored roster if it is empty or older than `max_age_minutes`. Returns False if that failed."""
+    updated_at = get_storage(guild_id).roster.updated_at()
+    if updated_at and updated_at > datetime.now() - timedelta(minutes=max_age_minutes):
+        return True
+    status, roster = refresh_guild_roster(guild_id)
+    return roster is not None
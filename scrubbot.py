@@ -10,12 +10,70 @@ from discord import app_commands
 
 # Personal files
 from classes import ConfirmationCog, StaffCog
-from config import TOKEN
+from config import TOKEN, PRESENCE_INTENT, MEMBER_CACHE_FLAGS, CHUNK_GUILDS_AT_STARTUP, METRICS_HOST, METRICS_PORT, \
+    QUERY_PROFILING, QUERY_PROFILER_LARGE_TABLE_ROWS, LOOP_WATCHDOG_THRESHOLD_SECONDS, CHANNEL_ID_ASSETS, SHARD_COUNT, \
+    SHARD_IDS
+from metrics import InstrumentedCommandTree, start_metrics_server
+from guilds import get_guild_config
+from tracing import instrument_discord_http
+from profiler import enable_profiling
+from loop_watchdog import start_loop_watchdog
+from assets import ASSETS
+from outbox import OutboxWorker
+from audit import AUDIT_LOG
 from db import update_database, daily_update, init_db, start_daily_update, check_and_update_db, CURRENT_DB_VERSION, \
-    get_db_filename
+    get_db_filename, prepare_guild_db, DatabaseMigrationError
 
-intents = discord.Intents.all()
-bot = commands.Bot(command_prefix='/', intents=intents)
+
+if QUERY_PROFILING:
+    enable_profiling(QUERY_PROFILER_LARGE_TABLE_ROWS)
+
+
+def build_intents():
+    """Subscribe only to the gateway events the bot actually uses."""
+    intents = discord.Intents.none()
+    intents.guilds = True
+    intents.members = True  # Member list for the nightly database sync
+    intents.moderation = True  # Bans
+    intents.presences = PRESENCE_INTENT
+    return intents
+
+
+class GuildCommandTree(InstrumentedCommandTree):
+    """Command tree that refuses commands in servers without settings."""
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if get_guild_config(interaction.guild_id) is None:
+            if interaction.type is discord.InteractionType.application_command:
+                await interaction.response.send_message("This server is not configured for the bot.", ephemeral=True)
+            return False
+        return await super().interaction_check(interaction)
+
+
+def build_member_cache_flags(intents):
+    """Map the MEMBER_CACHE_FLAGS setting to discord.MemberCacheFlags."""
+    if MEMBER_CACHE_FLAGS == 'none':
+        return discord.MemberCacheFlags.none()
+    return discord.MemberCacheFlags.from_intents(intents)
+
+
+intents = build_intents()
+# Sharded so one instance can serve every server of the alliance. In cluster mode (cluster.py) each process
+# runs the shards listed in SHARD_IDS.
+bot = commands.AutoShardedBot(command_prefix='/', intents=intents,
+                              member_cache_flags=build_member_cache_flags(intents),
+                              chunk_guilds_at_startup=CHUNK_GUILDS_AT_STARTUP, tree_cls=GuildCommandTree,
+                              shard_count=SHARD_COUNT, shard_ids=SHARD_IDS)
+
+
+@bot.event
+async def setup_hook():
+    instrument_discord_http()
+    ASSETS.load()
+    if LOOP_WATCHDOG_THRESHOLD_SECONDS:
+        start_loop_watchdog(LOOP_WATCHDOG_THRESHOLD_SECONDS)
+    if METRICS_PORT:
+        bot.metrics_runner = await start_metrics_server(bot, METRICS_HOST, METRICS_PORT)
 
 
 @bot.event
@@ -28,22 +86,40 @@ async def on_ready():
         else:
             print("Cogs already loaded")
 
-        # Force a global sync
-        synced = await bot.tree.sync()
-        print(f"Synced {len(synced)} commands globally")
+        # Force a global sync (once per cluster: by the process running shard 0)
+        if SHARD_IDS is None or 0 in SHARD_IDS:
+            synced = await bot.tree.sync()
+            print(f"Synced {len(synced)} commands globally")
 
-        print("Commands in tree after sync:")
-        for command in bot.tree.get_commands():
-            print(f"- {command.name}")
+            print("Commands in tree after sync:")
+            for command in bot.tree.get_commands():
+                print(f"- {command.name}")
+
+        # Upload the embed thumbnails once so responses can link to them
+        if CHANNEL_ID_ASSETS:
+            try:
+                # The channel may be on a shard run by another process
+                assets_channel = bot.get_channel(CHANNEL_ID_ASSETS) or await bot.fetch_channel(CHANNEL_ID_ASSETS)
+                await ASSETS.upload(assets_channel)
+            except discord.DiscordException as e:
+                print(f"Assets channel {CHANNEL_ID_ASSETS} not available, thumbnails will be attached: {e}")
 
         # Check and update the database structure if necessary
         try:
-            check_and_update_db(bot)
+            await check_and_update_db(bot)
         except DatabaseMigrationError as e:
             print(f"Database migration failed: {e}")
             await bot.close()
             return
 
+        # Deliver the side effects queued by commands (including those left over from before a restart)
+        if not hasattr(bot, 'outbox'):
+            bot.outbox = OutboxWorker(bot)
+            bot.outbox.start()
+
+        # Write the moderation audit log in the background
+        AUDIT_LOG.start()
+
         await update_database(bot)  # Run update immediately when bot starts
         await asyncio.create_task(start_daily_update(bot))  # Start the daily update task with the correct delay
 
@@ -52,6 +128,15 @@ async def on_ready():
         await bot.close()
 
 
+@bot.event
+async def on_guild_join(guild):
+    print(f"Joined server {guild.name} ({guild.id})")
+    if get_guild_config(guild.id) is None:
+        print(f"Server {guild.name} ({guild.id}) is not configured, leaving it alone")
+        return
+    await prepare_guild_db(guild)
+
+
 @bot.event
 async def on_command_error(ctx, error):
     if isinstance(error, commands.CommandNotFound):
@@ -65,3 +150,6 @@ if __name__ == "__main__":
         bot.run(TOKEN)
     except Exception as e:
         print(f"Error running the bot: {e}")
+    finally:
+        # Write whatever the audit log still has buffered
+        AUDIT_LOG.flush()
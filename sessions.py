@@ -0,0 +1,85 @@
+# Standard library imports
+import time
+import sqlite3
+from collections import OrderedDict
+
+# Personal files
+from config import SESSION_MAX_ENTRIES, SESSION_PERSISTENCE
+from repositories import get_storage
+
+# Expired sessions are deleted from a server's database at most this often
+PURGE_INTERVAL_SECONDS = 600
+
+
+class SessionStore:
+    """Per-user state of a multi-step interaction flow, e.g. a draft filled in over several modals.
+
+    A session expires `ttl` seconds after it was last saved. At most `max_entries` sessions are kept in memory,
+    the least recently used ones are dropped first. With `persistent`, sessions are also saved to the server's
+    database, so a dropped session is loaded again on its next use and drafts survive a restart.
+    """
+
+    def __init__(self, flow, ttl, max_entries=SESSION_MAX_ENTRIES, persistent=SESSION_PERSISTENCE):
+        self.flow = flow
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.persistent = persistent
+        self._entries = OrderedDict()  # (guild ID, user ID) -> (expires_at, data), least recently used first
+        self._purged_at = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, guild_id, user_id):
+        """A copy of the user's session data, or None if they have no session or it expired."""
+        key, now = (str(guild_id), user_id), time.time()
+        entry = self._entries.get(key)
+        if entry is None and self.persistent:
+            stored = self._load(guild_id, user_id, now)
+            if stored:
+                data, expires_at = stored
+                entry = self._entries[key] = (expires_at, data)
+                self._evict(now)
+        if entry is None:
+            return None
+        if entry[0] <= now:
+            self.pop(guild_id, user_id)
+            return None
+        self._entries.move_to_end(key)
+        return dict(entry[1])
+
+    def put(self, guild_id, user_id, data):
+        """Save the user's session, restarting its TTL."""
+        key, now = (str(guild_id), user_id), time.time()
+        expires_at = now + self.ttl
+        self._entries[key] = (expires_at, dict(data))
+        self._entries.move_to_end(key)
+        self._evict(now)
+        if self.persistent:
+            sessions = get_storage(guild_id).sessions
+            sessions.put(self.flow, user_id, data, expires_at)
+            if now - self._purged_at.get(key[0], 0) > PURGE_INTERVAL_SECONDS:
+                self._purged_at[key[0]] = now
+                sessions.purge_expired(now)
+
+    def pop(self, guild_id, user_id):
+        """End the user's session, returning its data (None if there was none)."""
+        entry = self._entries.pop((str(guild_id), user_id), None)
+        if self.persistent:
+            get_storage(guild_id).sessions.delete(self.flow, user_id)
+        return entry[1] if entry else None
+
+    def _load(self, guild_id, user_id, now):
+        try:
+            return get_storage(guild_id).sessions.get(self.flow, user_id, now)
+        except sqlite3.Error as e:
+            print(f"Failed to load {self.flow} session of {user_id}: {e}")
+            return None
+
+    def _evict(self, now):
+        # Drop expired sessions from the least recently used end, then whatever is over the limit
+        while self._entries:
+            key, (expires_at, _) = next(iter(self._entries.items()))
+            if expires_at > now and len(self._entries) <= self.max_entries:
+                break
+            del self._entries[key]
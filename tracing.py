@@ -0,0 +1,98 @@
+# Standard library imports
+import time
+import functools
+import contextvars
+from contextlib import contextmanager
+
+# Third-party imports
+import discord
+from discord.webhook.async_ import AsyncWebhookAdapter
+
+_current_span = contextvars.ContextVar('current_span', default=None)
+
+
+class Span:
+    """A timed section of an interaction. Spans nest to form a tree per interaction."""
+    __slots__ = ('name', 'start', 'end', 'children')
+
+    def __init__(self, name):
+        self.name = name
+        self.start = time.perf_counter()
+        self.end = None
+        self.children = []
+
+    @property
+    def duration(self):
+        return (self.end or time.perf_counter()) - self.start
+
+    def finish(self):
+        if self.end is None:
+            self.end = time.perf_counter()
+
+    def render(self, depth=0):
+        lines = [f"{'  ' * depth}{self.name} {self.duration * 1000:.1f}ms"]
+        for child in self.children:
+            lines.extend(child.render(depth + 1))
+        return lines
+
+
+def start_trace(name):
+    """Start a new root span in the current context and return it."""
+    root = Span(name)
+    _current_span.set(root)
+    return root
+
+
+def finish_trace(root, threshold):
+    """Finish a root span and log the full span breakdown if it took longer than `threshold` seconds."""
+    root.finish()
+    if threshold is not None and root.duration >= threshold:
+        print(f"Slow interaction ({root.duration:.2f}s):\n" + "\n".join(root.render(1)))
+
+
+@contextmanager
+def span(name):
+    """Time a block as a child of the current span. Does nothing outside of a trace."""
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+
+    child = Span(name)
+    parent.children.append(child)
+    token = _current_span.set(child)
+    try:
+        yield child
+    finally:
+        child.finish()
+        _current_span.reset(token)
+
+
+def traced_interaction(name, threshold):
+    """Decorator for modal/view callbacks that run outside the command tree. Traces the whole callback."""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(self, interaction: discord.Interaction, *args, **kwargs):
+            root = start_trace(name)
+            try:
+                return await func(self, interaction, *args, **kwargs)
+            finally:
+                finish_trace(root, threshold)
+        return wrapper
+    return decorator
+
+
+def _traced_request(request):
+    @functools.wraps(request)
+    async def wrapper(self, route, *args, **kwargs):
+        with span(f"discord {route.method} {route.path}"):
+            return await request(self, route, *args, **kwargs)
+    wrapper.__traced__ = True
+    return wrapper
+
+
+def instrument_discord_http():
+    """Trace every Discord REST call, including interaction responses and followups sent through webhooks."""
+    for cls in (discord.http.HTTPClient, AsyncWebhookAdapter):
+        if not getattr(cls.request, '__traced__', False):
+            cls.request = _traced_request(cls.request)